@@ -1,12 +1,31 @@
+import time
+_started = time.perf_counter() # 啟動匯入時間報告的起點
+
 import dash
 import dash_bootstrap_components as dbc
 from dash import dcc, html, Input, Output
+import plotly.io as pio
+from flask_compress import Compress
 
-from pages import data_upload, distribution, relationship, bar_plot, heatmap # 匯入所有頁面模組
+_pages_started = time.perf_counter()
+from pages import data_upload, distribution, relationship, bar_plot, heatmap # 匯入所有頁面模組 (不載入繪圖函式庫)
+_pages_seconds = time.perf_counter() - _pages_started
+from utils.image_cache import register_image_route
+from utils.memory import register_session_cookie
+from utils.metrics import instrumented_callbacks, register_metrics_route
+from utils.render import render_farm
+from utils.startup import import_report
 
 # 使用 LUX Bootstrap 主題初始化 Dash 應用程式
 app = dash.Dash(__name__, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.LUX])
 server = app.server # 為了部署，公開 server 變數
+# 回調回應 (圖表 JSON) 以 orjson 編碼，並依瀏覽器支援以 brotli 或 gzip 壓縮；PNG 已壓縮不重複處理
+pio.json.config.default_engine = 'orjson'
+server.config.update(COMPRESS_ALGORITHM=['br', 'gzip'], COMPRESS_BR_LEVEL=4, COMPRESS_LEVEL=6)
+Compress(server)
+register_image_route(server) # 靜態圖表圖片 (磁碟快取) 的 URL 路由
+register_metrics_route(server) # 回調效能指標 (Prometheus 文字格式)；須在 Compress 之後註冊以量測未壓縮的回應大小
+register_session_cookie(server) # 以 cookie 區分工作階段，供快取記憶體預算依工作階段計算
 
 # 使用 dbc.NavbarSimple 建立更現代化的導覽列
 navbar = dbc.NavbarSimple(
@@ -52,14 +71,17 @@ app.layout = serve_layout # 指派佈局函式
 # 如果它定義了需要 app 實例的回調函式。
 # 如果頁面只有佈局而沒有需要 'app' 的回調函式，則不需要此步驟。
 
+_callbacks_started = time.perf_counter()
 for page_module in [data_upload, distribution, relationship, bar_plot, heatmap]: # 註冊所有匯入的模組
     try:
-        page_module.register_callbacks(app)
+        with instrumented_callbacks(app, page_module.__name__.rsplit('.', 1)[-1]): # 每個回調記錄耗時與酬載大小
+            page_module.register_callbacks(app)
         print(f"Successfully registered callbacks from {page_module.__name__}.")
     except AttributeError:
         print(f"Warning: 'register_callbacks' function not found in {page_module.__name__}.")
     except Exception as e:
         print(f"Error registering callbacks for {page_module.__name__}: {e}")
+_callbacks_seconds = time.perf_counter() - _callbacks_started
 
 
 # 根據 URL 渲染頁面內容的回調函式
@@ -81,6 +103,10 @@ def display_page(pathname):
         return html.Div("404 Page not found")
 
 
+print(import_report(_started, {'頁面模組': _pages_seconds, '註冊回調': _callbacks_seconds}))
+
+
 if __name__ == '__main__':
     # 注意：在生產環境中 debug=True 應設為 False
+    render_farm.start(wait=False) # 在伺服器執行緒啟動前建立繪圖行程，暖機在背景進行，不延後接受請求
     app.run(debug=True)
@@ -0,0 +1,38 @@
+// --- 瀏覽器端回調 ---
+// 切換檢視模式只需要改變 CSS display，直接在瀏覽器執行，不需要往返伺服器。
+// 由各頁面的 register_callbacks 以 ClientsideFunction('views', ...) 註冊。
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    views: {
+        // 動態圖表 / 靜態圖片 (以及只屬於動態圖表的控制項) 的顯示狀態
+        toggleView: function(viewMode) {
+            const dynamic = viewMode === 'dynamic';
+            return [
+                {'display': dynamic ? 'block' : 'none'},
+                dynamic ? {'display': 'none'} : {'display': 'block', 'maxWidth': '100%'}
+            ];
+        },
+        toggleViewWithControls: function(viewMode) {
+            const styles = window.dash_clientside.views.toggleView(viewMode);
+            styles.push({'display': viewMode === 'dynamic' ? 'block' : 'none'});
+            return styles;
+        },
+        // 程式碼片段區塊：預設顯示動態圖表的程式碼
+        toggleCodeSections: function(viewMode) {
+            const staticView = viewMode === 'static';
+            return [
+                {'display': staticView ? 'none' : 'block'},
+                {'display': staticView ? 'block' : 'none'}
+            ];
+        },
+        // 熱力圖：數值模式顯示數值變數選單，類別模式顯示兩個類別選單
+        toggleHeatmapMode: function(mode) {
+            const numeric = mode === 'numeric';
+            return [
+                {'display': numeric ? 'block' : 'none'},
+                {'display': numeric ? 'none' : 'block'},
+                {'display': numeric ? 'none' : 'block'}
+            ];
+        }
+    }
+});
@@ -0,0 +1,22 @@
+// --- 回調請求的分頁識別 ---
+// 為每個 /_dash-update-component 請求加上 X-Dash-Tab 標頭：'<分頁 id>.<遞增序號>'。
+// 伺服器以它判斷同一分頁對同一回調的較新請求，取消仍在計算的過時請求 (utils/cancellation.py)。
+
+(function() {
+    const bytes = new Uint8Array(16);
+    window.crypto.getRandomValues(bytes); // crypto.randomUUID 只在 HTTPS 下可用
+    const tabId = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    let sequence = 0;
+    const originalFetch = window.fetch.bind(window);
+
+    window.fetch = function(resource, init) {
+        const url = typeof resource === 'string' ? resource : (resource && resource.url) || '';
+        if (url.indexOf('_dash-update-component') === -1) {
+            return originalFetch(resource, init);
+        }
+        sequence += 1;
+        const headers = new Headers((init && init.headers) || (resource instanceof Request ? resource.headers : undefined));
+        headers.set('X-Dash-Tab', tabId + '.' + sequence);
+        return originalFetch(resource, Object.assign({}, init, {headers: headers}));
+    };
+})();
@@ -0,0 +1,137 @@
+import http.client
+import json
+import urllib.parse
+
+# --- 以 Dash 請求呼叫回調 (基準測試與負載測試共用) ---
+# 依回調函式名稱組出與 dash-renderer 相同的 /_dash-update-component 請求。回調對照表取自本機匯入的 app
+# (輸出鍵由回調定義決定，與遠端伺服器相同)；請求可送往行程內的 Flask 測試客戶端，或經 HTTP 送往執行中的伺服器。
+
+UPDATE_PATH = '/_dash-update-component'
+
+
+def layout_values(layout):
+    """Default property values of every component with a string id in a layout: {'id.property': value}."""
+    from dash.development.base_component import Component
+    values = {}
+
+    def walk(component):
+        if isinstance(component, Component):
+            component_id = getattr(component, 'id', None)
+            if isinstance(component_id, str):
+                for prop in component._prop_names:
+                    values[f"{component_id}.{prop}"] = getattr(component, prop, None)
+            children = getattr(component, 'children', None)
+            for child in children if isinstance(children, (list, tuple)) else [children]:
+                walk(child)
+    walk(layout)
+    return values
+
+
+class TestClientTransport:
+    """Sends requests to app.server in-process (one Flask test client per instance)."""
+
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def post(self, path, body):
+        response = self.client.post(path, data=body, content_type='application/json')
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    """Sends requests to a running server over one keep-alive HTTP connection."""
+
+    def __init__(self, base_url, timeout=300):
+        url = urllib.parse.urlsplit(base_url)
+        self.host, self.port, self.prefix = url.hostname, url.port or 80, url.path.rstrip('/')
+        self.timeout = timeout
+        self.connection = None
+
+    def post(self, path, body):
+        for attempt in range(2): # 伺服器關閉閒置連線時重新連線一次
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request('POST', self.prefix + path, body=body, headers={'Content-Type': 'application/json'})
+                response = self.connection.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class CallbackClient:
+    """Calls registered Dash callbacks by function name; returns (status, response body bytes)."""
+
+    def __init__(self, app, transport):
+        self.transport = transport
+        self.callbacks = {spec['callback'].__name__: (key, spec) for key, spec in app.callback_map.items()
+                          if spec.get('callback') is not None}
+
+    def call(self, name, values, changed):
+        """POSTs one callback request; values maps 'id.property' to input/state values."""
+        key, spec = self.callbacks[name]
+        outputs = spec['output'] if isinstance(spec['output'], list) else [spec['output']]
+        outputs = [{'id': output.component_id, 'property': output.component_property} for output in outputs]
+
+        def argument(dependency):
+            return {'id': dependency['id'], 'property': dependency['property'],
+                    'value': values.get(f"{dependency['id']}.{dependency['property']}")}
+
+        def arguments(dependencies):
+            # 萬用字元 (ALL) 依賴的值直接以 [{'id', 'property', 'value'}, ...] 提供
+            return [values.get(f"{dep['id']}.{dep['property']}", []) if dep['id'].startswith('{') else argument(dep)
+                    for dep in dependencies]
+
+        payload = {'output': key, 'outputs': outputs if key.startswith('..') else outputs[0],
+                   'inputs': arguments(spec['inputs']), 'state': arguments(spec.get('state', [])),
+                   'changedPropIds': changed}
+        # 自行序列化：Flask 的 json= 會排序字典鍵，而 apply_filters 以 json.dumps(元件 id) 比對控制項，需保留原順序
+        status, body = self.transport.post(UPDATE_PATH, json.dumps(payload))
+        if status not in (200, 204):
+            raise RuntimeError(f"{name} 回應 HTTP {status}: {body[:200].decode('utf-8', 'replace')}")
+        return status, body
+
+
+def response_values(body):
+    """{'id.property': value} of a callback response body (empty for 204 / no update)."""
+    if not body:
+        return {}
+    response = json.loads(body).get('response', {})
+    return {f"{component_id}.{prop}": value for component_id, props in response.items() for prop, value in props.items()}
+
+
+def filter_request(df, dates=True):
+    """Filter-modal values keeping half of the product categories, the middle 50% of Unit_Price and, with dates,
+    the middle of the Order_Date range (a string column, i.e. before date conversion)."""
+    categories = sorted(df['Product_Category'].dropna().unique())
+    price = df['Unit_Price'].dropna()
+    controls = [
+        ({'type': 'filter-control', 'index': 'Product_Category', 'control': 'checklist'}, 'value',
+         categories[:max(len(categories) // 2, 1)]),
+        ({'type': 'filter-control', 'index': 'Unit_Price', 'control': 'range-slider'}, 'value',
+         [round(float(price.quantile(0.25)), 2), round(float(price.quantile(0.75)), 2)]),
+    ]
+    if dates:
+        days = sorted(df['Order_Date'].dropna().unique())
+        date_id = {'type': 'filter-control', 'index': 'Order_Date', 'control': 'date-range'}
+        controls += [(date_id, 'start_date', days[len(days) // 4]), (date_id, 'end_date', days[len(days) * 3 // 4])]
+
+    def wildcard(control, prop):
+        return json.dumps({'control': control, 'index': ['ALL'], 'type': 'filter-control'}, separators=(',', ':')) + '.' + prop
+
+    ids = {json.dumps(cid, sort_keys=True): cid for cid, _, _ in controls} # 日期控制項有起訖兩個屬性，id 只列一次
+    values = {
+        wildcard(['ALL'], 'id'): [{'id': cid, 'property': 'id', 'value': cid} for cid in ids.values()],
+        'filter-column-dropdown.value': list(dict.fromkeys(cid['index'] for cid in ids.values())),
+        'apply-filter-button.n_clicks': 1,
+    }
+    for cid, prop, value in controls:
+        values.setdefault(wildcard(cid['control'], prop), []).append({'id': cid, 'property': prop, 'value': value})
+    return values
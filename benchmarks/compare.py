@@ -0,0 +1,72 @@
+import argparse
+import json
+import sys
+
+# --- 基準結果比較 (python -m benchmarks.compare <基準.json> <本次.json>) ---
+# 比較每個項目的冷 / 熱中位數：超過基準 threshold 倍且差距大於 min_delta_ms 視為退步，反之為改善。
+# 差距門檻避免幾毫秒的項目因量測雜訊被判為退步。有退步時以狀態碼 1 結束，可直接用於 CI。
+
+METRICS = ('median_ms', 'warm_median_ms')
+
+
+def compare_results(baseline, current, threshold=1.25, min_delta_ms=5.0):
+    """Rows of {'benchmark', 'metric', 'baseline', 'current', 'ratio', 'status'} for every benchmark in either run."""
+    rows = []
+    base_results, current_results = baseline.get('results', {}), current.get('results', {})
+    for key in sorted(set(base_results) | set(current_results)):
+        base, now = base_results.get(key), current_results.get(key)
+        if base is None or now is None:
+            rows.append({'benchmark': key, 'metric': '', 'baseline': None, 'current': None, 'ratio': None,
+                         'status': 'new' if base is None else 'missing'})
+            continue
+        if 'error' in now or 'error' in base:
+            rows.append({'benchmark': key, 'metric': '', 'baseline': None, 'current': None, 'ratio': None,
+                         'status': 'error' if 'error' in now else 'fixed'})
+            continue
+        for metric in METRICS:
+            if metric not in base or metric not in now:
+                continue
+            before, after = base[metric], now[metric]
+            ratio = after / before if before else None
+            if ratio is not None and ratio > threshold and after - before > min_delta_ms:
+                status = 'regression'
+            elif ratio is not None and ratio < 1 / threshold and before - after > min_delta_ms:
+                status = 'improved'
+            else:
+                status = 'ok'
+            rows.append({'benchmark': key, 'metric': metric, 'baseline': before, 'current': after,
+                         'ratio': ratio, 'status': status})
+    return rows
+
+
+def print_comparison(rows):
+    width = max([len(row['benchmark']) for row in rows] + [9])
+    print(f"{'benchmark':<{width}}  {'metric':<14} {'baseline':>11} {'current':>11} {'ratio':>7}  status")
+    for row in rows:
+        def ms(value):
+            return f"{value:.1f}" if value is not None else '-'
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+        print(f"{row['benchmark']:<{width}}  {row['metric']:<14} {ms(row['baseline']):>11} {ms(row['current']):>11} "
+              f"{ratio:>7}  {row['status']}")
+    regressions = sum(row['status'] == 'regression' for row in rows)
+    print(f"{regressions} 項退步" if regressions else "沒有效能退步")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比較兩次效能基準測試結果")
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=1.25, help="中位數超過基準的倍數視為退步 (預設 1.25)")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help="差距小於此毫秒數時不判定退步 (預設 5)")
+    args = parser.parse_args(argv)
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, encoding='utf-8') as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, threshold=args.threshold, min_delta_ms=args.min_delta_ms)
+    print_comparison(rows)
+    return 1 if any(row['status'] == 'regression' for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# --- 合成基準測試資料集 ---
+# 以 test_dataset/ecommerce_sales_data.csv 為樣本，產生任意列數、欄位與缺失比例相同的資料：
+# 類別欄位依樣本中的出現頻率抽樣，數值欄位自樣本值重抽並加上少量擾動 (大資料集時唯一值數量跟著增加)，
+# 訂單編號逐列遞增、客戶編號的母體隨列數放大，出貨日 = 訂單日 + 1~10 天，總金額由單價、數量、折扣與運費算出。
+# 寬版本 (wide) 另外加上多個數值指標與不同基數的類別欄位，用來量測欄位數量對各路徑的影響。
+
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           'test_dataset', 'ecommerce_sales_data.csv')
+SIZES = {'5k': 5_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+WIDE_NUMERIC_COLUMNS = 40
+WIDE_CATEGORICAL_LEVELS = (3, 8, 20, 50, 200, 1000) # 寬版本類別欄位的基數
+JITTERED_COLUMNS = ('Unit_Price', 'Shipping_Cost') # 連續值欄位：重抽後加上擾動
+
+
+def _load_sample():
+    return pd.read_csv(SAMPLE_PATH, keep_default_na=False, na_values=[''], encoding='utf-8-sig')
+
+
+def _with_missing(rng, values, rate):
+    # 依樣本的缺失比例把部分值設為缺失 (文字欄位為 None，數值欄位為 NaN)
+    mask = rng.random(len(values)) < rate
+    if values.dtype.kind == 'f':
+        values[mask] = np.nan
+    else:
+        values = values.astype(object)
+        values[mask] = None
+    return values
+
+
+def _resample(rng, sample, n):
+    values = sample.dropna().to_numpy()
+    counts = sample.value_counts(normalize=True) # 依樣本頻率抽樣 (類別欄位)
+    if len(counts) <= 100:
+        return rng.choice(counts.index.to_numpy(), size=n, p=counts.to_numpy())
+    return rng.choice(values, size=n)
+
+
+def _date_strings(days, origin):
+    return (np.datetime64(origin, 'D') + days.astype('timedelta64[D]')).astype(str).astype(object)
+
+
+def synthesize_dataset(rows, wide=False, seed=0):
+    """DataFrame with the ecommerce sample's columns, dtypes and missing rates, scaled to rows rows."""
+    rng = np.random.default_rng(seed)
+    sample = _load_sample()
+    missing = sample.isna().mean()
+    columns = {}
+
+    columns['Order_ID'] = np.char.add('ORD', np.char.zfill(np.arange(1, rows + 1).astype(str), 4)).astype(object)
+    columns['Customer_ID'] = np.char.add('CUST', rng.integers(1000, 1000 + max(rows * 2, 9000), rows).astype(str)).astype(object)
+
+    dates = pd.to_datetime(sample['Order_Date'].dropna())
+    origin, span = dates.min(), (dates.max() - dates.min()).days
+    order_days = rng.integers(0, span + 1, rows)
+    columns['Order_Date'] = _date_strings(order_days, origin)
+
+    columns['Ship_Date'] = _date_strings(order_days + rng.integers(1, 11, rows), origin)
+    for col in sample.columns:
+        if col not in columns and col != 'Total_Amount': # 其餘欄位依樣本重抽
+            values = _resample(rng, sample[col], rows)
+            columns[col] = values.astype(float) if sample[col].dtype.kind == 'f' else values
+
+    for col in JITTERED_COLUMNS:
+        jitter = rng.normal(0, sample[col].std() * 0.02, rows)
+        columns[col] = np.round(np.clip(columns[col] + jitter, sample[col].min(), sample[col].max()), 2)
+    columns['Total_Amount'] = np.round(columns['Unit_Price'] * columns['Quantity'] * (1 - columns['Discount'])
+                                       + columns['Shipping_Cost'], 2)
+
+    for col in sample.columns:
+        if col != 'Order_ID':
+            columns[col] = _with_missing(rng, columns[col], missing[col])
+    df = pd.DataFrame({col: columns[col] for col in sample.columns})
+
+    if wide:
+        base = np.nan_to_num(df['Total_Amount'].to_numpy(), nan=float(sample['Total_Amount'].mean()))
+        base = (base - base.mean()) / (base.std() or 1)
+        for i in range(WIDE_NUMERIC_COLUMNS):
+            weight = i / WIDE_NUMERIC_COLUMNS # 與總金額的相關程度由 0 漸增，讓相關矩陣有結構
+            df[f'Metric_{i + 1:02d}'] = np.round(weight * base + (1 - weight) * rng.standard_normal(rows), 4)
+        for levels in WIDE_CATEGORICAL_LEVELS:
+            labels = np.char.add(f'S{levels}_', np.arange(levels).astype(str)).astype(object)
+            df[f'Segment_{levels}'] = labels[rng.zipf(1.5, rows) % levels] # 長尾分布
+    return df
+
+
+def dataset_names(sizes, wide):
+    """Benchmark dataset names for size labels ('5k', '100k', ...), e.g. '100k' and '100k-wide'."""
+    names = []
+    for size in sizes:
+        if size not in SIZES:
+            raise ValueError(f"未知的資料集大小 {size!r}，可用：{', '.join(SIZES)}")
+        names.append(size)
+        if wide:
+            names.append(f'{size}-wide')
+    return names
+
+
+def build_dataset(name, seed=0):
+    size, _, variant = name.partition('-')
+    return synthesize_dataset(SIZES[size], wide=variant == 'wide', seed=seed)
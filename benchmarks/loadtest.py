@@ -0,0 +1,313 @@
+import argparse
+import base64
+import collections
+import contextlib
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.client import (CallbackClient, HTTPTransport, TestClientTransport, filter_request, layout_values,
+                               response_values)
+from benchmarks.datasets import SIZES, build_dataset
+from benchmarks.run import isolate_caches
+
+# --- 多使用者負載測試 (python -m benchmarks.loadtest) ---
+# 模擬 N 位分析人員同時使用：每位使用者依序上傳資料、轉換日期欄位、套用篩選，再逐一開啟各圖表頁
+# (先看動態圖表，再切換到靜態圖表)，每一步都送出瀏覽器會觸發的回調請求。預設在本行程內以 Flask 測試客戶端
+# 驅動 app.server (每位使用者一個執行緒，相當於單一工作行程)；--url 改為對執行中的伺服器 (例如 gunicorn 容器) 施壓。
+# 報告每個回調的 p50 / p95 / p99 延遲、吞吐量與記憶體 (RSS，含子行程) 成長。
+
+PAGE_CALLBACKS = [ # (頁面模組, 回調, 檢視模式選項)
+    ('distribution', 'update_distribution_page', 'dist-view-mode-radio.value'),
+    ('relationship', 'update_relationship_page', 'rel-plot-type-radio.value'),
+    ('bar_plot', 'update_bar_page', 'bar-plot-type-radio.value'),
+    ('heatmap', 'update_heatmap_page', 'heatmap-plot-type-radio.value'),
+]
+FILTER_COLUMNS = ['Product_Category', 'Unit_Price'] # 日期欄位轉換後以數值儲存，篩選使用類別與數值欄位
+DATE_COLUMN, DATE_FORMAT = 'Order_Date', '%Y-%m-%d'
+
+
+# --- 統計 ---
+def percentile(sorted_values, q):
+    """Nearest-rank percentile (q in 0..100) of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(q / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class LatencyLog:
+    """Thread-safe per-callback latency samples."""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.response_bytes = collections.Counter()
+        self.sessions = collections.Counter() # 'completed' / 'failed'
+        self._lock = threading.Lock()
+
+    def record(self, callback, seconds, size=0, error=False):
+        with self._lock:
+            self.samples[callback].append(seconds)
+            self.errors[callback] += error
+            self.response_bytes[callback] += size
+
+    def session_finished(self, ok):
+        with self._lock:
+            self.sessions['completed' if ok else 'failed'] += 1
+
+    def summary(self):
+        with self._lock:
+            rows = {}
+            for callback, samples in sorted(self.samples.items()):
+                ordered = sorted(samples)
+                rows[callback] = {'calls': len(ordered), 'errors': self.errors[callback],
+                                  **{f'p{q}_ms': round(percentile(ordered, q) * 1000, 1) for q in (50, 95, 99)},
+                                  'max_ms': round(ordered[-1] * 1000, 1),
+                                  'mean_response_bytes': self.response_bytes[callback] // len(ordered)}
+            return rows
+
+
+# --- 記憶體 ---
+def _children(pid):
+    # 掃描 /proc 找出直接子行程 (不依賴 /proc/<pid>/task/<tid>/children 是否啟用)
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            if int(stat.rsplit(')', 1)[1].split()[1]) == pid:
+                children.append(int(entry))
+    return children
+
+
+def process_tree_rss(pid):
+    """Resident memory (bytes) of pid and all its descendants, or None where /proc is unavailable."""
+    total, pending, page = 0, [pid], os.sysconf('SC_PAGE_SIZE')
+    try:
+        while pending:
+            current = pending.pop()
+            try:
+                with open(f'/proc/{current}/statm') as f:
+                    total += int(f.read().split()[1]) * page
+            except OSError: # 行程已結束
+                continue
+            pending.extend(_children(current))
+    except (OSError, ValueError):
+        return None
+    return total
+
+
+class MemoryMonitor:
+    """Samples the RSS of a process tree in the background; reports start, peak and end."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid, self.interval = pid, interval
+        self.start_bytes = self.peak_bytes = self.end_bytes = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='memory-monitor', daemon=True)
+
+    def _sample(self):
+        rss = process_tree_rss(self.pid)
+        if rss is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, rss)
+        return rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self.start_bytes = self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_bytes = self._sample()
+
+    def summary(self):
+        def mb(value):
+            return round(value / 1024 / 1024, 1) if value is not None else None
+        growth = self.end_bytes - self.start_bytes if None not in (self.start_bytes, self.end_bytes) else None
+        return {'start_mb': mb(self.start_bytes), 'peak_mb': mb(self.peak_bytes), 'end_mb': mb(self.end_bytes),
+                'growth_mb': mb(growth)}
+
+
+# --- 模擬工作階段 ---
+class AnalystSession:
+    """One scripted analyst: upload, convert dates, filter, then every chart page (dynamic, then static)."""
+
+    def __init__(self, client, defaults, upload, filters, log, think=0.0):
+        self.client, self.defaults, self.upload, self.filters = client, defaults, upload, filters
+        self.log, self.think = log, think
+        self.state = {}
+
+    def call(self, callback, changed, values=None):
+        values = {**self.defaults, **self.state, **(values or {})}
+        started = time.perf_counter()
+        try:
+            status, body = self.client.call(callback, values, changed)
+        except Exception:
+            self.log.record(callback, time.perf_counter() - started, error=True)
+            raise
+        self.log.record(callback, time.perf_counter() - started, len(body))
+        self.state.update(response_values(body))
+
+    def pause(self):
+        if self.think:
+            time.sleep(self.think)
+
+    def stored_data_changed(self):
+        # stored-data / filtered-data-store 更新後瀏覽器接著觸發的回調
+        self.call('update_tables_on_data_or_pagesize', ['filtered-data-store.data'])
+        self.call('update_modal_dropdown', ['stored-data.data'])
+        self.call('update_filter_controls', ['stored-data.data'])
+
+    def run(self):
+        contents, filename = self.upload
+        self.call('handle_upload', ['upload-data.contents'], {'upload-data.contents': contents, 'upload-data.filename': filename})
+        self.stored_data_changed()
+        self.pause()
+
+        self.call('handle_modal_date_conversion', ['modal-convert-date-button.n_clicks'],
+                  {'modal-convert-date-button.n_clicks': 1, 'modal-date-column-dropdown.value': DATE_COLUMN,
+                   'modal-date-format-input.value': DATE_FORMAT})
+        self.stored_data_changed()
+        self.pause()
+
+        self.call('update_filter_controls', ['filter-column-dropdown.value'], {'filter-column-dropdown.value': FILTER_COLUMNS})
+        self.call('apply_filters', ['apply-filter-button.n_clicks'], self.filters)
+        self.call('update_tables_on_data_or_pagesize', ['filtered-data-store.data'])
+        self.pause()
+
+        for _, callback, view_mode in PAGE_CALLBACKS:
+            self.call(callback, []) # 開啟頁面：初次呼叫，所有輸出都計算
+            self.pause()
+            self.call(callback, [view_mode], {view_mode: 'static'})
+            self.pause()
+
+
+def _upload_contents(df, filename):
+    return 'data:text/csv;base64,' + base64.b64encode(df.to_csv(index=False).encode('utf-8')).decode('ascii'), filename
+
+
+def _user_loop(index, args, make_client, defaults, uploads, filters, log, deadline):
+    time.sleep(args.ramp_up * index / max(args.users, 1)) # 逐步加入使用者
+    client = make_client()
+    upload, filter_values = uploads[index % len(uploads)], filters[index % len(filters)]
+    completed = 0
+    while completed < args.sessions or (deadline and time.monotonic() < deadline):
+        try:
+            AnalystSession(client, defaults, upload, filter_values, log, think=args.think).run()
+            log.session_finished(True)
+        except Exception as e:
+            log.session_finished(False)
+            print(f"使用者 {index}：工作階段失敗: {e}", file=sys.stderr)
+        completed += 1
+    if hasattr(client.transport, 'close'):
+        client.transport.close()
+
+
+def print_report(report):
+    print(f"{report['users']} 位同時使用者，{report['sessions_completed']} 個工作階段完成 "
+          f"({report['sessions_failed']} 個失敗)，耗時 {report['elapsed_seconds']:.1f} 秒")
+    print(f"吞吐量：{report['requests_per_second']:.2f} 請求/秒，{report['sessions_per_minute']:.2f} 工作階段/分鐘")
+    memory = report['memory']
+    if memory['start_mb'] is not None:
+        print(f"記憶體 (RSS，含子行程)：開始 {memory['start_mb']} MB，峰值 {memory['peak_mb']} MB，"
+              f"結束 {memory['end_mb']} MB，成長 {memory['growth_mb']} MB")
+    width = max([len(name) for name in report['callbacks']] + [8])
+    print(f"{'callback':<{width}} {'calls':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, row in report['callbacks'].items():
+        print(f"{name:<{width}} {row['calls']:>6} {row['errors']:>6} {row['p50_ms']:>9} {row['p95_ms']:>9} "
+              f"{row['p99_ms']:>9} {row['max_ms']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="資料視覺化工具的多使用者負載測試")
+    parser.add_argument('--users', type=int, default=4, help="同時使用者數")
+    parser.add_argument('--sessions', type=int, default=1, help="每位使用者至少執行的工作階段數")
+    parser.add_argument('--duration', type=float, default=0, help="持續執行的秒數 (0 表示只跑 --sessions 次)")
+    parser.add_argument('--size', default='5k', choices=list(SIZES), help="每位使用者上傳的資料集大小")
+    parser.add_argument('--shared-dataset', action='store_true', help="所有使用者上傳同一份資料 (預設每人一份不同資料)")
+    parser.add_argument('--think', type=float, default=0.0, help="每一步之間的思考時間 (秒)")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="在幾秒內逐步加入所有使用者")
+    parser.add_argument('--url', help="對執行中的伺服器施壓 (例如 http://localhost:8050)；預設在本行程內驅動 app.server")
+    parser.add_argument('--pid', type=int, help="--url 模式下量測記憶體的伺服器行程 (例如 gunicorn 主行程，含所有子行程)")
+    parser.add_argument('--output', help="另將報告寫成 JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix='dataviz-load-') as cache_dir:
+        if not args.url:
+            isolate_caches(cache_dir)
+        with contextlib.redirect_stdout(sys.stderr): # 匯入 app 的啟動訊息與回調的除錯輸出
+            import app as app_module
+            if not args.url:
+                from utils.render import render_farm
+                render_farm.start(wait=True)
+
+            defaults = {}
+            for module in [app_module.data_upload] + [getattr(app_module, page) for page, _, _ in PAGE_CALLBACKS]:
+                defaults.update(layout_values(module.layout))
+
+            datasets = 1 if args.shared_dataset else args.users
+            print(f"產生 {datasets} 份 {args.size} 資料集...")
+            frames = [build_dataset(args.size, seed=seed) for seed in range(datasets)]
+            uploads = [_upload_contents(df, f'analyst-{seed}.csv') for seed, df in enumerate(frames)]
+            filters = [filter_request(df, dates=False) for df in frames]
+            del frames
+
+            if args.url:
+                make_client = lambda: CallbackClient(app_module.app, HTTPTransport(args.url))
+                memory_pid = args.pid
+            else:
+                make_client = lambda: CallbackClient(app_module.app, TestClientTransport(app_module.server))
+                memory_pid = os.getpid() # 含繪圖子行程；也包含負載產生器本身保存的上傳資料
+
+            log = LatencyLog()
+            monitor = MemoryMonitor(memory_pid) if memory_pid else contextlib.nullcontext()
+            started = time.monotonic()
+            deadline = started + args.duration if args.duration else None
+            try:
+                with monitor:
+                    threads = [threading.Thread(target=_user_loop, name=f'analyst-{i}', daemon=True,
+                                                args=(i, args, make_client, defaults, uploads, filters, log, deadline))
+                               for i in range(args.users)]
+                    for thread in threads:
+                        thread.start()
+                    for thread in threads:
+                        thread.join()
+            finally:
+                if not args.url:
+                    render_farm.shutdown()
+            elapsed = time.monotonic() - started
+
+    callbacks, outcomes = log.summary(), log.sessions
+    requests = sum(row['calls'] for row in callbacks.values())
+    report = {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'target': args.url or 'in-process',
+              'users': args.users, 'size': args.size, 'think_seconds': args.think,
+              'sessions_completed': outcomes['completed'], 'sessions_failed': outcomes['failed'],
+              'elapsed_seconds': round(elapsed, 3), 'requests': requests,
+              'requests_per_second': round(requests / elapsed, 3) if elapsed else 0.0,
+              'sessions_per_minute': round(outcomes['completed'] * 60 / elapsed, 3) if elapsed else 0.0,
+              'memory': monitor.summary() if memory_pid else {'start_mb': None, 'peak_mb': None, 'end_mb': None,
+                                                              'growth_mb': None},
+              'callbacks': callbacks}
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if outcomes['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
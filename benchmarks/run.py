@@ -0,0 +1,206 @@
+import argparse
+import base64
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.client import CallbackClient, TestClientTransport, filter_request, layout_values
+from benchmarks.compare import compare_results, print_comparison
+from benchmarks.datasets import SIZES, build_dataset, dataset_names
+
+# --- 效能基準測試 (python -m benchmarks.run) ---
+# 以合成的電商資料集 (5k / 100k / 1m / 10m 列，另有寬版本) 在無瀏覽器的情況下量測各熱點路徑：
+# 檔案解析、資料類別總覽、JSON 儲存往返、套用篩選，以及各頁面動態 / 靜態圖表回調。
+# 回調透過 Flask 測試客戶端走 /_dash-update-component，與瀏覽器請求的路徑相同 (含解碼與回應序列化)。
+# 「冷」量測在每次執行前清空所有快取 (新資料版本的第一次請求)，「熱」量測保留快取 (重複檢視)。
+# 結果寫成 JSON，可用 --baseline 或 python -m benchmarks.compare 與先前的結果比較，找出效能退步。
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+FORMAT_VERSION = 1
+
+# 各頁面回調：(基準名稱, 回調函式名稱, 覆寫的輸入值)。資料變動觸發時選單重設為預設欄位，與使用者剛套用篩選後相同。
+PAGE_BENCHMARKS = [
+    ('distribution.plotly', 'update_distribution_page', {'dist-view-mode-radio.value': 'dynamic'}),
+    ('distribution.static', 'update_distribution_page', {'dist-view-mode-radio.value': 'static'}),
+    ('relationship.plotly', 'update_relationship_page', {'rel-plot-type-radio.value': 'dynamic'}),
+    ('relationship.static', 'update_relationship_page', {'rel-plot-type-radio.value': 'static'}),
+    ('bar.plotly', 'update_bar_page', {'bar-plot-type-radio.value': 'dynamic'}),
+    ('bar.static', 'update_bar_page', {'bar-plot-type-radio.value': 'static'}),
+    ('heatmap.plotly', 'update_heatmap_page', {'heatmap-plot-type-radio.value': 'dynamic'}),
+    ('heatmap.static', 'update_heatmap_page', {'heatmap-plot-type-radio.value': 'static'}),
+    ('heatmap.crosstab.plotly', 'update_heatmap_page', {'heatmap-plot-type-radio.value': 'dynamic',
+                                                        'heatmap-mode-radio.value': 'categorical',
+                                                        'heatmap-cat1-dropdown.value': 'Product_Category',
+                                                        'heatmap-cat2-dropdown.value': 'Region'}),
+]
+# 資料變動會把選單重設為預設值；覆寫了選單值的項目改以這些輸入觸發 (資料已在儲存區中，同樣需要解碼)
+CONTROL_TRIGGERS = {'heatmap.crosstab.plotly': ['heatmap-mode-radio.value', 'heatmap-cat1-dropdown.value',
+                                                'heatmap-cat2-dropdown.value']}
+
+
+def isolate_caches(directory):
+    # 必須在匯入 app / utils 之前設定：磁碟快取放在暫存目錄，不影響 (也不受影響於) 正在執行的應用程式
+    os.environ.setdefault('DATASET_STORE_DIR', os.path.join(directory, 'datasets'))
+    os.environ.setdefault('IMAGE_CACHE_DIR', os.path.join(directory, 'images'))
+    os.environ['CALLBACK_LOG'] = '0'
+
+
+def clear_caches():
+    """Empties the in-process LRU caches and both on-disk caches (cold measurement)."""
+    from utils.cache import clear_all_caches
+    from utils.dataset_store import dataset_store
+    from utils.image_cache import image_cache
+    clear_all_caches()
+    dataset_store.clear()
+    image_cache.clear()
+
+
+# --- 量測 ---
+def measure(func, repeat, cold):
+    """Wall-clock seconds of repeat calls of func (caches cleared before each call when cold) and the last result."""
+    samples, result = [], None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(repeat):
+            if cold:
+                clear_caches()
+            gc.collect()
+            with contextlib.redirect_stdout(devnull): # 各函式的除錯輸出不列入量測
+                started = time.perf_counter()
+                result = func()
+                samples.append(time.perf_counter() - started)
+    return samples, result
+
+
+def summarize(samples):
+    return {'median_ms': round(statistics.median(samples) * 1000, 3), 'min_ms': round(min(samples) * 1000, 3),
+            'max_ms': round(max(samples) * 1000, 3), 'runs': len(samples)}
+
+
+def benchmark_dataset(name, client, layouts, repeat, seed, selected):
+    """Runs every benchmark on one synthetic dataset and returns {'<dataset>/<benchmark>': summary}."""
+    from pages.data_upload import generate_category_overview_data, parse_uploaded_file
+    from utils.cache import parse_stored_dataframe
+
+    print(f"[{name}] 產生資料集...", file=sys.stderr)
+    df = build_dataset(name, seed=seed)
+    results = {}
+
+    def run(benchmark, func, cached=False, size=None):
+        if selected and not any(pattern in benchmark for pattern in selected):
+            return None
+        key = f"{name}/{benchmark}"
+        print(f"[{name}] {benchmark}", file=sys.stderr)
+        try:
+            samples, result = measure(func, repeat, cold=True)
+            entry = summarize(samples)
+            if cached: # 快取命中後的重複檢視
+                entry['warm_median_ms'] = summarize(measure(func, repeat, cold=False)[0])['median_ms']
+            if size is not None:
+                entry['bytes'] = size(result)
+        except Exception as e: # 記錄失敗 (例如 10m 資料集記憶體不足)，繼續其餘項目
+            entry = {'error': f"{type(e).__name__}: {e}"}
+        results[key] = entry
+        return entry
+
+    csv_bytes = df.to_csv(index=False).encode('utf-8')
+    contents = 'data:text/csv;base64,' + base64.b64encode(csv_bytes).decode('ascii')
+    del csv_bytes
+    run('parse_uploaded_file', lambda: parse_uploaded_file(contents, f'{name}.csv'), size=lambda _: len(contents))
+    with contextlib.redirect_stdout(sys.stderr):
+        parsed, _ = parse_uploaded_file(contents, f'{name}.csv')
+    del contents
+
+    run('category_overview', lambda: generate_category_overview_data(parsed))
+    data_json = parsed.to_json(orient='split')
+    run('store_round_trip', lambda: parse_stored_dataframe(parsed.to_json(orient='split')), size=lambda _: len(data_json))
+    del parsed
+
+    filter_values = dict(filter_request(df), **{'stored-data.data': data_json})
+    run('apply_filters', lambda: client.call('apply_filters', filter_values, ['apply-filter-button.n_clicks']),
+        size=lambda response: len(response[1]))
+
+    for benchmark, callback, overrides in PAGE_BENCHMARKS:
+        values = dict(layouts[callback], **overrides, **{'filtered-data-store.data': data_json})
+        changed = CONTROL_TRIGGERS.get(benchmark, ['filtered-data-store.data'])
+        run(benchmark, lambda values=values, callback=callback, changed=changed: client.call(callback, values, changed),
+            cached=True, size=lambda response: len(response[1]))
+    return results
+
+
+def _environment():
+    import dash
+    import numpy
+    import pandas
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'pandas': pandas.__version__, 'numpy': numpy.__version__,
+            'dash': dash.__version__, 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'git_commit': commit or None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="資料視覺化工具的效能基準測試")
+    parser.add_argument('--sizes', default='5k,100k', help=f"逗號分隔的資料集大小 ({', '.join(SIZES)})，預設 5k,100k")
+    parser.add_argument('--wide', action='store_true', help="同時量測寬版本資料集 (額外 40 個數值與 6 個類別欄位)")
+    parser.add_argument('--repeat', type=int, default=3, help="每項量測的執行次數 (取中位數)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', default='', help="逗號分隔的基準名稱片段，只執行符合的項目 (例如 apply_filters,heatmap)")
+    parser.add_argument('--output', help="結果 JSON 路徑 (預設 benchmarks/results/<時間>.json)")
+    parser.add_argument('--baseline', help="與此基準結果比較，有退步時以非零狀態結束")
+    parser.add_argument('--threshold', type=float, default=1.25, help="中位數超過基準的倍數視為退步 (預設 1.25)")
+    args = parser.parse_args(argv)
+
+    names = dataset_names([size.strip() for size in args.sizes.split(',') if size.strip()], args.wide)
+    selected = [pattern.strip() for pattern in args.only.split(',') if pattern.strip()]
+
+    with tempfile.TemporaryDirectory(prefix='dataviz-bench-') as cache_dir:
+        isolate_caches(cache_dir)
+        with contextlib.redirect_stdout(sys.stderr): # 匯入 app 時的啟動訊息
+            import app as app_module
+            from utils.render import render_farm
+            render_farm.start(wait=True) # 繪圖行程暖機不計入靜態圖表量測
+
+        layouts = {}
+        for page in ('distribution', 'relationship', 'bar_plot', 'heatmap'):
+            values = layout_values(getattr(app_module, page).layout)
+            layouts[f"update_{'bar' if page == 'bar_plot' else page}_page"] = values
+        client = CallbackClient(app_module.app, TestClientTransport(app_module.server))
+
+        results = {}
+        try:
+            for name in names:
+                results.update(benchmark_dataset(name, client, layouts, args.repeat, args.seed, selected))
+        finally:
+            render_farm.shutdown()
+
+    report = {'format': FORMAT_VERSION, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+              'environment': _environment(), 'settings': {'repeat': args.repeat, 'seed': args.seed},
+              'results': results}
+    output = args.output or os.path.join(RESULTS_DIR, datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline, report, threshold=args.threshold)
+        print_comparison(rows)
+        return 1 if any(row['status'] == 'regression' for row in rows) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import os
+
+# --- 生產環境 WSGI 伺服器設定 (gunicorn -c gunicorn.conf.py app:server) ---
+# 多個工作行程 × 每行程多個執行緒。上傳的資料隨每個請求送達，任何工作行程都能處理任一工作階段；
+# 已解析的資料集經 utils/dataset_store.py 以 memory-map 檔案在同一台機器的工作行程間共享。
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8050')}"
+# 每個工作行程另有自己的繪圖行程池 (RENDER_WORKERS) 與 Kendall 行程池：Kendall 預設 CPU 數 / workers 個行程
+# (utils/correlation.py 以相同預設計算)，避免每個工作行程各開 CPU 數個行程而超額使用 CPU；可用 KENDALL_WORKERS 覆寫。
+workers = int(os.environ.get('WEB_WORKERS', min(os.cpu_count() or 1, 4)))
+threads = int(os.environ.get('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', 120)) # 大型資料集的相關矩陣等計算可能較久
+graceful_timeout = 30
+keepalive = 5
+
+# 先在主行程載入 app (頁面模組、回調註冊)，工作行程 fork 後共用這些記憶體頁面
+preload_app = True
+# 定期重啟工作行程，回收長時間執行累積的快取與碎片化記憶體
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    # 繪圖行程池不能跨 fork 共用：每個工作行程在 fork 後建立自己的繪圖行程
+    from utils.render import render_farm
+    render_farm.start(wait=False)
+
+
+def worker_exit(server, worker):
+    from utils.correlation import shutdown_kendall_pool
+    from utils.render import render_farm
+    render_farm.shutdown()
+    shutdown_kendall_pool()
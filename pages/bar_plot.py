@@ -1,19 +1,20 @@
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
+from dash import dcc, html, Input, Output, State, ClientsideFunction
 import pandas as pd
 import numpy as np
 import io
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
 import base64
 import dash_bootstrap_components as dbc # Import dbc for Alert
-
-# Configure Matplotlib to use 'Agg' backend
-import matplotlib
-matplotlib.use('Agg')
+from utils.cache import dataset_version, read_stored_dataframe
+from utils.cancellation import cancellable
+from utils.aggregation import AGG_LABELS, AGG_OPTIONS, COUNT_COLUMN, aggregation_frame, get_grouped_aggregates
+from utils.categorical import MAX_TOP_N, OTHER_LABEL, normalize_top_n
+from utils.figure_patch import layout_patch
+from utils.fast_figure import bar_figure, message_figure, split_groups, warning_figure, with_axis_titles
+from utils.intervals import CI_OPTIONS, bootstrap_interval, mean_t_interval
+from utils.page_compute import DATA_INPUT, column_profile, needs_render, too_many_levels
+from utils.render import BLANK_IMAGE, cached_static_chart, error_image, message_chart
 
 # --- Layout Definition ---
 layout = html.Div([
@@ -28,10 +29,23 @@ layout = html.Div([
         html.Label("選擇數值變數（選填）："),
         dcc.Dropdown(id='bar-value-dropdown', placeholder="選擇數值變數..."),
     ]),
+    html.Div([
+        html.Label("彙總方式（選擇數值變數時）："),
+        dcc.Dropdown(id='bar-agg-dropdown', options=AGG_OPTIONS, value='mean', clearable=False),
+    ]),
+    html.Div([
+        html.Label("信賴區間（靜態圖表）："),
+        dcc.Dropdown(id='bar-ci-dropdown', options=CI_OPTIONS, value='t', clearable=False),
+    ]),
     html.Div([
         html.Label("選擇分組變數（選填）："),
         dcc.Dropdown(id='bar-group-dropdown', placeholder="選擇分組變數..."),
     ]),
+    html.Div([
+        html.Label(f"Top-N 模式（保留出現最多的 N 個類別，其餘合併為「{OTHER_LABEL}」，留空則不使用）："),
+        dcc.Input(id='bar-topn-input', type='number', min=1, max=MAX_TOP_N, step=1,
+                  placeholder="例如: 10", debounce=True),
+    ]),
     html.Div([
         html.Label("長條圖模式："),
         dcc.Dropdown(
@@ -62,7 +76,8 @@ layout = html.Div([
 
     html.Div([
         dcc.Graph(id='bar-plotly-graph', style={'display': 'block'}),
-        html.Img(id='bar-static-img', style={'display': 'none', 'maxWidth': '100%'})
+        html.Img(id='bar-static-img', style={'display': 'none', 'maxWidth': '100%'}),
+        dcc.Store(id='bar-render-state') # 目前的圖表 / 圖片由哪些輸入繪製 (utils/page_compute.py)
     ]),
 
     # Section for Dynamic Code Snippet
@@ -94,239 +109,237 @@ layout = html.Div([
     ])
 ])
 
-def register_callbacks(app):
-    @app.callback(
-        [Output('bar-plotly-graph', 'style'),
-         Output('bar-static-img', 'style'),
-         Output('plotly-bar-controls', 'style')],
-        [Input('bar-plot-type-radio', 'value')]
-    )
-    def toggle_bar_view(view_mode):
-        plotly_controls_style = {'display': 'block'} if view_mode == 'dynamic' else {'display': 'none'}
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}, plotly_controls_style
+# --- 輔助函式：計算長條的信賴區間 ---
+def compute_bar_intervals(df, agg_df, grouping_cols, value_col, agg, ci_method):
+    """Returns (low, high) arrays aligned with agg_df rows, or (None, None) when no interval applies.
+
+    df is the frame used for grouping (the bucketed frame in Top-N mode).
+    """
+    if not value_col or ci_method == 'none' or agg == 'count':
+        return None, None
+    if ci_method == 't':
+        if agg != 'mean':
+            return None, None # 解析 t 區間僅適用於平均值
+        return mean_t_interval(agg_df['mean'], agg_df['std'], agg_df['count'])
+    # Bootstrap：依與 agg_df 相同的 groupby 順序逐組重抽樣
+    bounds = [bootstrap_interval(values.to_numpy(dtype=float, na_value=np.nan), agg)
+              for _, values in df.groupby(grouping_cols, observed=True)[value_col]]
+    low, high = np.array(bounds, dtype=float).reshape(-1, 2).T
+    return low, high
+
+# --- 輔助函式：以 matplotlib 繪製 (分組) 長條圖與誤差線 ---
+def draw_bar_chart(ax, table, category_col, group_col, y_col, low=None, high=None):
+    import seaborn as sns # 延遲載入：只有繪圖行程需要
+    categories = pd.unique(table[category_col])
+    x_pos = {cat: i for i, cat in enumerate(categories)}
+    groups = pd.unique(table[group_col]) if group_col else [None]
+    width = 0.8 / len(groups)
+    colors = sns.color_palette(n_colors=len(groups))
+    for g_idx, group in enumerate(groups):
+        rows = np.flatnonzero((table[group_col] == group).to_numpy()) if group_col else np.arange(len(table))
+        sub = table.iloc[rows]
+        x = np.array([x_pos[c] for c in sub[category_col]]) - 0.4 + width * (g_idx + 0.5)
+        heights = sub[y_col].to_numpy(dtype=float)
+        yerr = None
+        if low is not None:
+            yerr = np.vstack([heights - low[rows], high[rows] - heights])
+        ax.bar(x, heights, width=width, color=colors[g_idx], label=str(group) if group_col else None,
+               yerr=yerr, ecolor='#3a3a3a', capsize=3 if yerr is not None else 0)
+    ax.set_xticks(range(len(categories)))
+    ax.set_xticklabels([str(c) for c in categories])
+    if group_col:
+        ax.legend(title=group_col)
+
+# --- 靜態圖表繪製 (於繪圖行程中執行) ---
+def draw_static_bar(ax, spec, frames):
+    import matplotlib.pyplot as plt # 延遲載入：只有繪圖行程需要
+    table = frames['table']
+    low = table['ci_low'].to_numpy(dtype=float) if 'ci_low' in table else None
+    high = table['ci_high'].to_numpy(dtype=float) if 'ci_high' in table else None
+    draw_bar_chart(ax, table, spec['category_col'], spec['group_col'], spec['y_col'], low, high)
+    ax.set_title(spec['title'])
+    ax.set_xlabel(spec['category_col'])
+    ax.set_ylabel(spec['y_label'])
+    # If category labels are long, rotate them
+    plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+
+# --- 頁面輸出 (由單一計算回調呼叫，資料已解析) ---
+def bar_plot_dropdowns(df, profile):
+    """(category / value / grouping options, default category, value, grouping) for a dataset."""
+    if df is None or df.empty:
+        return [], [], [], None, None, None
+
+    # Filter categorical columns with unique count <= 50
+    # 唯一值較多的欄位仍列出 (需搭配 Top-N 模式)，唯一值數量取自依資料版本快取的欄位概況
+    filtered_categorical_cols = []
+    high_cardinality_cols = []
+    for col in profile['categorical']:
+        if col not in profile['levels']:
+            continue
+        nunique = profile['levels'][col]
+        if nunique <= 50:
+            filtered_categorical_cols.append(col)
         else:
-            return {'display': 'none'}, {'display': 'block', 'maxWidth': '100%'}, plotly_controls_style
-
-    @app.callback(
-        Output('bar-plotly-graph', 'figure'),
-        [Input('filtered-data-store', 'data'), # Changed from stored-data
-         Input('bar-category-dropdown', 'value'),
-         Input('bar-value-dropdown', 'value'),
-         Input('bar-group-dropdown', 'value'),
-         Input('bar-mode-dropdown', 'value'),
-         Input('bar-plot-type-radio', 'value')]
-    )
-    def update_plotly_bar_plot(stored_data_json, category_col, value_col, group_col, bar_mode, view_mode):
-        if view_mode != 'dynamic' or stored_data_json is None or category_col is None:
-            return px.scatter(title="請選擇動態檢視和類別變數")
-
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
-
-            # Check unique value count for category variable
-            if df[category_col].dtype in ['object', 'category'] and df[category_col].nunique() > 20:
-                warning_message = f"類別變數 '{category_col}' 的唯一值超過 20 個，不適合繪製長條圖。"
-                fig = go.Figure()
-                fig.add_annotation(
-                    text=warning_message, xref="paper", yref="paper",
-                    x=0.5, y=0.5, showarrow=False, font=dict(size=14)
-                )
-                fig.update_layout(title="警告", xaxis={'visible': False}, yaxis={'visible': False}, plot_bgcolor='white')
-                return fig
-
-            # Check unique value count for grouping variable
-            if group_col and df[group_col].dtype in ['object', 'category'] and df[group_col].nunique() > 20:
-                warning_message = f"分組變數 '{group_col}' 的唯一值超過 20 個，不適合分組繪圖。"
-                fig = go.Figure()
-                fig.add_annotation(
-                    text=warning_message, xref="paper", yref="paper",
-                    x=0.5, y=0.5, showarrow=False, font=dict(size=14)
-                )
-                fig.update_layout(title="警告", xaxis={'visible': False}, yaxis={'visible': False}, plot_bgcolor='white')
-                return fig
+            high_cardinality_cols.append((col, nunique))
+
+    # Create options
+    categorical_options = [{'label': f"{col} (categorical)", 'value': col} for col in filtered_categorical_cols]
+    categorical_options += [{'label': f"{col} (categorical, {nunique} 個唯一值，建議使用 Top-N)", 'value': col}
+                            for col, nunique in high_cardinality_cols]
+    numerical_options = [{'label': f"{col} (numeric)", 'value': col} for col in profile['numeric']]
+    grouping_options = categorical_options  # Grouping is typically categorical
+
+    # Set default values (first filtered categorical, or None)
+    default_category = filtered_categorical_cols[0] if filtered_categorical_cols else None
+    return categorical_options, numerical_options, grouping_options, default_category, None, None
+
+
+def bar_plot_figure(data_version, df, profile, category_col, value_col, group_col, agg, top_n, bar_mode, view_mode):
+    if view_mode != 'dynamic':
+        return dash.no_update # 動態圖表隱藏中，切回動態檢視時若繪製輸入已改變再重建
+    if df is None or category_col is None:
+        return message_figure("請選擇動態檢視和類別變數")
+    try:
+        # 彙總表依資料版本快取，切換彙總方式不需重新計算
+        agg = agg if agg in AGG_LABELS else 'mean'
+        top_n = normalize_top_n(top_n)
+        agg_df = get_grouped_aggregates(data_version, df, category_col, group_col, value_col, top_n)
+        max_levels = max(20, top_n + 1) if top_n else 20 # Top-N 分桶後最多 N+1 個類別
+
+        # Check unique value count for category variable
+        if category_col in profile['categorical'] and agg_df[category_col].nunique() > max_levels:
+            warning_message = f"類別變數 '{category_col}' 的唯一值超過 20 個，不適合繪製長條圖。可使用 Top-N 模式。"
+            return warning_figure(warning_message)
+
+        # Check unique value count for grouping variable
+        if group_col in profile['categorical'] and agg_df[group_col].nunique() > max_levels:
+            warning_message = f"分組變數 '{group_col}' 的唯一值超過 20 個，不適合分組繪圖。可使用 Top-N 模式。"
+            return warning_figure(warning_message)
 
+        if value_col:
+            y_col = agg
+            y_label = f"{value_col} ({AGG_LABELS[agg]})"
+            title = f"{y_label} 依據 {category_col} 的分布"
+            plot_df = agg_df
+        else:
+            y_col = COUNT_COLUMN
+            y_label = "計數"
             title = f"{category_col} 的分布"
-            if value_col:
-                title = f"{value_col} 依據 {category_col} 的分布"
-            if group_col:
-                title += f" (平均)\n依據 {group_col} 分組"
-            elif value_col:
-                 title = f"{value_col} (平均) 依據 {category_col} 的分布"
+            # 與 value_counts() 相同，依計數由大到小排列 (Top-N 分桶已依頻率排序，「其他」在最後)
+            plot_df = agg_df if group_col or top_n else agg_df.sort_values(COUNT_COLUMN, ascending=False)
+        if group_col:
+            title += f"\n依據 {group_col} 分組"
+        if top_n:
+            title += f" (Top {top_n})"
 
+        # 彙總表很小，長條由 NumPy 陣列直接組成 (utils/fast_figure.py)，不經 plotly.express
+        fig = bar_figure(plot_df[category_col].to_numpy(), plot_df[y_col].to_numpy(),
+                         split_groups(plot_df[group_col] if group_col else None),
+                         title, category_col, y_label, group_col, barmode=bar_mode)
+        return with_axis_titles(fig, category_col, y_label)
 
-            if value_col:
-                # Aggregate data to calculate the mean for Plotly
-                grouping_cols = [category_col]
-                if group_col:
-                    grouping_cols.append(group_col)
-                
-                agg_df = df.groupby(grouping_cols, observed=True)[value_col].mean().reset_index()
-                
-                fig = px.bar(agg_df, x=category_col, y=value_col, color=group_col,
-                           title=title, barmode=bar_mode)
-            else:
-                # For count plots, no aggregation needed beforehand
-                value_counts = df[category_col].value_counts().reset_index()
-                value_counts.columns = [category_col, '計數']
-                fig = px.bar(value_counts, x=category_col, y='計數',
-                           title=title)
-
-            fig.update_layout(
-                transition_duration=300,
-                xaxis_title=category_col,
-                yaxis_title=f"{value_col} (平均)" if value_col else "計數"
-            )
-            return fig
-
-        except Exception as e:
-            print(f"生成圖表時發生錯誤：{e}")
-            return px.scatter(title=f"錯誤：{e}")
+    except Exception as e:
+        print(f"生成圖表時發生錯誤：{e}")
+        return message_figure(f"錯誤：{e}")
 
-    @app.callback(
-        Output('bar-static-img', 'src'),
-        [Input('filtered-data-store', 'data'), # Changed from stored-data
-         Input('bar-category-dropdown', 'value'),
-         Input('bar-value-dropdown', 'value'),
-         Input('bar-group-dropdown', 'value'),
-         Input('bar-plot-type-radio', 'value')]
-    )
-    def update_static_bar_plot(stored_data_json, category_col, value_col, group_col, view_mode):
-        if view_mode != 'static' or stored_data_json is None or category_col is None:
-            return "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
 
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+def bar_plot_static_src(data_version, df, profile, category_col, value_col, group_col, agg, ci_method, top_n, view_mode):
+    if view_mode != 'static' or df is None or category_col is None:
+        return BLANK_IMAGE
 
-            plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
-            plt.rcParams['axes.unicode_minus'] = False
+    try:
+        agg = agg if agg in AGG_LABELS else 'mean'
+        top_n = normalize_top_n(top_n)
 
+        def build():
             # Check unique value count for category variable
-            if df[category_col].dtype in ['object', 'category'] and df[category_col].nunique() > 20:
+            if not top_n and too_many_levels(profile, category_col, 20):
                 warning_message = f"類別變數 '{category_col}' 的唯一值超過 20 個，\n不適合繪製長條圖。"
-                fig_warn, ax_warn = plt.subplots(figsize=(8, 2), tight_layout=True)
-                ax_warn.text(0.5, 0.5, warning_message, ha='center', va='center', fontsize=12, color='red')
-                ax_warn.axis('off')
-                buf = BytesIO()
-                fig_warn.savefig(buf, format="png")
-                buf.seek(0)
-                data = base64.b64encode(buf.getvalue()).decode("utf8")
-                plt.close(fig_warn)
-                return f"data:image/png;base64,{data}"
+                return message_chart(warning_message)
 
             # Check unique value count for grouping variable
-            if group_col and df[group_col].dtype in ['object', 'category'] and df[group_col].nunique() > 20:
+            if not top_n and too_many_levels(profile, group_col, 20):
                 warning_message = f"分組變數 '{group_col}' 的唯一值超過 20 個，\n不適合分組繪圖。"
-                fig_warn, ax_warn = plt.subplots(figsize=(8, 2), tight_layout=True)
-                ax_warn.text(0.5, 0.5, warning_message, ha='center', va='center', fontsize=12, color='red')
-                ax_warn.axis('off')
-                buf = BytesIO()
-                fig_warn.savefig(buf, format="png")
-                buf.seek(0)
-                data = base64.b64encode(buf.getvalue()).decode("utf8")
-                plt.close(fig_warn)
-                return f"data:image/png;base64,{data}"
-
-            fig_static, ax = plt.subplots(figsize=(10, 6), tight_layout=True)
+                return message_chart(warning_message)
+
+            # 使用快取的分組彙總值與解析信賴區間繪製，不再由 seaborn 逐次 bootstrap
+            grouping_cols = [category_col] + ([group_col] if group_col else [])
+            y_col = agg if value_col else COUNT_COLUMN
+            agg_df = get_grouped_aggregates(data_version, df, category_col, group_col, value_col, top_n)
+            group_df = aggregation_frame(data_version, df, category_col, group_col, value_col, top_n)
+            low, high = compute_bar_intervals(group_df, agg_df, grouping_cols, value_col, agg, ci_method)
+            table = agg_df[grouping_cols + [y_col]].copy()
+            if low is not None:
+                table['ci_low'], table['ci_high'] = low, high
 
-            if value_col:
-                if group_col:
-                    sns.barplot(data=df, x=category_col, y=value_col, hue=group_col, ax=ax)
-                else:
-                    sns.barplot(data=df, x=category_col, y=value_col, ax=ax)
-            else:
-                sns.countplot(data=df, x=category_col, hue=group_col, ax=ax)
-            
             title = f"{category_col} 的分布"
             y_label = "計數" # Default for countplot
             if value_col:
-                title = f"{value_col} (平均) 依據 {category_col} 的分布"
-                y_label = f"{value_col} (平均)"
+                title = f"{value_col} ({AGG_LABELS[agg]}) 依據 {category_col} 的分布"
+                y_label = f"{value_col} ({AGG_LABELS[agg]})"
             if group_col:
                 title += f"\n依據 {group_col} 分組"
-
-            ax.set_title(title)
-            ax.set_xlabel(category_col)
-            ax.set_ylabel(y_label)
-
-            # If category labels are long, rotate them
-            plt.xticks(rotation=45, ha='right')
-
-            buf = BytesIO()
-            fig_static.savefig(buf, format="png", bbox_inches='tight')
-            buf.seek(0)
-            data = base64.b64encode(buf.getvalue()).decode("utf8")
-            plt.close(fig_static)
-            return f"data:image/png;base64,{data}"
-
-        except Exception as e:
-            print(f"生成靜態圖表時發生錯誤：{e}")
-            error_message = f"錯誤：{e}"
-            # Return an SVG error placeholder
-            return f"data:image/svg+xml;charset=utf-8,%3Csvg xmlns='http://www.w3.org/2000/svg' width='300' height='100'%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' font-size='10px' fill='red'%3E{error_message}%3C/text%3E%3C/svg%3E"
-        finally:
-            # Ensure Matplotlib figure is closed
-            if 'fig_static' in locals() and fig_static:
-                 plt.close(fig_static)
-
-    # --- Callback to toggle code section visibility ---
-    @app.callback(
-        [Output('dynamic-code-section-bar', 'style'),
-         Output('static-code-section-bar', 'style')],
-        [Input('bar-plot-type-radio', 'value')]
-    )
-    def toggle_code_section_visibility(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}
-        elif view_mode == 'static':
-            return {'display': 'none'}, {'display': 'block'}
-        return {'display': 'block'}, {'display': 'none'} # Default to showing dynamic
-
-    # --- Callback to update code snippets ---
-    @app.callback(
-        [Output('dynamic-code-block-bar', 'children'),
-         Output('static-code-block-bar', 'children')],
-        [Input('filtered-data-store', 'data'),
-         Input('bar-category-dropdown', 'value'),
-         Input('bar-value-dropdown', 'value'),
-         Input('bar-group-dropdown', 'value'),
-         Input('bar-mode-dropdown', 'value'),
-         Input('bar-plot-type-radio', 'value')]
-    )
-    def update_bar_code_snippets(stored_data_json, category_col, value_col, group_col, bar_mode, view_mode):
-        if stored_data_json is None or category_col is None:
-            msg = "請先選擇類別欄位"
-            return msg, msg
-
-        # Dynamic (Plotly) code generation
-        plotly_params = f"df, x='{category_col}'"
-        if value_col:
-            plotly_params += f", y='{value_col}'"
-            if group_col:
-                plotly_params += f", color='{group_col}'"
-            plotly_params += f", barmode='{bar_mode}'"
-            plotly_params += f", title='{value_col} (平均) 依據 {category_col} 的分布"
-            if group_col:
-                 plotly_params += f" (依據 {group_col} 分組)'"
-            else:
-                 plotly_params += "'"
+            if top_n:
+                title += f" (Top {top_n})"
+
+            spec = {'category_col': category_col, 'group_col': group_col, 'y_col': y_col, 'title': title,
+                    'y_label': y_label, 'figsize': (10, 6), 'bbox_inches': 'tight'}
+            return draw_static_bar, spec, {'table': table}
+
+        params = {'category_col': category_col, 'value_col': value_col, 'group_col': group_col,
+                  'agg': agg, 'ci_method': ci_method, 'top_n': top_n}
+        return cached_static_chart('bar', data_version, params, build)
+
+    except Exception as e:
+        print(f"生成靜態圖表時發生錯誤：{e}")
+        # Return an SVG error placeholder
+        return error_image(f"錯誤：{e}")
+
+
+def bar_plot_code_snippets(df, category_col, value_col, group_col, agg, ci_method, top_n, bar_mode, view_mode):
+    if df is None or category_col is None:
+        msg = "請先選擇類別欄位"
+        return msg, msg
+    agg = agg if agg in AGG_LABELS else 'mean'
+    agg_label = AGG_LABELS[agg]
+    top_n = normalize_top_n(top_n)
+
+    # Top-N 模式：保留出現最多的 N 個類別，其餘合併為「其他」
+    top_n_code = ""
+    if top_n:
+        for col in dict.fromkeys(c for c in (category_col, group_col) if c):
+            top_n_code += (f"top_levels = df['{col}'].value_counts().nlargest({top_n}).index\n"
+                           f"df['{col}'] = df['{col}'].where(df['{col}'].isin(top_levels) | df['{col}'].isna(), '{OTHER_LABEL}')\n")
+
+    # Dynamic (Plotly) code generation
+    plotly_params = f"df, x='{category_col}'"
+    if value_col:
+        plotly_params += f", y='{value_col}'"
+        if group_col:
+            plotly_params += f", color='{group_col}'"
+        plotly_params += f", barmode='{bar_mode}'"
+        plotly_params += f", title='{value_col} ({agg_label}) 依據 {category_col} 的分布"
+        if group_col:
+             plotly_params += f" (依據 {group_col} 分組)'"
         else:
-            plotly_params += ", y='計數'" # Assuming count plot if no value_col
-            plotly_params += f", title='{category_col} 的分布'"
+             plotly_params += "'"
+    else:
+        plotly_params += ", y='計數'" # Assuming count plot if no value_col
+        plotly_params += f", title='{category_col} 的分布'"
 
 
-        plotly_code = f"""```python
+    plotly_code = f"""```python
 import plotly.express as px
 import pandas as pd
 # Assuming 'df' is your pandas DataFrame
-
+{top_n_code}
 # If plotting counts (no value column selected):
 # value_counts = df['{category_col}'].value_counts().reset_index()
 # value_counts.columns = ['{category_col}', '計數']
 # fig = px.bar(value_counts, x='{category_col}', y='計數', title='{category_col} 的分布')
 
 # If plotting aggregated values (value column selected):
-# agg_df = df.groupby(['{category_col}'{', "' + group_col + '"' if group_col else ''}], observed=True)['{value_col}'].mean().reset_index()
+# agg_df = df.groupby(['{category_col}'{', "' + group_col + '"' if group_col else ''}], observed=True)['{value_col}'].agg('{agg}').reset_index()
 # fig = px.bar(agg_df, x='{category_col}', y='{value_col}'{', color="' + group_col + '"' if group_col else ''}, barmode='{bar_mode}', title='...') # Add appropriate title
 
 # Example using provided parameters (might need adjustment based on actual aggregation)
@@ -334,8 +347,8 @@ fig = px.bar({plotly_params})
 fig.show()
 ```"""
 
-        # Static (Seaborn) code generation
-        static_code = f"""```python
+    # Static (Seaborn) code generation
+    static_code = f"""```python
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -344,102 +357,129 @@ import pandas as pd
 # plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
 # plt.rcParams['axes.unicode_minus'] = False
 
+{top_n_code}
 plt.figure(figsize=(10, 6))
 """
-        if value_col:
-            static_code += f"sns.barplot(data=df, x='{category_col}', y='{value_col}'"
-            if group_col:
-                static_code += f", hue='{group_col}'"
-            static_code += ")\n"
-            static_code += f"plt.ylabel('{value_col} (平均)')\n"
-            title = f"'{value_col} (平均) 依據 {category_col} 的分布"
-            if group_col:
-                title += f"\\n依據 {group_col} 分組'"
-            else:
-                title += "'"
+    if value_col:
+        static_code += f"sns.barplot(data=df, x='{category_col}', y='{value_col}'"
+        if group_col:
+            static_code += f", hue='{group_col}'"
+        if agg != 'mean':
+            static_code += f", estimator='{agg}'"
+        if ci_method == 'none' or (ci_method == 't' and agg != 'mean'):
+            static_code += ", errorbar=None"
+        elif ci_method == 't':
+            static_code += ", errorbar=('se', 1.96)" # 常態近似的 95% 區間 (t 區間需自行計算)
+        else:
+            static_code += ", errorbar=('ci', 95), n_boot=1000, seed=42"
+        static_code += ")\n"
+        static_code += f"plt.ylabel('{value_col} ({agg_label})')\n"
+        title = f"'{value_col} ({agg_label}) 依據 {category_col} 的分布"
+        if group_col:
+            title += f"\\n依據 {group_col} 分組'"
+        else:
+            title += "'"
+
+    else: # Count plot
+        static_code += f"sns.countplot(data=df, x='{category_col}'"
+        if group_col:
+            static_code += f", hue='{group_col}'"
+        static_code += ")\n"
+        static_code += "plt.ylabel('計數')\n"
+        title = f"'{category_col} 的分布"
+        if group_col:
+            title += f"\\n依據 {group_col} 分組'"
+        else:
+            title += "'"
 
-        else: # Count plot
-            static_code += f"sns.countplot(data=df, x='{category_col}'"
-            if group_col:
-                static_code += f", hue='{group_col}'"
-            static_code += ")\n"
-            static_code += "plt.ylabel('計數')\n"
-            title = f"'{category_col} 的分布"
-            if group_col:
-                title += f"\\n依據 {group_col} 分組'"
-            else:
-                title += "'"
+    static_code += f"plt.title({title})\n"
+    static_code += f"plt.xlabel('{category_col}')\n"
+    static_code += "plt.xticks(rotation=45, ha='right') # Rotate labels if needed\n"
+    static_code += "plt.tight_layout()\n"
+    static_code += "plt.show()\n```"
 
-        static_code += f"plt.title({title})\n"
-        static_code += f"plt.xlabel('{category_col}')\n"
-        static_code += "plt.xticks(rotation=45, ha='right') # Rotate labels if needed\n"
-        static_code += "plt.tight_layout()\n"
-        static_code += "plt.show()\n```"
 
+    if view_mode == 'dynamic':
+        return plotly_code, ""
+    elif view_mode == 'static':
+        return "", static_code
+    else:
+        return "", ""
 
-        if view_mode == 'dynamic':
-            return plotly_code, ""
-        elif view_mode == 'static':
-            return "", static_code
-        else:
-            return "", ""
 
+def register_callbacks(app):
+    # 切換檢視只改 CSS display，在瀏覽器端執行 (assets/clientside.js)，不需往返伺服器
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleViewWithControls'),
+        [Output('bar-plotly-graph', 'style'),
+         Output('bar-static-img', 'style'),
+         Output('plotly-bar-controls', 'style')],
+        [Input('bar-plot-type-radio', 'value')]
+    )
 
-    # Callback to populate dropdowns based on stored data
+    # 單一計算回調：選單、動態圖表、靜態圖片與程式碼片段共用一次資料解析 (utils/page_compute.py)
     @app.callback(
         [Output('bar-category-dropdown', 'options'),
          Output('bar-value-dropdown', 'options'),
          Output('bar-group-dropdown', 'options'),
          Output('bar-category-dropdown', 'value'),
          Output('bar-value-dropdown', 'value'),
-         Output('bar-group-dropdown', 'value')],
-        [Input('filtered-data-store', 'data')] # Changed from stored-data
+         Output('bar-group-dropdown', 'value'),
+         Output('bar-plotly-graph', 'figure'),
+         Output('bar-static-img', 'src'),
+         Output('dynamic-code-block-bar', 'children'),
+         Output('static-code-block-bar', 'children'),
+         Output('bar-render-state', 'data')],
+        [Input('filtered-data-store', 'data'), # Changed from stored-data
+         Input('bar-category-dropdown', 'value'),
+         Input('bar-value-dropdown', 'value'),
+         Input('bar-group-dropdown', 'value'),
+         Input('bar-agg-dropdown', 'value'),
+         Input('bar-ci-dropdown', 'value'),
+         Input('bar-topn-input', 'value'),
+         Input('bar-mode-dropdown', 'value'),
+         Input('bar-plot-type-radio', 'value')],
+        [State('bar-render-state', 'data')]
     )
-    def update_bar_dropdowns(stored_data_json):
-        default_return = ([], [], [], None, None, None) # Define default return tuple
-
-        if not stored_data_json:
-            print("update_bar_dropdowns: No stored data.")
-            return default_return
-
+    @cancellable(unless_triggered_by=[DATA_INPUT])
+    def update_bar_page(stored_data_json, category_col, value_col, group_col, agg, ci_method, top_n, bar_mode, view_mode, render_state):
         try:
-            print("update_bar_dropdowns: Reading stored data.")
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
-
-            if df.empty:
-                 print("update_bar_dropdowns: DataFrame is empty.")
-                 return default_return
-
-            # Identify column types
-            numeric_cols = df.select_dtypes(include=np.number).columns
-            categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-
-            # Filter categorical columns with unique count <= 50
-            filtered_categorical_cols = []
-            for col in categorical_cols:
-                try:
-                    nunique = df[col].nunique(dropna=False)
-                    if nunique <= 50:
-                        filtered_categorical_cols.append(col)
-                except Exception as e:
-                    print(f"Error counting unique values for column {col}: {e}")
-
-            # Create options
-            categorical_options = [{'label': f"{col} (categorical)", 'value': col} for col in filtered_categorical_cols]
-            numerical_options = [{'label': f"{col} (numeric)", 'value': col} for col in numeric_cols]
-            grouping_options = categorical_options  # Grouping is typically categorical
-
-            # Set default values (first filtered categorical, or None)
-            default_category = filtered_categorical_cols[0] if filtered_categorical_cols else None
-            default_value = None
-            default_group = None
-
-            print("update_bar_dropdowns: Success.")
-            return categorical_options, numerical_options, grouping_options, default_category, default_value, default_group
-
+            data_version = dataset_version(stored_data_json)
+            df = read_stored_dataframe(stored_data_json, data_version)
+            profile = column_profile(data_version, df) if df is not None else None
         except Exception as e:
-            print(f"Error updating bar dropdowns: {e}")
-            return default_return # Return default tuple on error
+            print(f"讀取資料時發生錯誤：{e}")
+            return [], [], [], None, None, None, message_figure(f"錯誤：{e}"), error_image(f"錯誤：{e}"), "", "", None
+
+        # 資料變動時重設選單，並直接以新的預設值繪圖
+        render_state = dict(render_state or {})
+        dropdowns = (dash.no_update,) * 6
+        if needs_render(render_state, 'dropdowns', data_version):
+            dropdowns = bar_plot_dropdowns(df, profile)
+            category_col, value_col, group_col = dropdowns[3:]
+
+        # 只重新計算繪製輸入已改變的輸出；圖表只差 barmode 時以 Patch 更新 layout.barmode，不重新彙總與傳送資料
+        figure = dash.no_update
+        if view_mode == 'dynamic':
+            rebuild = needs_render(render_state, 'figure', data_version, category_col, value_col, group_col, agg, top_n)
+            mode_changed = needs_render(render_state, 'bar_mode', bar_mode)
+            if rebuild:
+                figure = bar_plot_figure(data_version, df, profile, category_col, value_col, group_col, agg, top_n, bar_mode, view_mode)
+            elif mode_changed:
+                figure = layout_patch(barmode=bar_mode)
+        static_src = dash.no_update
+        if needs_render(render_state, 'static', data_version, category_col, value_col, group_col, agg, ci_method, top_n, view_mode):
+            static_src = bar_plot_static_src(data_version, df, profile, category_col, value_col, group_col, agg, ci_method, top_n, view_mode)
+        code_blocks = bar_plot_code_snippets(df, category_col, value_col, group_col, agg, ci_method, top_n, bar_mode, view_mode)
+        return (*dropdowns, figure, static_src, *code_blocks, render_state)
+
+    # --- Callback to toggle code section visibility ---
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleCodeSections'),
+        [Output('dynamic-code-section-bar', 'style'),
+         Output('static-code-section-bar', 'style')],
+        [Input('bar-plot-type-radio', 'value')]
+    )
 
     # --- Callback to update filter status display on this page ---
     @app.callback(
@@ -6,6 +6,7 @@ import numpy as np
 import base64 # 用於處理檔案上傳
 import io # 用於處理檔案上傳
 import json # 用於處理篩選狀態
+from utils.cache import parse_stored_dataframe # 解析時間計入回調量測
 
 # --- 頁面佈局 ---
 layout = html.Div([
@@ -436,7 +437,7 @@ def register_callbacks(app):
         if filtered_data_json:
             print("從 filtered-data-store 載入資料以更新表格...")
             try:
-                df_filtered = pd.read_json(io.StringIO(filtered_data_json), orient='split')
+                df_filtered = parse_stored_dataframe(filtered_data_json)
                 preview_cols = [{"name": i, "id": i} for i in df_filtered.columns]
                 preview_data = df_filtered.to_dict('records')
                 category_data, category_cols = generate_category_overview_data(df_filtered)
@@ -498,7 +499,7 @@ def register_callbacks(app):
         if not stored_data_json:
             return []
         try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+            df = parse_stored_dataframe(stored_data_json)
             # 填入適合日期轉換的物件/字串類型欄位
             potential_date_cols = df.select_dtypes(include=['object']).columns.tolist()
             # 修改這裡：為每個欄位添加資料類型信息
@@ -539,7 +540,7 @@ def register_callbacks(app):
 
         try:
             # Operate on the original data
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+            df = parse_stored_dataframe(stored_data_json)
 
             if column_to_convert not in df.columns:
                  print(f"Error: Column '{column_to_convert}' not found.")
@@ -632,7 +633,7 @@ def register_callbacks(app):
             return []
 
         try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+            df = parse_stored_dataframe(stored_data_json)
             filter_state = filter_state or {} # Ensure filter_state is a dict
             controls = []
 
@@ -699,10 +700,11 @@ def register_callbacks(app):
                         try:
                             # Generate 5 marks including endpoints
                             mark_values = np.linspace(min_val, max_val, 5)
-                            marks_dict = {num: mark_format.format(num) for num in mark_values}
+                            # 鍵轉為 Python float：orjson 無法序列化以 NumPy 純量為鍵的字典
+                            marks_dict = {float(num): mark_format.format(num) for num in mark_values}
                         except Exception as mark_err:
                              print(f"Could not generate marks for {col}: {mark_err}. Using min/max only.")
-                             marks_dict = {min_val: mark_format.format(min_val), max_val: mark_format.format(max_val)}
+                             marks_dict = {float(min_val): mark_format.format(min_val), float(max_val): mark_format.format(max_val)}
 
 
                         control_card_content.extend([ # Use extend with a list
@@ -834,7 +836,7 @@ def register_callbacks(app):
             return no_update, no_update, "請先選擇欄位並設定篩選條件。", no_update, no_update, no_update, no_update
 
         try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+            df = parse_stored_dataframe(stored_data_json)
             current_filter_state = {} # To store the applied filter values for saving state
             status_messages = []      # To build the status message
             combined_mask = pd.Series([True] * len(df)) # Start with a mask that includes all rows
@@ -1083,7 +1085,7 @@ def register_callbacks(app):
 
         try:
             # Reset filtered data to original data
-            df_original = pd.read_json(io.StringIO(stored_data_json), orient='split')
+            df_original = parse_stored_dataframe(stored_data_json)
             preview_cols_out = [{"name": i, "id": i} for i in df_original.columns]
             preview_data_out = df_original.to_dict('records')
             category_data_out, category_cols_out = generate_category_overview_data(df_original)
@@ -1,23 +1,22 @@
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
+from dash import dcc, html, Input, Output, State, ClientsideFunction
 import pandas as pd
 import numpy as np
 import io
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
 import base64
 import dash_bootstrap_components as dbc # Import dbc for Alert
+from utils.cache import dataset_version, read_stored_dataframe
+from utils.cancellation import cancellable
+from utils.downsample import downsample_for_plot, random_indices, sampling_note
+from utils.fast_figure import (box_figure, box_stats, category_groups, histogram_figure, message_figure,
+                               split_groups, warning_figure, with_axis_titles)
+from utils.page_compute import DATA_INPUT, column_profile, needs_render, too_many_levels
+from utils.render import BLANK_IMAGE, cached_static_chart, error_image, message_chart
 
 # 設定分組變數唯一值最大門檻
 MAX_UNIQUE_GROUP_CATEGORIES = 50
 
-# Configure Matplotlib to use 'Agg' backend
-import matplotlib
-matplotlib.use('Agg')
-
 # --- Layout Definition ---
 layout = html.Div([
     # --- Filter Status Display Area (NEW) ---
@@ -62,7 +61,8 @@ layout = html.Div([
 
     html.Div([
         dcc.Graph(id='distribution-plotly-graph', style={'display': 'block'}),
-        html.Img(id='distribution-static-img', style={'display': 'none', 'maxWidth': '100%'})
+        html.Img(id='distribution-static-img', style={'display': 'none', 'maxWidth': '100%'}),
+        dcc.Store(id='dist-render-state') # 目前的圖表 / 圖片由哪些輸入繪製 (utils/page_compute.py)
     ]),
 
     # Section for Dynamic Code Snippet
@@ -94,185 +94,229 @@ layout = html.Div([
     ])
 ])
 
-def register_callbacks(app):
-    @app.callback(
-        [Output('distribution-plotly-graph', 'style'),
-         Output('distribution-static-img', 'style'),
-         Output('plotly-type-div', 'style')],
-        [Input('dist-view-mode-radio', 'value')]
-    )
-    def toggle_distribution_view(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}, {'display': 'block'}
-        else:
-            return {'display': 'none'}, {'display': 'block', 'maxWidth': '100%'}, {'display': 'none'}
-
-    @app.callback(
-        Output('distribution-plotly-graph', 'figure'),
-        [Input('filtered-data-store', 'data'), # Changed from stored-data to use filtered/latest data
-         Input('dist-numerical-dropdown', 'value'),
-         Input('dist-grouping-dropdown', 'value'),
-         Input('dist-plotly-type-dropdown', 'value'),
-         Input('dist-view-mode-radio', 'value')]
-    )
-    def update_plotly_distribution_plot(stored_data_json, numerical_col, grouping_col, plotly_type, view_mode):
-        if view_mode != 'dynamic' or stored_data_json is None or numerical_col is None:
-            return px.scatter(title="請選擇動態檢視和數值變數")
-
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
-
-            # Check unique values for grouping variable
-            if grouping_col and df[grouping_col].dtype in ['object', 'category'] and df[grouping_col].nunique() > MAX_UNIQUE_GROUP_CATEGORIES:
-                warning_message = f"分組變數 '{grouping_col}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，不適合分組繪圖。"
-                fig = go.Figure()
-                fig.add_annotation(
-                    text=warning_message, xref="paper", yref="paper",
-                    x=0.5, y=0.5, showarrow=False, font=dict(size=14)
-                )
-                fig.update_layout(title="警告", xaxis={'visible': False}, yaxis={'visible': False}, plot_bgcolor='white')
-                return fig
-
-            plot_type_names = {
-                'histogram': '直方圖',
-                'box': '箱型圖',
-                'violin': '小提琴圖'
-            }
-            
-            title = f"{plot_type_names[plotly_type]}：{numerical_col}"
-            if grouping_col:
-                title += f" (依據 {grouping_col} 分組)"
-
-            if plotly_type == 'histogram':
-                fig = px.histogram(df, x=numerical_col, color=grouping_col, 
-                                 title=title, marginal="rug", hover_data=df.columns)
-            elif plotly_type == 'box':
-                fig = px.box(df, x=grouping_col, y=numerical_col, 
-                           color=grouping_col, title=title, points="all")
-            elif plotly_type == 'violin':
-                fig = px.violin(df, x=grouping_col, y=numerical_col, 
-                              color=grouping_col, title=title, box=True, points="all")
-
-            fig.update_layout(
-                transition_duration=300,
-                xaxis_title="數值",
-                yaxis_title="頻率" if plotly_type == 'histogram' else "數值分布"
-            )
-            return fig
-
-        except Exception as e:
-            print(f"生成圖表時發生錯誤：{e}")
-            return px.scatter(title=f"錯誤：{e}")
-
-    @app.callback(
-        Output('distribution-static-img', 'src'),
-        [Input('filtered-data-store', 'data'), # Changed from stored-data to use filtered/latest data
-         Input('dist-numerical-dropdown', 'value'),
-         Input('dist-grouping-dropdown', 'value'),
-         Input('dist-view-mode-radio', 'value')]
-    )
-    def update_static_distribution_plot(stored_data_json, numerical_col, grouping_col, view_mode):
-        if view_mode != 'static' or stored_data_json is None or numerical_col is None:
-            return "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
-
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+# --- 靜態圖表繪製 (於繪圖行程中執行) ---
+def draw_static_distribution(ax, spec, frames):
+    import seaborn as sns # 延遲載入：只有繪圖行程需要
+    sns.histplot(data=frames['data'], x=spec['numerical_col'], hue=spec['grouping_col'], kde=True, ax=ax)
+    ax.set_title(spec['title'])
+    ax.set_xlabel("數值")
+    ax.set_ylabel("頻率")
+
+# --- 頁面輸出 (由單一計算回調呼叫，資料已解析) ---
+def distribution_dropdowns(df, profile):
+    """(numerical options, grouping options, default numerical, default grouping) for a dataset."""
+    if df is None or df.empty:
+        return [], [], None, None
+
+    numeric_cols = profile['numeric']
+    # 過濾唯一值超過門檻的類別變數 (唯一值數量取自依資料版本快取的欄位概況)
+    categorical_cols = [col for col in profile['categorical'] if col in profile['levels']
+                        and not too_many_levels(profile, col, MAX_UNIQUE_GROUP_CATEGORIES)]
+
+    numerical_options = [{'label': f"{col} (numeric)", 'value': col} for col in numeric_cols]
+    grouping_options = []
+    for col in categorical_cols:
+        dtype_str = 'category' if isinstance(df[col].dtype, pd.CategoricalDtype) else 'object'
+        grouping_options.append({'label': f"{col} ({dtype_str})", 'value': col})
+
+    default_numerical = numeric_cols[0] if numeric_cols else None
+    return numerical_options, grouping_options, default_numerical, None
+
+
+def distribution_figure(data_version, df, profile, numerical_col, grouping_col, plotly_type, view_mode):
+    if view_mode != 'dynamic':
+        return dash.no_update # 動態圖表隱藏中，切回動態檢視時若繪製輸入已改變再重建
+    if df is None or numerical_col is None:
+        return message_figure("請選擇動態檢視和數值變數")
+
+    try:
+        # Check unique values for grouping variable
+        if too_many_levels(profile, grouping_col, MAX_UNIQUE_GROUP_CATEGORIES):
+            warning_message = f"分組變數 '{grouping_col}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，不適合分組繪圖。"
+            return warning_figure(warning_message)
+
+        plot_type_names = {
+            'histogram': '直方圖',
+            'box': '箱型圖',
+            'violin': '小提琴圖'
+        }
+
+        title = f"{plot_type_names[plotly_type]}：{numerical_col}"
+        if grouping_col:
+            title += f" (依據 {grouping_col} 分組)"
 
+        # 圖表由 NumPy 陣列直接組成 (utils/fast_figure.py)，不經 plotly.express
+        if plotly_type == 'histogram':
+            # 分箱計數在伺服器端完成，只傳送每組的 bin 計數；地毯圖使用抽樣後的點
+            rug_df, _ = downsample_for_plot(df, None, numerical_col, grouping_col)
+            fig = histogram_figure(
+                df[numerical_col].to_numpy(dtype=float, na_value=np.nan),
+                category_groups(data_version, df, grouping_col), title, numerical_col, grouping_col,
+                rug_values=rug_df[numerical_col].to_numpy(dtype=float, na_value=np.nan),
+                rug_groups=split_groups(rug_df[grouping_col] if grouping_col else None))
+        else:
+            # points="all" 會傳送每一個點，大資料時先分層抽樣並保留極值與離群值；
+            # 此樣本偏向極端值，箱體統計量改由全部資料計算，小提琴的核密度使用均勻抽樣
+            plot_df, sample_info = downsample_for_plot(df, None, numerical_col, grouping_col)
+            stats = density = None
+            if sample_info is not None and plotly_type == 'box':
+                stats = box_stats(df[numerical_col].to_numpy(dtype=float, na_value=np.nan),
+                                  category_groups(data_version, df, grouping_col))
+            elif sample_info is not None:
+                density_df = df.iloc[random_indices(len(df))]
+                density = (density_df[numerical_col].to_numpy(dtype=float, na_value=np.nan),
+                           split_groups(density_df[grouping_col] if grouping_col else None))
+            fig = box_figure(
+                plot_df[numerical_col].to_numpy(), split_groups(plot_df[grouping_col] if grouping_col else None),
+                title + sampling_note(sample_info), numerical_col, grouping_col, kind=plotly_type,
+                stats=stats, density=density)
+
+        return with_axis_titles(fig, "數值", "頻率" if plotly_type == 'histogram' else "數值分布")
+
+    except Exception as e:
+        print(f"生成圖表時發生錯誤：{e}")
+        return message_figure(f"錯誤：{e}")
+
+
+def distribution_static_src(data_version, df, profile, numerical_col, grouping_col, view_mode):
+    if view_mode != 'static' or df is None or numerical_col is None:
+        return BLANK_IMAGE
+
+    try:
+        def build():
             # Check unique values for grouping variable
-            if grouping_col and df[grouping_col].dtype in ['object', 'category'] and df[grouping_col].nunique() > MAX_UNIQUE_GROUP_CATEGORIES:
+            if too_many_levels(profile, grouping_col, MAX_UNIQUE_GROUP_CATEGORIES):
                 warning_message = f"分組變數 '{grouping_col}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，\n不適合分組繪圖。"
-                fig_warn, ax_warn = plt.subplots(figsize=(8, 2), tight_layout=True)
-                ax_warn.text(0.5, 0.5, warning_message, ha='center', va='center', fontsize=12, color='red')
-                ax_warn.axis('off')
-                buf = BytesIO()
-                fig_warn.savefig(buf, format="png")
-                buf.seek(0)
-                data = base64.b64encode(buf.getvalue()).decode("utf8")
-                plt.close(fig_warn)
-                return f"data:image/png;base64,{data}"
-
-            plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']  # 設置中文字體
-            plt.rcParams['axes.unicode_minus'] = False  # 解決負號顯示問題
-            
-            fig_static, ax = plt.subplots(figsize=(8, 5), tight_layout=True)
-            sns.histplot(data=df, x=numerical_col, hue=grouping_col, kde=True, ax=ax)
-            
+                return message_chart(warning_message)
+
             title = f"{numerical_col} 的分布"
             if grouping_col:
                 title += f"\n依據 {grouping_col} 分組"
-            
-            ax.set_title(title)
-            ax.set_xlabel("數值")
-            ax.set_ylabel("頻率")
-
-            buf = BytesIO()
-            fig_static.savefig(buf, format="png")
-            buf.seek(0)
-            data = base64.b64encode(buf.getvalue()).decode("utf8")
-            plt.close(fig_static)
-            return f"data:image/png;base64,{data}"
 
-        except Exception as e:
-            print(f"生成靜態圖表時發生錯誤：{e}")
-            error_message = f"錯誤：{e}"
-            # Return an SVG error placeholder
-            return f"data:image/svg+xml;charset=utf-8,%3Csvg xmlns='http://www.w3.org/2000/svg' width='300' height='100'%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' font-size='10px' fill='red'%3E{error_message}%3C/text%3E%3C/svg%3E"
-        finally:
-            # Ensure Matplotlib figure is closed
-            if 'fig_static' in locals() and fig_static:
-                 plt.close(fig_static)
-
-    # Callback to populate dropdowns based on stored data
-    @app.callback(
-        [Output('dist-numerical-dropdown', 'options'),
-         Output('dist-grouping-dropdown', 'options'),
-         Output('dist-numerical-dropdown', 'value'),
-         Output('dist-grouping-dropdown', 'value')],
-        [Input('filtered-data-store', 'data')] # Changed from stored-data to use filtered/latest data for dropdown population
-        # If you *really* want dropdowns to clear/reset on mode change, keep it,
-        # but usually dropdowns should just reflect the available data columns.
-    )
-    def update_distribution_dropdowns(stored_data_json):
-        default_return = ([], [], None, None) # Define default return tuple
+            # 只把繪圖需要的欄位交給繪圖行程
+            columns = [numerical_col] + ([grouping_col] if grouping_col else [])
+            spec = {'numerical_col': numerical_col, 'grouping_col': grouping_col, 'title': title, 'figsize': (8, 5)}
+            return draw_static_distribution, spec, {'data': df[columns]}
 
-        if not stored_data_json:
-            print("update_distribution_dropdowns: No stored data.")
-            return default_return
+        params = {'numerical_col': numerical_col, 'grouping_col': grouping_col}
+        return cached_static_chart('distribution', data_version, params, build)
 
-        try:
-            print("update_distribution_dropdowns: Reading stored data.")
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+    except Exception as e:
+        print(f"生成靜態圖表時發生錯誤：{e}")
+        # Return an SVG error placeholder
+        return error_image(f"錯誤：{e}")
 
-            if df.empty:
-                 print("update_distribution_dropdowns: DataFrame is empty.")
-                 return default_return
 
-            # Use numpy for robust numeric check
-            numeric_cols = df.select_dtypes(include=np.number).columns
-            categorical_cols = df.select_dtypes(include=['object', 'category']).columns
+def distribution_code_snippets(df, numerical_col, grouping_col, plotly_type, view_mode):
+    if df is None or numerical_col is None:
+        msg = "請先選擇數值欄位"
+        return msg, msg
 
-            # 過濾唯一值超過門檻的類別變數
-            categorical_cols = [
-                col for col in categorical_cols
-                if df[col].nunique() <= MAX_UNIQUE_GROUP_CATEGORIES
-            ]
+    # Plotly code generation
+    plotly_func = {
+        'histogram': 'px.histogram',
+        'box': 'px.box',
+        'violin': 'px.violin'
+    }.get(plotly_type, 'px.histogram')
 
-            numerical_options = [{'label': f"{col} (numeric)", 'value': col} for col in numeric_cols]
-            grouping_options = []
-            for col in categorical_cols:
-                 # Check dtype more robustly
-                dtype_str = 'category' if pd.api.types.is_categorical_dtype(df[col]) else 'object'
-                grouping_options.append({'label': f"{col} ({dtype_str})", 'value': col})
+    plotly_params = f"df, "
+    if plotly_type == 'histogram':
+        plotly_params += f"x='{numerical_col}'"
+        if grouping_col:
+            plotly_params += f", color='{grouping_col}'"
+        plotly_params += ", title=''"
+        plotly_params += ", marginal='rug', hover_data=df.columns"
+    else:
+        if grouping_col:
+            plotly_params += f"x='{grouping_col}', y='{numerical_col}', color='{grouping_col}'"
+        else:
+            plotly_params += f"y='{numerical_col}'"
+        plotly_params += ", title=''"
+        if plotly_type == 'violin':
+            plotly_params += ", box=True, points='all'"
+        elif plotly_type == 'box':
+            plotly_params += ", points='all'"
+
+    plotly_code = f"""```python
+import plotly.express as px
 
-            # Set default safely
-            default_numerical = numeric_cols[0] if not numeric_cols.empty else None
+fig = {plotly_func}({plotly_params})
+fig.show()
+```"""
 
-            print("update_distribution_dropdowns: Success.")
-            return numerical_options, grouping_options, default_numerical, None
+    # Static (Seaborn) code generation
+    static_code = f"""```python
+import seaborn as sns
+import matplotlib.pyplot as plt
 
+plt.figure(figsize=(8,5))
+sns.histplot(data=df, x='{numerical_col}'"""
+    if grouping_col:
+        static_code += f", hue='{grouping_col}'"
+    static_code += ", kde=True)\n"
+    static_code += """plt.title('')\nplt.xlabel('數值')\nplt.ylabel('頻率')\nplt.show()\n```"""
+
+    if view_mode == 'dynamic':
+        return plotly_code, ""
+    elif view_mode == 'static':
+        return "", static_code
+    else:
+        return "", ""
+
+def register_callbacks(app):
+    # 切換檢視只改 CSS display，在瀏覽器端執行 (assets/clientside.js)，不需往返伺服器
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleViewWithControls'),
+        [Output('distribution-plotly-graph', 'style'),
+         Output('distribution-static-img', 'style'),
+         Output('plotly-type-div', 'style')],
+        [Input('dist-view-mode-radio', 'value')]
+    )
+
+    # 單一計算回調：選單、動態圖表、靜態圖片與程式碼片段共用一次資料解析 (utils/page_compute.py)
+    @app.callback(
+        [Output('dist-numerical-dropdown', 'options'),
+         Output('dist-grouping-dropdown', 'options'),
+         Output('dist-numerical-dropdown', 'value'),
+         Output('dist-grouping-dropdown', 'value'),
+         Output('distribution-plotly-graph', 'figure'),
+         Output('distribution-static-img', 'src'),
+         Output('dynamic-code-block', 'children'),
+         Output('static-code-block', 'children'),
+         Output('dist-render-state', 'data')],
+        [Input('filtered-data-store', 'data'), # Changed from stored-data to use filtered/latest data
+         Input('dist-numerical-dropdown', 'value'),
+         Input('dist-grouping-dropdown', 'value'),
+         Input('dist-plotly-type-dropdown', 'value'),
+         Input('dist-view-mode-radio', 'value')],
+        [State('dist-render-state', 'data')]
+    )
+    @cancellable(unless_triggered_by=[DATA_INPUT])
+    def update_distribution_page(stored_data_json, numerical_col, grouping_col, plotly_type, view_mode, render_state):
+        try:
+            data_version = dataset_version(stored_data_json)
+            df = read_stored_dataframe(stored_data_json, data_version)
+            profile = column_profile(data_version, df) if df is not None else None
         except Exception as e:
-            print(f"Error updating distribution dropdowns: {e}")
-            return default_return # Return default tuple on error
+            print(f"讀取資料時發生錯誤：{e}")
+            return [], [], None, None, message_figure(f"錯誤：{e}"), error_image(f"錯誤：{e}"), "", "", None
+
+        # 資料變動時重設選單，並直接以新的預設值繪圖
+        render_state = dict(render_state or {})
+        dropdowns = (dash.no_update,) * 4
+        if needs_render(render_state, 'dropdowns', data_version):
+            dropdowns = distribution_dropdowns(df, profile)
+            numerical_col, grouping_col = dropdowns[2], dropdowns[3]
+
+        # 只重新計算繪製輸入已改變的輸出 (動態圖表隱藏時保留，切回動態檢視且輸入不同時再重建)
+        figure = dash.no_update
+        if view_mode == 'dynamic' and needs_render(render_state, 'figure', data_version, numerical_col, grouping_col, plotly_type):
+            figure = distribution_figure(data_version, df, profile, numerical_col, grouping_col, plotly_type, view_mode)
+        static_src = dash.no_update
+        if needs_render(render_state, 'static', data_version, numerical_col, grouping_col, view_mode):
+            static_src = distribution_static_src(data_version, df, profile, numerical_col, grouping_col, view_mode)
+        code_blocks = distribution_code_snippets(df, numerical_col, grouping_col, plotly_type, view_mode)
+        return (*dropdowns, figure, static_src, *code_blocks, render_state)
 
     # --- Callback to update filter status display on this page ---
     @app.callback(
@@ -285,81 +329,11 @@ def register_callbacks(app):
         
         return "目前未套用篩選條件。"
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleCodeSections'),
         [Output('dynamic-code-section', 'style'),
          Output('static-code-section', 'style')],
         [Input('dist-view-mode-radio', 'value')]
     )
-    def toggle_code_section_visibility(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}
-        elif view_mode == 'static':
-            return {'display': 'none'}, {'display': 'block'}
-        return {'display': 'block'}, {'display': 'none'} # Default to showing dynamic
-
-    @app.callback(
-        [Output('dynamic-code-block', 'children'),
-         Output('static-code-block', 'children')],
-        [Input('filtered-data-store', 'data'),
-         Input('dist-numerical-dropdown', 'value'),
-         Input('dist-grouping-dropdown', 'value'),
-         Input('dist-plotly-type-dropdown', 'value'),
-         Input('dist-view-mode-radio', 'value')]
-    )
-    def update_code_snippets(stored_data_json, numerical_col, grouping_col, plotly_type, view_mode):
-        if stored_data_json is None or numerical_col is None:
-            msg = "請先選擇數值欄位"
-            return msg, msg
-
-        # Plotly code generation
-        plotly_func = {
-            'histogram': 'px.histogram',
-            'box': 'px.box',
-            'violin': 'px.violin'
-        }.get(plotly_type, 'px.histogram')
-
-        plotly_params = f"df, "
-        if plotly_type == 'histogram':
-            plotly_params += f"x='{numerical_col}'"
-            if grouping_col:
-                plotly_params += f", color='{grouping_col}'"
-            plotly_params += ", title=''"
-            plotly_params += ", marginal='rug', hover_data=df.columns"
-        else:
-            if grouping_col:
-                plotly_params += f"x='{grouping_col}', y='{numerical_col}', color='{grouping_col}'"
-            else:
-                plotly_params += f"y='{numerical_col}'"
-            plotly_params += ", title=''"
-            if plotly_type == 'violin':
-                plotly_params += ", box=True, points='all'"
-            elif plotly_type == 'box':
-                plotly_params += ", points='all'"
-
-        plotly_code = f"""```python
-import plotly.express as px
-
-fig = {plotly_func}({plotly_params})
-fig.show()
-```"""
-
-        # Static (Seaborn) code generation
-        static_code = f"""```python
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-plt.figure(figsize=(8,5))
-sns.histplot(data=df, x='{numerical_col}'"""
-        if grouping_col:
-            static_code += f", hue='{grouping_col}'"
-        static_code += ", kde=True)\n"
-        static_code += """plt.title('')\nplt.xlabel('數值')\nplt.ylabel('頻率')\nplt.show()\n```"""
-
-        if view_mode == 'dynamic':
-            return plotly_code, ""
-        elif view_mode == 'static':
-            return "", static_code
-        else:
-            return "", ""
 
 # NOTE: No 'if __name__ == "__main__":' block here
@@ -1,19 +1,21 @@
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
+from dash import dcc, html, Input, Output, State, ClientsideFunction
 import pandas as pd
 import numpy as np
 import io
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
 import base64
 import dash_bootstrap_components as dbc
-
-# Configure Matplotlib to use 'Agg' backend
-import matplotlib
-matplotlib.use('Agg')
+from utils.cache import dataset_version, read_stored_dataframe
+from utils.cancellation import cancellable
+from utils.categorical import (CROSSTAB_NORMALIZE_OPTIONS, MAX_TOP_N, OTHER_LABEL, count_levels, get_crosstab,
+                               normalize_top_n)
+from utils.correlation import (ANNOTATE_MAX_VARS, CORR_DISPLAY_OPTIONS, CORR_METHOD_LABELS, CORR_METHOD_OPTIONS,
+                               CORR_ORDER_OPTIONS, DEFAULT_TOP_K, MAX_TOP_K, kendall_note, normalize_top_k,
+                               order_correlation, select_correlation, top_pairs)
+from utils.fast_figure import colored_hbar_figure, heatmap_figure, message_figure, warning_figure, with_axis_titles
+from utils.page_compute import DATA_INPUT, column_profile, needs_render
+from utils.render import BLANK_IMAGE, cached_static_chart, error_image, message_chart
 
 # --- Layout Definition ---
 layout = html.Div([
@@ -41,6 +43,30 @@ layout = html.Div([
             multi=True,
             placeholder="選擇數值變數..."
         ),
+        html.Label("相關係數："),
+        dcc.RadioItems(
+            id='heatmap-corr-method-radio',
+            options=CORR_METHOD_OPTIONS,
+            value='pearson',
+            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+        ),
+        html.Label("變數排序："),
+        dcc.RadioItems(
+            id='heatmap-order-radio',
+            options=CORR_ORDER_OPTIONS,
+            value='original',
+            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+        ),
+        html.Label("顯示方式："),
+        dcc.RadioItems(
+            id='heatmap-corr-display-radio',
+            options=CORR_DISPLAY_OPTIONS,
+            value='matrix',
+            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+        ),
+        html.Label("K (最強變數對數量)："),
+        dcc.Input(id='heatmap-topk-input', type='number', min=1, max=MAX_TOP_K, step=1,
+                  value=DEFAULT_TOP_K, debounce=True),
     ], id='numeric-dropdown-div'),
 
     html.Div([
@@ -57,6 +83,21 @@ layout = html.Div([
             id='heatmap-cat2-dropdown',
             placeholder="選擇第二個類別變數..."
         ),
+        html.Label(f"Top-N 模式（保留出現最多的 N 個類別，其餘合併為「{OTHER_LABEL}」，留空則不使用）："),
+        dcc.Input(id='heatmap-topn-input', type='number', min=1, max=MAX_TOP_N, step=1,
+                  placeholder="例如: 10", debounce=True),
+        html.Label("儲存格數值："),
+        dcc.RadioItems(
+            id='heatmap-crosstab-normalize-radio',
+            options=CROSSTAB_NORMALIZE_OPTIONS,
+            value='none',
+            labelStyle={'display': 'inline-block', 'margin-right': '10px'}
+        ),
+        html.Label("加權數值變數 (可選，顯示總和而非筆數)："),
+        dcc.Dropdown(
+            id='heatmap-crosstab-value-dropdown',
+            placeholder="選擇數值變數..."
+        ),
     ], id='cat2-dropdown-div', style={'display': 'none'}),
 
     html.Div([
@@ -77,7 +118,8 @@ layout = html.Div([
 
     html.Div([
         dcc.Graph(id='heatmap-plotly-graph', style={'display': 'block'}),
-        html.Img(id='heatmap-static-img', style={'display': 'none', 'maxWidth': '100%'})
+        html.Img(id='heatmap-static-img', style={'display': 'none', 'maxWidth': '100%'}),
+        dcc.Store(id='heatmap-render-state') # 目前的圖表 / 圖片由哪些輸入繪製 (utils/page_compute.py)
     ]),
 
     # Section for Dynamic Code Snippet
@@ -109,295 +151,287 @@ layout = html.Div([
     ])
 ])
 
-def register_callbacks(app):
-    @app.callback(
-        [Output('numeric-dropdown-div', 'style'),
-         Output('cat1-dropdown-div', 'style'),
-         Output('cat2-dropdown-div', 'style')],
-        Input('heatmap-mode-radio', 'value')
-    )
-    def toggle_dropdowns(mode):
+# --- 輔助函式：交叉表標題與格式 ---
+CROSSTAB_NORMALIZE_LABELS = {option['value']: option['label'] for option in CROSSTAB_NORMALIZE_OPTIONS}
+
+def crosstab_title(cat1, cat2, top_n, value_col, normalize):
+    title = f"{cat1} 與 {cat2} 的交叉表熱力圖"
+    details = [f"Top {top_n}"] if top_n else []
+    if value_col:
+        details.append(f"{value_col} 總和")
+    if normalize in ('index', 'columns', 'all'):
+        details.append(CROSSTAB_NORMALIZE_LABELS[normalize])
+    return title + (f" ({'，'.join(details)})" if details else "")
+
+def crosstab_format(value_col, normalize):
+    """Cell number format: integers for plain counts, percentages when normalized."""
+    if normalize in ('index', 'columns', 'all'):
+        return '.1%'
+    return '.2f' if value_col else 'd'
+
+# --- 輔助函式：相關矩陣 (由快取切片並排序) ---
+def correlation_view(data_version, df, numeric_cols, method, order):
+    """Selected correlation sub-matrix (cached engine) in the requested order."""
+    method = method if method in CORR_METHOD_LABELS else 'pearson'
+    corr_df = select_correlation(data_version, df, numeric_cols, method)
+    return order_correlation(data_version, corr_df, order, method)
+
+def correlation_label(df, corr_df, method):
+    """'(method)' for chart titles, plus a note when Kendall is computed on a row sample."""
+    label = f"({CORR_METHOD_LABELS.get(method, 'Pearson')})"
+    return label + kendall_note(df, corr_df.index) if method == 'kendall' else label
+
+def pair_labels(pairs):
+    return pairs['變數 1'].astype(str) + " × " + pairs['變數 2'].astype(str)
+
+# --- 靜態圖表繪製 (於繪圖行程中執行) ---
+def draw_static_heatmap(ax, spec, frames):
+    # 延遲載入：只有繪圖行程需要
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    table = frames['table']
+    if spec['kind'] == 'top_pairs':
+        colors = plt.cm.RdBu((table['相關係數'].to_numpy() + 1) / 2)
+        ax.barh(table['變數對'][::-1], table['相關係數'].to_numpy()[::-1], color=colors[::-1])
+        ax.set_xlim(-1, 1)
+        ax.axvline(0, color='gray', linewidth=0.8)
+        ax.set_xlabel("相關係數")
+    else:
+        sns.heatmap(table, annot=spec['annot'], fmt=spec['fmt'], cmap='Blues', ax=ax)
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
+        plt.setp(ax.get_yticklabels(), rotation=0)
+    ax.set_title(spec['title'])
+
+# --- 頁面輸出 (由單一計算回調呼叫，資料已解析) ---
+def heatmap_dropdowns(df, profile):
+    """(numeric options, default numeric selection, cat1 / cat2 options, crosstab value options) for a dataset."""
+    if df is None or df.empty:
+        return [], None, [], [], []
+
+    numeric_cols = profile['numeric']
+    numeric_options = [{'label': f"{col} (numeric)", 'value': col} for col in numeric_cols]
+    cat_options = []
+    for col in profile['categorical']:
+        dtype_str = 'category' if isinstance(df[col].dtype, pd.CategoricalDtype) else 'object'
+        cat_options.append({'label': f"{col} ({dtype_str})", 'value': col})
+
+    # 欄位很多時預設只選前 ANNOTATE_MAX_VARS 個，不一開始就計算並傳送數百 × 數百的矩陣；其餘可自行加入或改看最強變數對
+    default_numeric = list(numeric_cols[:ANNOTATE_MAX_VARS]) if numeric_cols else None
+    return numeric_options, default_numeric, cat_options, cat_options, numeric_options
+
+
+def heatmap_plotly_figure(data_version, df, mode, numeric_cols, method, order, display, top_k, cat1, cat2, top_n, normalize, value_col, view_mode):
+    if view_mode != 'dynamic':
+        return dash.no_update # 動態圖表隱藏中，切回動態檢視時若繪製輸入已改變再重建
+    if df is None:
+        return message_figure("請選擇動態檢視")
+
+    try:
         if mode == 'numeric':
-            return {'display': 'block'}, {'display': 'none'}, {'display': 'none'}
-        else:
-            return {'display': 'none'}, {'display': 'block'}, {'display': 'block'}
-
-    @app.callback(
-        [Output('heatmap-plotly-graph', 'style'),
-         Output('heatmap-static-img', 'style')],
-        Input('heatmap-plot-type-radio', 'value')
-    )
-    def toggle_heatmap_view(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}
-        else:
-            return {'display': 'none'}, {'display': 'block', 'maxWidth': '100%'}
-
-    @app.callback(
-        [Output('heatmap-numeric-dropdown', 'options'),
-         Output('heatmap-numeric-dropdown', 'value'),
-         Output('heatmap-cat1-dropdown', 'options'),
-         Output('heatmap-cat2-dropdown', 'options')],
-        Input('filtered-data-store', 'data')
-    )
-    def update_dropdown_options(stored_data_json):
-        default_return = ([], None, [], [])
-        if not stored_data_json:
-            return default_return
-
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
-            if df.empty:
-                return default_return
-
-            numeric_cols = df.select_dtypes(include=np.number).columns
-            categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-
-            numeric_options = [{'label': f"{col} (numeric)", 'value': col} for col in numeric_cols]
-            cat_options = []
-            for col in categorical_cols:
-                dtype_str = 'category' if pd.api.types.is_categorical_dtype(df[col]) else 'object'
-                cat_options.append({'label': f"{col} ({dtype_str})", 'value': col})
-
-            default_numeric = numeric_cols.tolist() if not numeric_cols.empty else None
-
-            return numeric_options, default_numeric, cat_options, cat_options
-
-        except Exception as e:
-            print(f"Error updating dropdowns: {e}")
-            return default_return
-
-    @app.callback(
-        Output('heatmap-plotly-graph', 'figure'),
-        [Input('filtered-data-store', 'data'),
-         Input('heatmap-mode-radio', 'value'),
-         Input('heatmap-numeric-dropdown', 'value'),
-         Input('heatmap-cat1-dropdown', 'value'),
-         Input('heatmap-cat2-dropdown', 'value'),
-         Input('heatmap-plot-type-radio', 'value')]
-    )
-    def update_plotly_heatmap(stored_data_json, mode, numeric_cols, cat1, cat2, view_mode):
-        if view_mode != 'dynamic' or stored_data_json is None:
-            return px.scatter(title="請選擇動態檢視")
-
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
-
+            if not numeric_cols or len(numeric_cols) < 2:
+                return message_figure("請選擇至少兩個數值變數")
+            corr_df = correlation_view(data_version, df, numeric_cols, method, order)
+            method_label = correlation_label(df, corr_df, method)
+            if display == 'top_pairs':
+                top_k = normalize_top_k(top_k)
+                pairs = top_pairs(corr_df, top_k)
+                pairs['變數對'] = pair_labels(pairs)
+                pairs = pairs.iloc[::-1]
+                fig = colored_hbar_figure(pairs['相關係數'], pairs['變數對'],
+                                          f"相關性最強的 {len(pairs)} 組變數對 {method_label}", '相關係數', '變數對')
+                fig['layout'].update(xaxis={**fig['layout']['xaxis'], 'range': [-1, 1]}, height=max(400, 28 * len(pairs)))
+                return with_axis_titles(fig)
+
+            fig = heatmap_figure(
+                corr_df,
+                f"變數間的相關性熱力圖 {method_label}",
+                "相關係數",
+                colorscale="Blues",
+                text_format='.2f' if len(corr_df) <= ANNOTATE_MAX_VARS else None # 變數過多時不標示數值
+            )
+            return with_axis_titles(fig, "變數", "變數")
+
+        else:  # categorical mode
+            if not cat1 or not cat2:
+                return message_figure("請選擇兩個類別變數")
+            top_n = normalize_top_n(top_n)
+            max_levels = max(20, top_n + 1) if top_n else 20 # Top-N 分桶後最多 N+1 個類別
+            nunique1 = min(count_levels(data_version, df, cat1), top_n + 1 if top_n else np.inf)
+            nunique2 = min(count_levels(data_version, df, cat2), top_n + 1 if top_n else np.inf)
+            if nunique1 > max_levels or nunique2 > max_levels:
+                warning_message = f"類別變數 '{cat1}' 或 '{cat2}' 的唯一值超過 20 個，不適合繪製交叉表。可使用 Top-N 模式。"
+                return warning_figure(warning_message)
+
+            ct = get_crosstab(data_version, df, cat1, cat2, top_n, value_col, normalize)
+            fig = heatmap_figure(
+                ct,
+                crosstab_title(cat1, cat2, top_n, value_col, normalize),
+                f"{value_col} 總和" if value_col else "計數",
+                colorscale="Blues",
+                text_format=crosstab_format(value_col, normalize)
+            )
+            return with_axis_titles(fig, cat2, cat1)
+
+    except Exception as e:
+        print(f"生成圖表時發生錯誤：{e}")
+        return message_figure(f"錯誤：{e}")
+
+
+def heatmap_static_src(data_version, df, mode, numeric_cols, method, order, display, top_k, cat1, cat2, top_n, normalize, value_col, view_mode):
+    if view_mode != 'static' or df is None:
+        return BLANK_IMAGE
+
+    try:
+        def build():
             if mode == 'numeric':
                 if not numeric_cols or len(numeric_cols) < 2:
-                    return px.scatter(title="請選擇至少兩個數值變數")
-                corr_df = df[numeric_cols].corr()
-                fig = px.imshow(
-                    corr_df,
-                    title="變數間的相關性熱力圖",
-                    labels=dict(color="相關係數"),
-                    color_continuous_scale="Blues",
-                    aspect="auto"
-                )
-                fig.update_layout(
-                    transition_duration=300,
-                    xaxis_title="變數",
-                    yaxis_title="變數"
-                )
-                return fig
-
-            else:  # categorical mode
-                if not cat1 or not cat2:
-                    return px.scatter(title="請選擇兩個類別變數")
-                nunique1 = df[cat1].nunique()
-                nunique2 = df[cat2].nunique()
-                if nunique1 > 20 or nunique2 > 20:
-                    warning_message = f"類別變數 '{cat1}' 或 '{cat2}' 的唯一值超過 20 個，不適合繪製交叉表。"
-                    fig = go.Figure()
-                    fig.add_annotation(
-                        text=warning_message, xref="paper", yref="paper",
-                        x=0.5, y=0.5, showarrow=False, font=dict(size=14)
-                    )
-                    fig.update_layout(title="警告", xaxis={'visible': False}, yaxis={'visible': False}, plot_bgcolor='white')
-                    return fig
-
-                ct = pd.crosstab(df[cat1], df[cat2])
-                fig = px.imshow(
-                    ct,
-                    text_auto=True,
-                    labels=dict(color="計數"),
-                    title=f"{cat1} 與 {cat2} 的交叉表熱力圖",
-                    aspect="auto",
-                    color_continuous_scale="Blues"
-                )
-                fig.update_layout(
-                    transition_duration=300,
-                    xaxis_title=cat2,
-                    yaxis_title=cat1
-                )
-                return fig
-
-        except Exception as e:
-            print(f"生成圖表時發生錯誤：{e}")
-            return px.scatter(title=f"錯誤：{e}")
-
-    @app.callback(
-        Output('heatmap-static-img', 'src'),
-        [Input('filtered-data-store', 'data'),
-         Input('heatmap-mode-radio', 'value'),
-         Input('heatmap-numeric-dropdown', 'value'),
-         Input('heatmap-cat1-dropdown', 'value'),
-         Input('heatmap-cat2-dropdown', 'value'),
-         Input('heatmap-plot-type-radio', 'value')]
-    )
-    def update_static_heatmap(stored_data_json, mode, numeric_cols, cat1, cat2, view_mode):
-        if view_mode != 'static' or stored_data_json is None:
-            return "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+                    return message_chart("請選擇至少兩個數值變數", figsize=(6, 2))
+
+                corr_df = correlation_view(data_version, df, numeric_cols, method, order)
+                method_label = correlation_label(df, corr_df, method)
+                if display == 'top_pairs':
+                    pairs = top_pairs(corr_df, normalize_top_k(top_k))
+                    pairs['變數對'] = pair_labels(pairs)
+                    spec = {'kind': 'top_pairs', 'title': f"相關性最強的 {len(pairs)} 組變數對 {method_label}",
+                            'figsize': (10, max(4, 0.35 * len(pairs))), 'bbox_inches': 'tight'}
+                    return draw_static_heatmap, spec, {'table': pairs}
+                spec = {'kind': 'matrix', 'annot': len(corr_df) <= ANNOTATE_MAX_VARS, 'fmt': '.2g',
+                        'title': f"變數間的相關性熱力圖 {method_label}", 'figsize': (10, 8), 'bbox_inches': 'tight'}
+                return draw_static_heatmap, spec, {'table': corr_df}
+
+            if not cat1 or not cat2:
+                return message_chart("請選擇兩個類別變數", figsize=(6, 2))
+
+            top_n_value = normalize_top_n(top_n)
+            max_levels = max(20, top_n_value + 1) if top_n_value else 20
+            nunique1 = min(count_levels(data_version, df, cat1), top_n_value + 1 if top_n_value else np.inf)
+            nunique2 = min(count_levels(data_version, df, cat2), top_n_value + 1 if top_n_value else np.inf)
+            if nunique1 > max_levels or nunique2 > max_levels:
+                warning_message = f"類別變數 '{cat1}' 或 '{cat2}' 的唯一值超過 20 個，\n不適合繪製交叉表。"
+                return message_chart(warning_message)
+
+            ct = get_crosstab(data_version, df, cat1, cat2, top_n_value, value_col, normalize)
+            spec = {'kind': 'matrix', 'annot': True, 'fmt': crosstab_format(value_col, normalize),
+                    'title': crosstab_title(cat1, cat2, top_n_value, value_col, normalize),
+                    'figsize': (10, 8), 'bbox_inches': 'tight'}
+            return draw_static_heatmap, spec, {'table': ct}
 
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+        if mode == 'numeric':
+            params = {'mode': mode, 'numeric_cols': numeric_cols, 'method': method, 'order': order,
+                      'display': display, 'top_k': normalize_top_k(top_k) if display == 'top_pairs' else None}
+        else:
+            params = {'mode': mode, 'cat1': cat1, 'cat2': cat2, 'top_n': normalize_top_n(top_n),
+                      'normalize': normalize, 'value_col': value_col}
+        return cached_static_chart('heatmap', data_version, params, build)
 
-            plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
-            plt.rcParams['axes.unicode_minus'] = False
+    except Exception as e:
+        print(f"Error generating static heatmap: {e}")
+        return error_image(f"Error: {e}")
 
-            if mode == 'numeric':
-                if not numeric_cols or len(numeric_cols) < 2:
-                    fig_warn, ax_warn = plt.subplots(figsize=(6, 2))
-                    ax_warn.text(0.5, 0.5, "請選擇至少兩個數值變數", ha='center', va='center', fontsize=12, color='red')
-                    ax_warn.axis('off')
-                    buf = BytesIO()
-                    fig_warn.savefig(buf, format="png")
-                    buf.seek(0)
-                    data = base64.b64encode(buf.getvalue()).decode("utf8")
-                    plt.close(fig_warn)
-                    return f"data:image/png;base64,{data}"
-
-                corr_df = df[numeric_cols].corr()
-                fig_static, ax = plt.subplots(figsize=(10, 8), tight_layout=True)
-                sns.heatmap(corr_df, annot=True, cmap='Blues', ax=ax)
-                ax.set_title("變數間的相關性熱力圖")
-                plt.xticks(rotation=45, ha='right')
-                plt.yticks(rotation=0)
 
-            else:
-                if not cat1 or not cat2:
-                    fig_warn, ax_warn = plt.subplots(figsize=(6, 2))
-                    ax_warn.text(0.5, 0.5, "請選擇兩個類別變數", ha='center', va='center', fontsize=12, color='red')
-                    ax_warn.axis('off')
-                    buf = BytesIO()
-                    fig_warn.savefig(buf, format="png")
-                    buf.seek(0)
-                    data = base64.b64encode(buf.getvalue()).decode("utf8")
-                    plt.close(fig_warn)
-                    return f"data:image/png;base64,{data}"
-
-                nunique1 = df[cat1].nunique()
-                nunique2 = df[cat2].nunique()
-                if nunique1 > 20 or nunique2 > 20:
-                    warning_message = f"類別變數 '{cat1}' 或 '{cat2}' 的唯一值超過 20 個，\n不適合繪製交叉表。"
-                    fig_warn, ax_warn = plt.subplots(figsize=(8, 2), tight_layout=True)
-                    ax_warn.text(0.5, 0.5, warning_message, ha='center', va='center', fontsize=12, color='red')
-                    ax_warn.axis('off')
-                    buf = BytesIO()
-                    fig_warn.savefig(buf, format="png")
-                    buf.seek(0)
-                    data = base64.b64encode(buf.getvalue()).decode("utf8")
-                    plt.close(fig_warn)
-                    return f"data:image/png;base64,{data}"
-
-                ct = pd.crosstab(df[cat1], df[cat2])
-                fig_static, ax = plt.subplots(figsize=(10, 8), tight_layout=True)
-                sns.heatmap(ct, annot=True, fmt='d', cmap='Blues', ax=ax)
-                ax.set_title(f"{cat1} 與 {cat2} 的交叉表熱力圖")
-                plt.xticks(rotation=45, ha='right')
-                plt.yticks(rotation=0)
-
-            buf = BytesIO()
-            fig_static.savefig(buf, format="png", bbox_inches='tight')
-            buf.seek(0)
-            data = base64.b64encode(buf.getvalue()).decode("utf8")
-            plt.close(fig_static)
-            return f"data:image/png;base64,{data}"
+def heatmap_code_snippets(df, mode, numeric_cols, method, order, display, top_k, cat1, cat2, top_n, normalize, value_col, view_mode):
+    if df is None:
+        msg = "請先上傳資料"
+        return msg, msg
 
-        except Exception as e:
-            print(f"Error generating static heatmap: {e}")
-            error_message = f"Error: {e}"
-            return f"data:image/svg+xml;charset=utf-8,%3Csvg xmlns='http://www.w3.org/2000/svg' width='300' height='100'%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' font-size='10px' fill='red'%3E{error_message}%3C/text%3E%3C/svg%3E"
+    dynamic_code = "```python\n# 動態圖表程式碼生成失敗\n```"
+    static_code = "```python\n# 靜態圖表程式碼生成失敗\n```"
 
-    @app.callback(
-        Output('heatmap-filter-status-display', 'children'),
-        Input('filter-status-message-store', 'data')
+    try:
+        if mode == 'numeric':
+            if not numeric_cols or len(numeric_cols) < 2:
+                msg = "請選擇至少兩個數值變數"
+                return msg, msg
+
+            numeric_cols_str = str(numeric_cols) # Convert list to string representation
+            method = method if method in CORR_METHOD_LABELS else 'pearson'
+            annotate = len(numeric_cols) <= ANNOTATE_MAX_VARS
+
+            # 階層聚類排序 (平均連結，距離 = 1 - |r|)
+            order_code = ""
+            if order == 'cluster':
+                order_code = """
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+    dist = 1 - corr_df.abs().fillna(0).to_numpy()
+    np.fill_diagonal(dist, 0)
+    leaves = leaves_list(linkage(squareform(dist, checks=False), method='average'))
+    corr_df = corr_df.iloc[leaves, leaves]
+"""
+
+            if display == 'top_pairs':
+                top_k = normalize_top_k(top_k)
+                pairs_code = f"""
+    # 取上三角 (不含對角線)，依 |r| 由大到小取前 K 組
+    mask = np.triu(np.ones(corr_df.shape, dtype=bool), k=1)
+    pairs = corr_df.where(mask).stack().rename('相關係數').reset_index()
+    pairs.columns = ['變數 1', '變數 2', '相關係數']
+    pairs = pairs.reindex(pairs['相關係數'].abs().sort_values(ascending=False).index).head({top_k})
+    pairs['變數對'] = pairs['變數 1'] + ' × ' + pairs['變數 2']
+"""
+                dynamic_plot_code = """    fig = px.bar(
+        pairs.iloc[::-1], x='相關係數', y='變數對', orientation='h',
+        color='相關係數', color_continuous_scale="RdBu", range_color=[-1, 1],
+        title=f"相關性最強的 {len(pairs)} 組變數對"
     )
-    def update_heatmap_filter_status(status_message):
-        if status_message:
-            return status_message
-        return "目前未套用篩選條件。"
-
-    @app.callback(
-        [Output('heatmap-dynamic-code-section', 'style'),
-         Output('heatmap-static-code-section', 'style')],
-        [Input('heatmap-plot-type-radio', 'value')]
+    fig.update_layout(xaxis_range=[-1, 1])
+    fig.show()"""
+                static_plot_code = """    plt.figure(figsize=(10, max(4, 0.35 * len(pairs))))
+    plt.barh(pairs['變數對'][::-1], pairs['相關係數'][::-1],
+             color=plt.cm.RdBu((pairs['相關係數'][::-1] + 1) / 2))
+    plt.xlim(-1, 1)
+    plt.axvline(0, color='gray', linewidth=0.8)
+    plt.xlabel("相關係數")
+    plt.title(f"相關性最強的 {len(pairs)} 組變數對")
+    plt.tight_layout()
+    plt.show()"""
+                order_code = "" # 變數對排序與矩陣順序無關
+            else:
+                pairs_code = ""
+                dynamic_plot_code = f"""    fig = px.imshow(
+        corr_df,
+        text_auto={"'.2f'" if annotate else False}, # 變數超過 {ANNOTATE_MAX_VARS} 個時不標示數值
+        title="變數間的相關性熱力圖",
+        labels=dict(color="相關係數"),
+        color_continuous_scale="Blues",
+        aspect="auto"
     )
-    def toggle_heatmap_code_section_visibility(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}
-        elif view_mode == 'static':
-            return {'display': 'none'}, {'display': 'block'}
-        return {'display': 'block'}, {'display': 'none'} # Default to showing dynamic
-
-    @app.callback(
-        [Output('heatmap-dynamic-code-block', 'children'),
-         Output('heatmap-static-code-block', 'children')],
-        [Input('filtered-data-store', 'data'),
-         Input('heatmap-mode-radio', 'value'),
-         Input('heatmap-numeric-dropdown', 'value'),
-         Input('heatmap-cat1-dropdown', 'value'),
-         Input('heatmap-cat2-dropdown', 'value'),
-         Input('heatmap-plot-type-radio', 'value')]
+    fig.update_layout(
+        xaxis_title="變數",
+        yaxis_title="變數"
     )
-    def update_heatmap_code_snippets(stored_data_json, mode, numeric_cols, cat1, cat2, view_mode):
-        if stored_data_json is None:
-            msg = "請先上傳資料"
-            return msg, msg
-
-        dynamic_code = "```python\n# 動態圖表程式碼生成失敗\n```"
-        static_code = "```python\n# 靜態圖表程式碼生成失敗\n```"
-
-        try:
-            if mode == 'numeric':
-                if not numeric_cols or len(numeric_cols) < 2:
-                    msg = "請選擇至少兩個數值變數"
-                    return msg, msg
-
-                numeric_cols_str = str(numeric_cols) # Convert list to string representation
+    fig.show()"""
+                static_plot_code = f"""    plt.figure(figsize=(10, 8))
+    sns.heatmap(corr_df, annot={annotate}, cmap='Blues')
+    plt.title("變數間的相關性熱力圖")
+    plt.xticks(rotation=45, ha='right')
+    plt.yticks(rotation=0)
+    plt.tight_layout()
+    plt.show()"""
 
-                # Dynamic Plotly Code (Numeric)
-                dynamic_code = f"""```python
+            # Dynamic Plotly Code (Numeric)
+            dynamic_code = f"""```python
 import plotly.express as px
 import pandas as pd
+import numpy as np
 
 # 假設 df 是您的 DataFrame
 # df = pd.read_csv('your_data.csv') # 或其他載入方式
 
 numeric_cols = {numeric_cols_str}
 if len(numeric_cols) >= 2:
-    corr_df = df[numeric_cols].corr()
-    fig = px.imshow(
-        corr_df,
-        title="變數間的相關性熱力圖",
-        labels=dict(color="相關係數"),
-        color_continuous_scale="Blues",
-        aspect="auto"
-    )
-    fig.update_layout(
-        xaxis_title="變數",
-        yaxis_title="變數"
-    )
-    fig.show()
+    corr_df = df[numeric_cols].corr(method='{method}')
+{order_code}{pairs_code}{dynamic_plot_code}
 else:
     print("請選擇至少兩個數值變數")
 ```"""
 
-                # Static Seaborn Code (Numeric)
-                static_code = f"""```python
+            # Static Seaborn Code (Numeric)
+            static_code = f"""```python
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
+import numpy as np
 
 # 假設 df 是您的 DataFrame
 # df = pd.read_csv('your_data.csv') # 或其他載入方式
@@ -406,25 +440,40 @@ import pandas as pd
 
 numeric_cols = {numeric_cols_str}
 if len(numeric_cols) >= 2:
-    corr_df = df[numeric_cols].corr()
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(corr_df, annot=True, cmap='Blues')
-    plt.title("變數間的相關性熱力圖")
-    plt.xticks(rotation=45, ha='right')
-    plt.yticks(rotation=0)
-    plt.tight_layout()
-    plt.show()
+    corr_df = df[numeric_cols].corr(method='{method}')
+{order_code}{pairs_code}{static_plot_code}
 else:
     print("請選擇至少兩個數值變數")
 ```"""
 
-            elif mode == 'categorical':
-                if not cat1 or not cat2:
-                    msg = "請選擇兩個類別變數"
-                    return msg, msg
-
-                # Dynamic Plotly Code (Categorical)
-                dynamic_code = f"""```python
+        elif mode == 'categorical':
+            if not cat1 or not cat2:
+                msg = "請選擇兩個類別變數"
+                return msg, msg
+
+            # Top-N 模式：保留出現最多的 N 個類別，其餘合併為「其他」
+            top_n = normalize_top_n(top_n)
+            top_n_code = ""
+            if top_n:
+                top_n_code = f"""
+top_n = {top_n}
+for col in [cat1, cat2]:
+    top_levels = df[col].value_counts().nlargest(top_n).index
+    df[col] = df[col].where(df[col].isin(top_levels) | df[col].isna(), '{OTHER_LABEL}')
+"""
+
+            # 加權總和與正規化 (列/欄/總百分比)
+            crosstab_args = ""
+            if value_col:
+                crosstab_args += f", values=df['{value_col}'], aggfunc='sum'"
+            if normalize in ('index', 'columns', 'all'):
+                crosstab_args += f", normalize='{normalize}'"
+            cell_format = crosstab_format(value_col, normalize)
+            color_label = f"{value_col} 總和" if value_col else "計數"
+            title = crosstab_title(cat1, cat2, top_n, value_col, normalize)
+
+            # Dynamic Plotly Code (Categorical)
+            dynamic_code = f"""```python
 import plotly.express as px
 import pandas as pd
 
@@ -438,13 +487,13 @@ cat2 = '{cat2}'
 # if df[cat1].nunique() > 20 or df[cat2].nunique() > 20:
 #     print(f"警告: 類別變數 '{cat1}' 或 '{cat2}' 的唯一值可能過多")
 # else:
-
-ct = pd.crosstab(df[cat1], df[cat2])
+{top_n_code}
+ct = pd.crosstab(df[cat1], df[cat2]{crosstab_args})
 fig = px.imshow(
     ct,
-    text_auto=True,
-    labels=dict(color="計數"),
-    title=f"{{cat1}} 與 {{cat2}} 的交叉表熱力圖",
+    text_auto='{cell_format}',
+    labels=dict(color="{color_label}"),
+    title="{title}",
     aspect="auto",
     color_continuous_scale="Blues"
 )
@@ -455,8 +504,8 @@ fig.update_layout(
 fig.show()
 ```"""
 
-                # Static Seaborn Code (Categorical)
-                static_code = f"""```python
+            # Static Seaborn Code (Categorical)
+            static_code = f"""```python
 import seaborn as sns
 import matplotlib.pyplot as plt
 import pandas as pd
@@ -473,31 +522,122 @@ cat2 = '{cat2}'
 # if df[cat1].nunique() > 20 or df[cat2].nunique() > 20:
 #     print(f"警告: 類別變數 '{cat1}' 或 '{cat2}' 的唯一值可能過多")
 # else:
-
-ct = pd.crosstab(df[cat1], df[cat2])
+{top_n_code}
+ct = pd.crosstab(df[cat1], df[cat2]{crosstab_args})
 plt.figure(figsize=(10, 8))
-sns.heatmap(ct, annot=True, fmt='d', cmap='Blues')
-plt.title(f"{{cat1}} 與 {{cat2}} 的交叉表熱力圖")
+sns.heatmap(ct, annot=True, fmt='{cell_format}', cmap='Blues')
+plt.title("{title}")
 plt.xticks(rotation=45, ha='right')
 plt.yticks(rotation=0)
 plt.tight_layout()
 plt.show()
 ```"""
-            else:
-                 msg = "未知的檢視類型"
-                 return msg, msg
+        else:
+             msg = "未知的檢視類型"
+             return msg, msg
+
+    except Exception as e:
+        print(f"Error generating code snippets: {e}")
+        error_msg = f"生成程式碼時發生錯誤: {e}"
+        return error_msg, error_msg
+
+    if view_mode == 'dynamic':
+        return dynamic_code, static_code # Return both, visibility handled by CSS
+    elif view_mode == 'static':
+        return dynamic_code, static_code # Return both, visibility handled by CSS
+    else:
+        return dynamic_code, static_code # Default case
+
+
+def register_callbacks(app):
+    # 切換檢視只改 CSS display，在瀏覽器端執行 (assets/clientside.js)，不需往返伺服器
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleHeatmapMode'),
+        [Output('numeric-dropdown-div', 'style'),
+         Output('cat1-dropdown-div', 'style'),
+         Output('cat2-dropdown-div', 'style')],
+        Input('heatmap-mode-radio', 'value')
+    )
 
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleView'),
+        [Output('heatmap-plotly-graph', 'style'),
+         Output('heatmap-static-img', 'style')],
+        Input('heatmap-plot-type-radio', 'value')
+    )
+
+    # 單一計算回調：選單、動態圖表、靜態圖片與程式碼片段共用一次資料解析 (utils/page_compute.py)
+    @app.callback(
+        [Output('heatmap-numeric-dropdown', 'options'),
+         Output('heatmap-numeric-dropdown', 'value'),
+         Output('heatmap-cat1-dropdown', 'options'),
+         Output('heatmap-cat2-dropdown', 'options'),
+         Output('heatmap-crosstab-value-dropdown', 'options'),
+         Output('heatmap-plotly-graph', 'figure'),
+         Output('heatmap-static-img', 'src'),
+         Output('heatmap-dynamic-code-block', 'children'),
+         Output('heatmap-static-code-block', 'children'),
+         Output('heatmap-render-state', 'data')],
+        [Input('filtered-data-store', 'data'),
+         Input('heatmap-mode-radio', 'value'),
+         Input('heatmap-numeric-dropdown', 'value'),
+         Input('heatmap-corr-method-radio', 'value'),
+         Input('heatmap-order-radio', 'value'),
+         Input('heatmap-corr-display-radio', 'value'),
+         Input('heatmap-topk-input', 'value'),
+         Input('heatmap-cat1-dropdown', 'value'),
+         Input('heatmap-cat2-dropdown', 'value'),
+         Input('heatmap-topn-input', 'value'),
+         Input('heatmap-crosstab-normalize-radio', 'value'),
+         Input('heatmap-crosstab-value-dropdown', 'value'),
+         Input('heatmap-plot-type-radio', 'value')],
+        [State('heatmap-render-state', 'data')]
+    )
+    @cancellable(unless_triggered_by=[DATA_INPUT])
+    def update_heatmap_page(stored_data_json, mode, numeric_cols, method, order, display, top_k, cat1, cat2, top_n, normalize, value_col, view_mode, render_state):
+        try:
+            data_version = dataset_version(stored_data_json)
+            df = read_stored_dataframe(stored_data_json, data_version)
+            profile = column_profile(data_version, df) if df is not None else None
         except Exception as e:
-            print(f"Error generating code snippets: {e}")
-            error_msg = f"生成程式碼時發生錯誤: {e}"
-            return error_msg, error_msg
-
-        if view_mode == 'dynamic':
-            return dynamic_code, static_code # Return both, visibility handled by CSS
-        elif view_mode == 'static':
-            return dynamic_code, static_code # Return both, visibility handled by CSS
-        else:
-            return dynamic_code, static_code # Default case
+            print(f"讀取資料時發生錯誤：{e}")
+            return [], None, [], [], [], message_figure(f"錯誤：{e}"), error_image(f"錯誤：{e}"), "", "", None
+
+        # 資料變動時重設選單，並直接以新的預設值繪圖
+        render_state = dict(render_state or {})
+        dropdowns = (dash.no_update,) * 5
+        if needs_render(render_state, 'dropdowns', data_version):
+            dropdowns = heatmap_dropdowns(df, profile)
+            numeric_cols = dropdowns[1]
+
+        # 圖表與圖片依賴全部選項 (不含另一種檢視)，只在繪製輸入已改變時重新計算
+        params = (mode, numeric_cols, method, order, display, top_k, cat1, cat2, top_n, normalize, value_col, view_mode)
+        shown_top_k = top_k if display == 'top_pairs' else None # 矩陣顯示不使用 top_k，調整它不需重繪
+        chart_params = (mode, numeric_cols, method, order, display, shown_top_k, cat1, cat2, top_n, normalize, value_col)
+        figure = dash.no_update
+        if view_mode == 'dynamic' and needs_render(render_state, 'figure', data_version, *chart_params):
+            figure = heatmap_plotly_figure(data_version, df, *params)
+        static_src = dash.no_update
+        if needs_render(render_state, 'static', data_version, *chart_params, view_mode):
+            static_src = heatmap_static_src(data_version, df, *params)
+        code_blocks = heatmap_code_snippets(df, *params)
+        return (*dropdowns, figure, static_src, *code_blocks, render_state)
+
+    @app.callback(
+        Output('heatmap-filter-status-display', 'children'),
+        Input('filter-status-message-store', 'data')
+    )
+    def update_heatmap_filter_status(status_message):
+        if status_message:
+            return status_message
+        return "目前未套用篩選條件。"
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleCodeSections'),
+        [Output('heatmap-dynamic-code-section', 'style'),
+         Output('heatmap-static-code-section', 'style')],
+        [Input('heatmap-plot-type-radio', 'value')]
+    )
 
 # --- End of Callback Registration ---
 
@@ -1,19 +1,19 @@
 import dash
-from dash import dcc, html, Input, Output, State
-import plotly.express as px
-import plotly.graph_objects as go
+from dash import dcc, html, Input, Output, State, ClientsideFunction
 import pandas as pd
 import numpy as np
 import io
-import matplotlib.pyplot as plt
-import seaborn as sns
 from io import BytesIO
 import base64
 import dash_bootstrap_components as dbc # Import dbc for Alert
-
-# Configure Matplotlib to use 'Agg' backend
-import matplotlib
-matplotlib.use('Agg')
+from utils.cache import dataset_version, read_stored_dataframe
+from utils.cancellation import cancellable
+from utils.trendline import TRENDLINE_OPTIONS, get_trendlines, numeric_pair, trendline_traces
+from utils.downsample import SAMPLING_OPTIONS, downsample_for_plot, sampling_note
+from utils.fast_figure import message_figure, scatter_figure, split_groups, warning_figure, with_axis_titles
+from utils.intervals import CI_OPTIONS, regression_band
+from utils.page_compute import DATA_INPUT, column_profile, needs_render, too_many_levels
+from utils.render import BLANK_IMAGE, cached_static_chart, error_image, message_chart
 
 # 設定分組變數唯一值最大門檻
 MAX_UNIQUE_GROUP_CATEGORIES = 50
@@ -35,6 +35,18 @@ layout = html.Div([
         html.Label("選擇分組變數（選填）："),
         dcc.Dropdown(id='rel-group-dropdown', placeholder="選擇分組變數..."),
     ]),
+    html.Div([
+        html.Label("選擇趨勢線（動態圖表）："),
+        dcc.Dropdown(id='rel-trendline-dropdown', options=TRENDLINE_OPTIONS, value='ols', clearable=False),
+    ]),
+    html.Div([
+        html.Label("大資料抽樣方式："),
+        dcc.Dropdown(id='rel-sampling-dropdown', options=SAMPLING_OPTIONS, value='stratified', clearable=False),
+    ]),
+    html.Div([
+        html.Label("回歸線信賴區間（靜態圖表）："),
+        dcc.Dropdown(id='rel-ci-dropdown', options=CI_OPTIONS, value='t', clearable=False),
+    ]),
     html.Div([
         html.Label("選擇檢視模式："),
         dcc.RadioItems(
@@ -53,7 +65,8 @@ layout = html.Div([
 
     html.Div([
         dcc.Graph(id='relationship-plotly-graph', style={'display': 'block'}),
-        html.Img(id='relationship-static-img', style={'display': 'none', 'maxWidth': '100%'})
+        html.Img(id='relationship-static-img', style={'display': 'none', 'maxWidth': '100%'}),
+        dcc.Store(id='rel-render-state') # 目前的圖表 / 圖片由哪些輸入繪製 (utils/page_compute.py)
     ]),
 
     # Section for Dynamic Code Snippet
@@ -85,199 +98,258 @@ layout = html.Div([
     ])
 ])
 
-def register_callbacks(app):
-    @app.callback(
-        [Output('relationship-plotly-graph', 'style'),
-         Output('relationship-static-img', 'style')],
-        [Input('rel-plot-type-radio', 'value')]
-    )
-    def toggle_relationship_view(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}
+# --- 靜態圖表繪製 (於繪圖行程中執行) ---
+def draw_static_relationship(ax, spec, frames):
+    import seaborn as sns # 延遲載入：只有繪圖行程需要
+    var1, var2 = spec['var1'], spec['var2']
+    sns.scatterplot(data=frames['points'], x=var1, y=var2, hue=spec['group_var'], ax=ax)
+    band = frames.get('band')
+    if band is not None:
+        line_color = sns.color_palette()[0]
+        ax.plot(band['x'], band['fit'], color=line_color, linewidth=2)
+        if band['low'].notna().any():
+            ax.fill_between(band['x'], band['low'], band['high'], color=line_color, alpha=0.15, linewidth=0)
+    ax.set_title(spec['title'])
+    ax.set_xlabel(var1)
+    ax.set_ylabel(var2)
+
+# --- 頁面輸出 (由單一計算回調呼叫，資料已解析) ---
+def relationship_dropdowns(df, profile):
+    """(var1 / var2 / grouping options, default var1, var2, grouping) for a dataset."""
+    if df is None or df.empty:
+        return [], [], [], None, None, None
+
+    # Identify column types (依資料版本快取的欄位概況)
+    numeric_cols = profile['numeric']
+    datetime_cols = profile['datetime']
+    bool_cols = profile['bool']
+
+    # 過濾唯一值超過門檻的類別變數
+    categorical_cols = [col for col in profile['categorical'] if col in profile['levels']
+                        and not too_many_levels(profile, col, MAX_UNIQUE_GROUP_CATEGORIES)]
+
+    # Create options with data type labels for var1 and var2 dropdowns
+    all_options = []
+    for col in df.columns:
+        if col in numeric_cols:
+            dtype_label = "numeric"
+        elif col in categorical_cols:
+            dtype_label = "categorical"
+        elif col in datetime_cols:
+            dtype_label = "datetime"
+        elif col in bool_cols:
+            dtype_label = "boolean"
         else:
-            return {'display': 'none'}, {'display': 'block', 'maxWidth': '100%'}
+            dtype_label = "other"
+        all_options.append({'label': f"{col} ({dtype_label})", 'value': col})
 
-    @app.callback(
-        Output('relationship-plotly-graph', 'figure'),
-        [Input('filtered-data-store', 'data'), # Changed from stored-data
-         Input('rel-var1-dropdown', 'value'),
-         Input('rel-var2-dropdown', 'value'),
-         Input('rel-group-dropdown', 'value'),
-         Input('rel-plot-type-radio', 'value')]
-    )
-    def update_plotly_relationship_plot(stored_data_json, var1, var2, group_var, view_mode):
-        if view_mode != 'dynamic' or stored_data_json is None or var1 is None or var2 is None:
-            return px.scatter(title="請選擇動態檢視和兩個變數")
+    grouping_options = [{'label': f"{col} (categorical)", 'value': col} for col in categorical_cols]
 
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+    # Set default values (e.g., first two numeric columns if available)
+    default_var1 = numeric_cols[0] if len(numeric_cols) > 0 else None
+    default_var2 = numeric_cols[1] if len(numeric_cols) > 1 else None
+    return all_options, all_options, grouping_options, default_var1, default_var2, None
 
-            # Check for grouping variable unique value count
-            if group_var and df[group_var].dtype in ['object', 'category'] and df[group_var].nunique() > MAX_UNIQUE_GROUP_CATEGORIES:
-                warning_message = f"分組變數 '{group_var}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，不適合分組繪圖。"
-                fig = go.Figure()
-                fig.add_annotation(
-                    text=warning_message,
-                    xref="paper", yref="paper",
-                    x=0.5, y=0.5, showarrow=False,
-                    font=dict(size=14)
-                )
-                fig.update_layout(
-                    title="警告",
-                    xaxis={'visible': False},
-                    yaxis={'visible': False},
-                    plot_bgcolor='white' # Optional: set background color
-                )
-                return fig
 
-            title = f"{var1} 和 {var2} 的關係"
-            if group_var:
-                title += f"\n依據 {group_var} 分組"
+def relationship_figure(data_version, df, profile, var1, var2, group_var, trendline, sampling, view_mode):
+    if view_mode != 'dynamic':
+        return dash.no_update # 動態圖表隱藏中，切回動態檢視時若繪製輸入已改變再重建
+    if df is None or var1 is None or var2 is None:
+        return message_figure("請選擇動態檢視和兩個變數")
 
-            fig = px.scatter(df, x=var1, y=var2, color=group_var,
-                           title=title, trendline="ols")
+    try:
+        # Check for grouping variable unique value count
+        if too_many_levels(profile, group_var, MAX_UNIQUE_GROUP_CATEGORIES):
+            warning_message = f"分組變數 '{group_var}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，不適合分組繪圖。"
+            return warning_figure(warning_message)
 
-            fig.update_layout(
-                transition_duration=300,
-                xaxis_title=var1,
-                yaxis_title=var2
-            )
-            return fig
+        # 大資料時先抽樣 (趨勢線仍以完整資料計算)
+        plot_df, sample_info = downsample_for_plot(df, var1, var2, group_var, sampling)
 
-        except Exception as e:
-            print(f"生成圖表時發生錯誤：{e}")
-            return px.scatter(title=f"錯誤：{e}")
+        title = f"{var1} 和 {var2} 的關係"
+        if group_var:
+            title += f"\n依據 {group_var} 分組"
+        title += sampling_note(sample_info)
 
-    @app.callback(
-        Output('relationship-static-img', 'src'),
-        [Input('filtered-data-store', 'data'), # Changed from stored-data
-         Input('rel-var1-dropdown', 'value'),
-         Input('rel-var2-dropdown', 'value'),
-         Input('rel-group-dropdown', 'value'),
-         Input('rel-plot-type-radio', 'value')]
-    )
-    def update_static_relationship_plot(stored_data_json, var1, var2, group_var, view_mode):
-        if view_mode != 'static' or stored_data_json is None or var1 is None or var2 is None:
-            return "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+        # 散佈點由 NumPy 陣列直接組成 (utils/fast_figure.py)，不經 plotly.express
+        fig = scatter_figure(plot_df[var1].to_numpy(), plot_df[var2].to_numpy(),
+                             split_groups(plot_df[group_var] if group_var else None), title, var1, var2, group_var)
 
-        try:
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
+        # 趨勢線由向量化引擎計算 (依資料版本快取)，以輕量線條加入，顏色與散佈點一致
+        if trendline and trendline != 'none':
+            fits = get_trendlines(data_version, df, var1, var2, group_var, trendline)
+            color_map = {}
+            for trace in fig['data']:
+                color_map[trace['name'] if group_var else None] = trace['marker']['color']
+            fig['data'].extend(trendline_traces(fits, color_map))
 
-            plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei']
-            plt.rcParams['axes.unicode_minus'] = False
+        return with_axis_titles(fig, var1, var2)
 
-            # Check for grouping variable unique value count
-            if group_var and df[group_var].dtype in ['object', 'category'] and df[group_var].nunique() > MAX_UNIQUE_GROUP_CATEGORIES:
-                warning_message = f"分組變數 '{group_var}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，\n不適合分組繪圖。"
-                fig_warn, ax_warn = plt.subplots(figsize=(8, 2), tight_layout=True)
-                ax_warn.text(0.5, 0.5, warning_message, ha='center', va='center', fontsize=12, color='red')
-                ax_warn.axis('off') # Hide axes
+    except Exception as e:
+        print(f"生成圖表時發生錯誤：{e}")
+        return message_figure(f"錯誤：{e}")
 
-                buf = BytesIO()
-                fig_warn.savefig(buf, format="png")
-                buf.seek(0)
-                data = base64.b64encode(buf.getvalue()).decode("utf8")
-                plt.close(fig_warn) # Close the warning figure
-                return f"data:image/png;base64,{data}"
 
-            fig_static, ax = plt.subplots(figsize=(8, 5), tight_layout=True)
+def relationship_static_src(data_version, df, profile, var1, var2, group_var, sampling, ci_method, view_mode):
+    if view_mode != 'static' or df is None or var1 is None or var2 is None:
+        return BLANK_IMAGE
+
+    try:
+        def build():
+            # Check for grouping variable unique value count
+            if too_many_levels(profile, group_var, MAX_UNIQUE_GROUP_CATEGORIES):
+                warning_message = f"分組變數 '{group_var}' 的唯一值超過 {MAX_UNIQUE_GROUP_CATEGORIES} 個，\n不適合分組繪圖。"
+                return message_chart(warning_message)
+
+            plot_df, sample_info = downsample_for_plot(df, var1, var2, group_var, sampling)
+            columns = list(dict.fromkeys([var1, var2] + ([group_var] if group_var else [])))
+            frames = {'points': plot_df[columns]}
+            if not group_var and numeric_pair(df, var1, var2):
+                # 以封閉式公式 (或向量化 bootstrap) 計算回歸線與信賴帶，取代 sns.regplot 的逐次 bootstrap；
+                # 與互動圖表的趨勢線相同，只在兩欄都是數值欄位時計算 (日期、類別欄位不畫回歸線)
+                x_values = df[var1].to_numpy(dtype=float, na_value=np.nan)
+                y_values = df[var2].to_numpy(dtype=float, na_value=np.nan)
+                valid = np.isfinite(x_values) & np.isfinite(y_values)
+                band = None
+                if valid.any():
+                    x_values, y_values = x_values[valid], y_values[valid]
+                    grid = np.linspace(x_values.min(), x_values.max(), 100)
+                    band = regression_band(x_values, y_values, grid, ci_method)
+                if band is not None:
+                    fit, low, high = band
+                    frames['band'] = pd.DataFrame({'x': grid, 'fit': fit, 'low': low, 'high': high})
 
-            if group_var:
-                sns.scatterplot(data=df, x=var1, y=var2, hue=group_var, ax=ax)
-            else:
-                sns.scatterplot(data=df, x=var1, y=var2, ax=ax)
-                sns.regplot(data=df, x=var1, y=var2, scatter=False, ax=ax)
-            
             title = f"{var1} 和 {var2} 的關係"
             if group_var:
                 title += f"\n依據 {group_var} 分組"
-            
-            ax.set_title(title)
-            ax.set_xlabel(var1)
-            ax.set_ylabel(var2)
-
-            buf = BytesIO()
-            fig_static.savefig(buf, format="png")
-            buf.seek(0)
-            data = base64.b64encode(buf.getvalue()).decode("utf8")
-            plt.close(fig_static)
-            return f"data:image/png;base64,{data}"
+            title += sampling_note(sample_info)
+
+            spec = {'var1': var1, 'var2': var2, 'group_var': group_var, 'title': title, 'figsize': (8, 5)}
+            return draw_static_relationship, spec, frames
+
+        params = {'var1': var1, 'var2': var2, 'group_var': group_var, 'sampling': sampling, 'ci_method': ci_method}
+        return cached_static_chart('relationship', data_version, params, build)
+
+    except Exception as e:
+        print(f"生成靜態圖表時發生錯誤：{e}")
+        # Return an SVG error placeholder
+        return error_image(f"錯誤：{e}")
+
+
+def relationship_code_snippets(df, var1, var2, group_var, trendline, ci_method, view_mode):
+    if df is None or var1 is None or var2 is None:
+        msg = "請先選擇兩個變數"
+        return msg, msg
+
+    # Dynamic (Plotly) code generation
+    plotly_params = f"df, x='{var1}', y='{var2}'"
+    if group_var:
+        plotly_params += f", color='{group_var}'"
+    plotly_params += ", title=''"
+    # Match plot generation (plotly.express 的 trendline 需要 statsmodels)
+    if trendline == 'ols':
+        plotly_params += ", trendline='ols'"
+    elif trendline == 'lowess':
+        plotly_params += ", trendline='lowess'"
+    elif trendline == 'rolling':
+        plotly_params += ", trendline='rolling', trendline_options=dict(window=5)"
+
+    plotly_code = f"""```python
+import plotly.express as px
 
-        except Exception as e:
-            print(f"生成靜態圖表時發生錯誤：{e}")
-            error_message = f"錯誤：{e}"
-            # Return an SVG error placeholder
-            return f"data:image/svg+xml;charset=utf-8,%3Csvg xmlns='http://www.w3.org/2000/svg' width='300' height='100'%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' font-size='10px' fill='red'%3E{error_message}%3C/text%3E%3C/svg%3E"
-        finally:
-            # Ensure Matplotlib figure is closed
-            if 'fig_static' in locals() and fig_static:
-                 plt.close(fig_static)
-
-    # Callback to populate dropdowns based on stored data
+# Assuming 'df' is your pandas DataFrame
+fig = px.scatter({plotly_params})
+fig.show()
+```"""
+
+    # Static (Seaborn) code generation
+    static_code = f"""```python
+import seaborn as sns
+import matplotlib.pyplot as plt
+
+# Assuming 'df' is your pandas DataFrame
+plt.figure(figsize=(8, 5))
+"""
+    if group_var:
+        static_code += f"sns.scatterplot(data=df, x='{var1}', y='{var2}', hue='{group_var}')\n"
+    else:
+        static_code += f"sns.scatterplot(data=df, x='{var1}', y='{var2}')\n"
+        regplot_ci = ", ci=None" if ci_method == 'none' else ", n_boot=1000, seed=42"
+        static_code += f"sns.regplot(data=df, x='{var1}', y='{var2}', scatter=False{regplot_ci})\n" # Add regplot if no grouping
+
+    static_code += f"""plt.title('')
+plt.xlabel('{var1}')
+plt.ylabel('{var2}')
+plt.tight_layout() # Added for better spacing
+plt.show()
+```"""
+
+    if view_mode == 'dynamic':
+        return plotly_code, ""
+    elif view_mode == 'static':
+        return "", static_code
+    else:
+        # Should not happen with RadioItems, but return dynamic as default
+        return plotly_code, ""
+
+def register_callbacks(app):
+    # 切換檢視只改 CSS display，在瀏覽器端執行 (assets/clientside.js)，不需往返伺服器
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleView'),
+        [Output('relationship-plotly-graph', 'style'),
+         Output('relationship-static-img', 'style')],
+        [Input('rel-plot-type-radio', 'value')]
+    )
+
+    # 單一計算回調：選單、動態圖表、靜態圖片與程式碼片段共用一次資料解析 (utils/page_compute.py)
     @app.callback(
         [Output('rel-var1-dropdown', 'options'),
          Output('rel-var2-dropdown', 'options'),
          Output('rel-group-dropdown', 'options'),
          Output('rel-var1-dropdown', 'value'),
          Output('rel-var2-dropdown', 'value'),
-         Output('rel-group-dropdown', 'value')],
-        [Input('filtered-data-store', 'data')] # Changed from stored-data
+         Output('rel-group-dropdown', 'value'),
+         Output('relationship-plotly-graph', 'figure'),
+         Output('relationship-static-img', 'src'),
+         Output('rel-dynamic-code-block', 'children'),
+         Output('rel-static-code-block', 'children'),
+         Output('rel-render-state', 'data')],
+        [Input('filtered-data-store', 'data'), # Changed from stored-data
+         Input('rel-var1-dropdown', 'value'),
+         Input('rel-var2-dropdown', 'value'),
+         Input('rel-group-dropdown', 'value'),
+         Input('rel-trendline-dropdown', 'value'),
+         Input('rel-sampling-dropdown', 'value'),
+         Input('rel-ci-dropdown', 'value'),
+         Input('rel-plot-type-radio', 'value')],
+        [State('rel-render-state', 'data')]
     )
-    def update_relationship_dropdowns(stored_data_json):
-        default_return = ([], [], [], None, None, None) # Define default return tuple
-
-        if not stored_data_json:
-            print("update_relationship_dropdowns: No stored data.")
-            return default_return
-
+    @cancellable(unless_triggered_by=[DATA_INPUT])
+    def update_relationship_page(stored_data_json, var1, var2, group_var, trendline, sampling, ci_method, view_mode, render_state):
         try:
-            print("update_relationship_dropdowns: Reading stored data.")
-            df = pd.read_json(io.StringIO(stored_data_json), orient='split')
-
-            if df.empty:
-                 print("update_relationship_dropdowns: DataFrame is empty.")
-                 return default_return
-
-            # Identify column types
-            numeric_cols = df.select_dtypes(include=np.number).columns
-            categorical_cols = df.select_dtypes(include=['object', 'category']).columns
-            datetime_cols = df.select_dtypes(include=['datetime', 'datetimetz']).columns
-            bool_cols = df.select_dtypes(include=['bool']).columns
-            all_cols = df.columns
-
-            # 過濾唯一值超過門檻的類別變數
-            categorical_cols = [
-                col for col in categorical_cols
-                if df[col].nunique() <= MAX_UNIQUE_GROUP_CATEGORIES
-            ]
-
-            # Create options with data type labels for var1 and var2 dropdowns
-            all_options = []
-            for col in all_cols:
-                if col in numeric_cols:
-                    dtype_label = "numeric"
-                elif col in categorical_cols:
-                    dtype_label = "categorical"
-                elif col in datetime_cols:
-                    dtype_label = "datetime"
-                elif col in bool_cols:
-                    dtype_label = "boolean"
-                else:
-                    dtype_label = "other"
-                all_options.append({'label': f"{col} ({dtype_label})", 'value': col})
-
-            grouping_options = [{'label': f"{col} (categorical)", 'value': col} for col in categorical_cols]
-
-            # Set default values (e.g., first two numeric columns if available)
-            default_var1 = numeric_cols[0] if len(numeric_cols) > 0 else None
-            default_var2 = numeric_cols[1] if len(numeric_cols) > 1 else None
-
-            print("update_relationship_dropdowns: Success.")
-            return all_options, all_options, grouping_options, default_var1, default_var2, None
-
+            data_version = dataset_version(stored_data_json)
+            df = read_stored_dataframe(stored_data_json, data_version)
+            profile = column_profile(data_version, df) if df is not None else None
         except Exception as e:
-            print(f"Error updating relationship dropdowns: {e}")
-            return default_return # Return default tuple on error
+            print(f"讀取資料時發生錯誤：{e}")
+            return [], [], [], None, None, None, message_figure(f"錯誤：{e}"), error_image(f"錯誤：{e}"), "", "", None
+
+        # 資料變動時重設選單，並直接以新的預設值繪圖
+        render_state = dict(render_state or {})
+        dropdowns = (dash.no_update,) * 6
+        if needs_render(render_state, 'dropdowns', data_version):
+            dropdowns = relationship_dropdowns(df, profile)
+            var1, var2, group_var = dropdowns[3:]
+
+        # 只重新計算繪製輸入已改變的輸出 (動態圖表隱藏時保留，切回動態檢視且輸入不同時再重建)
+        figure = dash.no_update
+        if view_mode == 'dynamic' and needs_render(render_state, 'figure', data_version, var1, var2, group_var, trendline, sampling):
+            figure = relationship_figure(data_version, df, profile, var1, var2, group_var, trendline, sampling, view_mode)
+        static_src = dash.no_update
+        if needs_render(render_state, 'static', data_version, var1, var2, group_var, sampling, ci_method, view_mode):
+            static_src = relationship_static_src(data_version, df, profile, var1, var2, group_var, sampling, ci_method, view_mode)
+        code_blocks = relationship_code_snippets(df, var1, var2, group_var, trendline, ci_method, view_mode)
+        return (*dropdowns, figure, static_src, *code_blocks, render_state)
 
     # --- Callback to update filter status display on this page ---
     @app.callback(
@@ -289,74 +361,12 @@ def register_callbacks(app):
             return status_message
         return "目前未套用篩選條件。"
 
-    @app.callback(
+    app.clientside_callback(
+        ClientsideFunction(namespace='views', function_name='toggleCodeSections'),
         [Output('rel-dynamic-code-section', 'style'),
          Output('rel-static-code-section', 'style')],
         [Input('rel-plot-type-radio', 'value')]
     )
-    def toggle_rel_code_section_visibility(view_mode):
-        if view_mode == 'dynamic':
-            return {'display': 'block'}, {'display': 'none'}
-        elif view_mode == 'static':
-            return {'display': 'none'}, {'display': 'block'}
-        return {'display': 'block'}, {'display': 'none'} # Default to showing dynamic
-
-    @app.callback(
-        [Output('rel-dynamic-code-block', 'children'),
-         Output('rel-static-code-block', 'children')],
-        [Input('filtered-data-store', 'data'),
-         Input('rel-var1-dropdown', 'value'),
-         Input('rel-var2-dropdown', 'value'),
-         Input('rel-group-dropdown', 'value'),
-         Input('rel-plot-type-radio', 'value')]
-    )
-    def update_rel_code_snippets(stored_data_json, var1, var2, group_var, view_mode):
-        if stored_data_json is None or var1 is None or var2 is None:
-            msg = "請先選擇兩個變數"
-            return msg, msg
-
-        # Dynamic (Plotly) code generation
-        plotly_params = f"df, x='{var1}', y='{var2}'"
-        if group_var:
-            plotly_params += f", color='{group_var}'"
-        plotly_params += ", title='', trendline='ols'" # Match plot generation
-
-        plotly_code = f"""```python
-import plotly.express as px
-
-# Assuming 'df' is your pandas DataFrame
-fig = px.scatter({plotly_params})
-fig.show()
-```"""
-
-        # Static (Seaborn) code generation
-        static_code = f"""```python
-import seaborn as sns
-import matplotlib.pyplot as plt
-
-# Assuming 'df' is your pandas DataFrame
-plt.figure(figsize=(8, 5))
-"""
-        if group_var:
-            static_code += f"sns.scatterplot(data=df, x='{var1}', y='{var2}', hue='{group_var}')\n"
-        else:
-            static_code += f"sns.scatterplot(data=df, x='{var1}', y='{var2}')\n"
-            static_code += f"sns.regplot(data=df, x='{var1}', y='{var2}', scatter=False)\n" # Add regplot if no grouping
-
-        static_code += f"""plt.title('')
-plt.xlabel('{var1}')
-plt.ylabel('{var2}')
-plt.tight_layout() # Added for better spacing
-plt.show()
-```"""
-
-        if view_mode == 'dynamic':
-            return plotly_code, ""
-        elif view_mode == 'static':
-            return "", static_code
-        else:
-            # Should not happen with RadioItems, but return dynamic as default
-            return plotly_code, ""
 
 # --- End of Callback Registration ---
 
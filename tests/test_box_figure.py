@@ -0,0 +1,36 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+from pages.distribution import distribution_figure
+from utils.page_compute import column_profile
+
+
+def _values(spec):
+    if isinstance(spec, dict): # typed array
+        return np.frombuffer(base64.b64decode(spec['bdata']), dtype=spec['dtype'])
+    return np.asarray(spec)
+
+
+def _frame(n=50_000):
+    rng = np.random.default_rng(0)
+    values = np.r_[rng.normal(size=n - 1_000), rng.normal(10, 1, 1_000)] # 2% 離群值
+    return pd.DataFrame({'value': values, 'group': rng.choice(['a', 'b'], n)})
+
+
+def test_sampled_box_uses_statistics_of_every_row():
+    df = _frame()
+    fig = distribution_figure('test-box', df, column_profile('test-box', df), 'value', 'group', 'box', 'dynamic')
+    boxes = {trace['name']: trace for trace in fig['data'] if 'q1' in trace}
+    expected = df.groupby('group')['value'].quantile([0.25, 0.5, 0.75]).unstack()
+    for label, row in expected.iterrows():
+        assert np.allclose([boxes[label]['q1'][0], boxes[label]['median'][0], boxes[label]['q3'][0]], row.to_numpy())
+
+
+def test_sampled_violin_density_comes_from_a_uniform_sample():
+    df = _frame()
+    fig = distribution_figure('test-violin', df, column_profile('test-violin', df), 'value', None, 'violin', 'dynamic')
+    density = next(trace for trace in fig['data'] if trace['points'] is False)
+    points = next(trace for trace in fig['data'] if trace['points'] == 'all')
+    assert np.mean(_values(density['y']) > 5) < 0.05 < np.mean(_values(points['y']) > 5) # 點偏向離群值，核密度不受影響
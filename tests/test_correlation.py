@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import correlation
+from utils.correlation import count_inversions, kendall_matrix, kendall_note
+
+
+def _brute_inversions(values):
+    return sum(1 for i in range(len(values)) for j in range(i + 1, len(values)) if values[i] > values[j])
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3, 7, 8, 9, 33, 100])
+def test_count_inversions_matches_brute_force(n):
+    rng = np.random.default_rng(n)
+    for _ in range(10):
+        values = rng.integers(0, max(n // 3, 1) + 1, n) # 含大量同值
+        assert count_inversions(values) == _brute_inversions(list(values))
+
+
+def test_kendall_matrix_matches_pandas():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(rng.integers(0, 20, (500, 4)), columns=list('abcd')).astype(float)
+    df.iloc[::7, 1] = np.nan
+    result = kendall_matrix('test-kendall', df, list('abcd'))
+    assert np.allclose(result.to_numpy(), df.corr('kendall').to_numpy())
+
+
+def test_kendall_over_budget_uses_a_noted_sample(monkeypatch):
+    monkeypatch.setattr(correlation, 'KENDALL_MAX_WORK', 3_000)
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(rng.normal(size=(5_000, 3)), columns=list('xyz'))
+    assert kendall_note(df, list('xyz')) == " (隨機抽樣 1,000 / 5,000 列計算)"
+    sampled = kendall_matrix('test-kendall-sample', df, list('xyz'))
+    assert np.abs(sampled.to_numpy() - df.corr('kendall').to_numpy()).max() < 0.1
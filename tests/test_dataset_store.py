@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.dataset_store import SharedDatasetStore
+
+
+def _frame():
+    return pd.DataFrame({
+        'text': ['a', None, 'c'],
+        'mixed': pd.array([1, 'x', None], dtype=object),
+        'category': pd.Categorical(['u', 'v', 'u'], ordered=True),
+        'date': pd.to_datetime(['2020-01-01', None, '2021-05-05']),
+        'date_tz': pd.to_datetime(['2020-01-01', '2020-02-01', None]).tz_localize('Asia/Taipei'),
+        'number': [1.5, np.nan, 3.0],
+        'nullable': pd.array([1, None, 3], dtype='Int64'),
+    }, index=pd.Index(['r1', 'r2', 'r3'], name='key'))
+
+
+def test_round_trip_without_pickle(tmp_path):
+    store = SharedDatasetStore(str(tmp_path / 'store'))
+    df = _frame()
+    path = store.put('v1', df)
+    pd.testing.assert_frame_equal(store.get('v1'), df)
+    assert not any(name.endswith('.pkl') for name in os.listdir(path))
+    assert os.stat(store.directory).st_mode & 0o777 == 0o700
+
+
+@pytest.mark.parametrize('values', [
+    pd.array([object(), 1], dtype=object), # 自訂物件
+    pd.array([np.int64(1), 'x'], dtype=object), # numpy 純量會被轉成字串
+    pd.array([float('inf'), 'x'], dtype=object), # inf 會變成 null
+    pd.period_range('2020', periods=2, freq='M'),
+])
+def test_values_json_cannot_represent_are_not_stored(tmp_path, values):
+    store = SharedDatasetStore(str(tmp_path / 'store'))
+    assert store.put('v1', pd.DataFrame({'x': values})) is None
+    assert store.get('v1') is None
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid') or os.getuid() != 0, reason="changing ownership needs root")
+def test_directory_owned_by_another_user_is_refused(tmp_path):
+    directory = tmp_path / 'store'
+    directory.mkdir(mode=0o700)
+    os.chown(directory, 12345, 12345)
+    store = SharedDatasetStore(str(directory))
+    assert store.put('v1', _frame()) is None
+    assert store.get('v1') is None
@@ -0,0 +1,31 @@
+import os
+
+from utils.image_cache import DiskImageCache
+
+
+def test_private_directory(tmp_path):
+    cache = DiskImageCache(str(tmp_path / 'images'))
+    path = cache.put('ab' + '0' * 38, b'png')
+    assert cache.get('ab' + '0' * 38) == path
+    assert os.stat(cache.directory).st_mode & 0o777 == 0o700
+
+
+def test_unusable_directory_disables_cache(tmp_path):
+    directory = tmp_path / 'images'
+    directory.mkdir()
+    os.symlink(str(directory), str(tmp_path / 'link'))
+    cache = DiskImageCache(str(tmp_path / 'link'))
+    assert cache.put('ab' + '0' * 38, b'png') is None
+    assert cache.get('ab' + '0' * 38) is None
+
+
+def test_limit_applies_across_processes(tmp_path):
+    # 兩個實例模擬共用同一目錄的兩個工作行程：淘汰依目錄的總大小，而不是各自寫入的量
+    directory = str(tmp_path / 'images')
+    first, second = DiskImageCache(directory, max_bytes=1000), DiskImageCache(directory, max_bytes=1000)
+    for i in range(6):
+        cache = first if i % 2 == 0 else second
+        cache.put(f"{i:02d}" + '0' * 38, b'x' * 300)
+    total = sum(size for _, size, _ in first._entries())
+    assert total <= 1000
+    assert first.get('05' + '0' * 38) is not None
@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from utils.render import RenderFarm
+
+
+def draw_nothing(ax, spec, frames):
+    ax.plot([0, 1], [0, 1])
+
+
+def draw_forever(ax, spec, frames):
+    time.sleep(3600)
+
+
+def draw_slowly(ax, spec, frames):
+    with open(spec['log'], 'a') as f:
+        f.write('start\n') # 記錄實際開始繪製的次數
+    time.sleep(spec['seconds'])
+    ax.plot([0, 1], [0, 1])
+
+
+@pytest.fixture
+def farm():
+    farm = RenderFarm(workers=1, timeout=3, queue_size=1)
+    farm.start(wait=True)
+    yield farm
+    farm.shutdown()
+
+
+def test_render_returns_png(farm):
+    assert farm.render(draw_nothing, {'figsize': (2, 2)}).startswith(b'\x89PNG')
+
+
+def test_stuck_render_times_out_once_and_pool_is_recycled(farm):
+    pool = farm._pool
+    processes = list(pool._processes.values())
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        farm.render(draw_forever, {})
+    assert time.monotonic() - started < farm.timeout + 1 # 一個總期限，不是排隊 + 繪製各一次
+    assert farm._pool is not pool
+    for process in processes:
+        process.join(5)
+        assert not process.is_alive() # 卡住的繪圖行程已被終止
+    assert farm.render(draw_nothing, {'figsize': (2, 2)}).startswith(b'\x89PNG') # 新的行程池可以繼續繪製
+
+
+def test_concurrent_render_survives_another_timeout(tmp_path):
+    farm = RenderFarm(workers=2, timeout=4, queue_size=2)
+    farm.start(wait=True)
+    pool, results = farm._pool, {}
+    processes = list(pool._processes.values())
+    log = str(tmp_path / 'log')
+
+    def stuck():
+        try:
+            farm.render(draw_forever, {})
+        except TimeoutError:
+            results['stuck'] = 'timeout'
+
+    def healthy():
+        time.sleep(2) # 卡住的繪圖逾時時這張圖仍在繪製中
+        results['healthy'] = farm.render(draw_slowly, {'figsize': (2, 2), 'log': log, 'seconds': 3})
+
+    try:
+        threads = [threading.Thread(target=stuck), threading.Thread(target=healthy)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(15)
+        assert results['stuck'] == 'timeout'
+        assert results['healthy'].startswith(b'\x89PNG')
+        with open(log) as f:
+            assert f.read() == 'start\n' # 沒有因為另一張圖逾時而中斷、重新繪製
+        assert farm._pool is not pool
+        for process in processes:
+            process.join(5)
+            assert not process.is_alive() # 舊池在其他工作完成後終止
+    finally:
+        farm.shutdown()
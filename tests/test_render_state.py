@@ -0,0 +1,69 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import client as dash_client
+
+
+def _page(page, callback):
+    import app as app_module
+    client = dash_client.CallbackClient(app_module.app, dash_client.TestClientTransport(app_module.server))
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'city': rng.choice(['A', 'B', 'C'], 300), 'shop': rng.choice(['x', 'y', 'z', 'w'], 300),
+                       'sales': rng.normal(100, 10, 300), 'cost': rng.normal(50, 5, 300)})
+    values = dict(dash_client.layout_values(getattr(app_module, page).layout), **{'filtered-data-store.data': df.to_json(orient='split')})
+
+    def call(changed):
+        _, body = client.call(callback, values, changed)
+        response = json.loads(body)['response']
+        values.update({f"{cid}.{prop}": value for cid, props in response.items() for prop, value in props.items()
+                       if prop in ('value', 'data')}) # 瀏覽器套用回應後的選單值與繪製簽章
+        return response
+    return call, values
+
+
+@pytest.fixture(scope='module')
+def bar_page():
+    return _page('bar_plot', 'update_bar_page')
+
+
+@pytest.fixture(scope='module')
+def heatmap_page():
+    return _page('heatmap', 'update_heatmap_page')
+
+
+def _is_patch(figure):
+    return isinstance(figure, dict) and figure.get('__dash_patch_update')
+
+
+def test_bar_mode_patch_after_a_dropped_request_still_rebuilds(bar_page):
+    call, values = bar_page
+    first = call(['filtered-data-store.data'])
+    assert first['bar-category-dropdown']['value'] == 'city' and not _is_patch(first['bar-plotly-graph']['figure'])
+
+    # 換類別的請求被較新的請求取代 (回應未套用)：瀏覽器中的圖表仍是 city，下一個只改 barmode 的請求要重建
+    state = values['bar-render-state.data']
+    values.update({'bar-category-dropdown.value': 'shop', 'bar-mode-dropdown.value': 'stack'})
+    rebuilt = call(['bar-mode-dropdown.value'])
+    assert not _is_patch(rebuilt['bar-plotly-graph']['figure'])
+    assert rebuilt['bar-render-state']['data'] != state
+
+    values['bar-mode-dropdown.value'] = 'group'
+    patched = call(['bar-mode-dropdown.value'])
+    assert _is_patch(patched['bar-plotly-graph']['figure'])
+
+
+def test_heatmap_top_k_only_rerenders_top_pairs(heatmap_page):
+    call, values = heatmap_page
+    first = call(['filtered-data-store.data'])
+    assert 'figure' in first['heatmap-plotly-graph']
+
+    values['heatmap-topk-input.value'] = 3 # 矩陣顯示不使用 top_k
+    assert 'heatmap-plotly-graph' not in call(['heatmap-topk-input.value'])
+
+    values['heatmap-corr-display-radio.value'] = 'top_pairs'
+    assert 'figure' in call(['heatmap-corr-display-radio.value'])['heatmap-plotly-graph']
+    values['heatmap-topk-input.value'] = 2
+    assert 'figure' in call(['heatmap-topk-input.value'])['heatmap-plotly-graph']
@@ -0,0 +1,170 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import cancellation
+from utils.categorical import get_crosstab
+from utils.singleflight import SingleFlight
+
+
+def _run_threads(targets, timeout=10):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout)
+        assert not thread.is_alive(), "thread did not finish (deadlock?)"
+
+
+def _token(key_hash, sequence):
+    # 模擬某分頁某回調的第 sequence 次請求開始
+    token = cancellation.CancelToken(key_hash, sequence)
+    with cancellation._table_lock:
+        cancellation._table[token.slot] = (key_hash, sequence)
+    return token
+
+
+def test_concurrent_callers_share_one_computation():
+    flight, calls, results = SingleFlight(), [], []
+    started, release = threading.Event(), threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'value'
+
+    def leader():
+        results.append(flight.do('key', compute))
+
+    def follower():
+        started.wait(5) # 確定第一個呼叫者正在計算
+        results.append(flight.do('key', compute))
+
+    def releaser():
+        started.wait(5)
+        while len(flight._calls['key'][2]._tokens) < 4: # 等三個跟隨者都加入
+            time.sleep(0.01)
+        release.set()
+
+    _run_threads([leader, follower, follower, follower, releaser])
+    assert calls == [1]
+    assert results == ['value'] * 4
+    assert len(flight) == 0
+
+
+def test_exception_is_shared_and_key_released():
+    flight, started, release = SingleFlight(), threading.Event(), threading.Event()
+    errors = []
+
+    def compute():
+        started.set()
+        release.wait(5)
+        raise ValueError('boom')
+
+    def call():
+        try:
+            flight.do('key', compute)
+        except ValueError as e:
+            errors.append(str(e))
+
+    def follower():
+        started.wait(5)
+        threading.Timer(0.1, release.set).start()
+        call()
+
+    _run_threads([call, follower])
+    assert errors == ['boom', 'boom']
+    assert flight.do('key', lambda: 'retry') == 'retry' # 失敗的計算不會留下來
+
+
+def test_nested_calls_with_distinct_keys():
+    flight = SingleFlight()
+    assert flight.do('outer', lambda: flight.do('inner', lambda: 1) + 1) == 2
+
+
+def test_nested_call_with_same_key_fails_instead_of_deadlocking():
+    flight = SingleFlight()
+    with pytest.raises(RuntimeError):
+        flight.do('key', lambda: flight.do('key', lambda: 1))
+    assert len(flight) == 0
+
+
+def _slow_compute(calls):
+    def compute():
+        calls.append(1)
+        for _ in range(40):
+            cancellation.check_cancelled()
+            time.sleep(0.01)
+        return 'done'
+    return compute
+
+
+@pytest.mark.parametrize('superseded, expected', [
+    ([101], {'A': 'done', 'B': 'done'}), # 第一個呼叫者過時，另一個仍需要結果
+    ([101, 202], {'A': 'cancelled', 'B': 'cancelled'}), # 所有呼叫者都過時
+])
+def test_shared_computation_cancelled_only_when_every_caller_is(superseded, expected):
+    flight, calls, results = SingleFlight(), [], {}
+    compute = _slow_compute(calls)
+    tokens = {'A': _token(101, 1), 'B': _token(202, 1)}
+
+    def caller(name, delay):
+        def run():
+            time.sleep(delay)
+            with cancellation.use_token(tokens[name]):
+                try:
+                    results[name] = flight.do('key', compute)
+                except cancellation.ComputationCancelled:
+                    results[name] = 'cancelled'
+        return run
+
+    def supersede():
+        time.sleep(0.15)
+        for key_hash in superseded:
+            _token(key_hash, 2)
+
+    _run_threads([caller('A', 0), caller('B', 0.05), supersede])
+    assert results == expected
+    assert calls == [1]
+
+
+def test_unnormalized_crosstab_does_not_request_its_own_key():
+    df = pd.DataFrame({'a': list('xyzxyz'), 'b': list('ppqqrr')})
+    result = {}
+    _run_threads([lambda: result.update(table=get_crosstab('test-crosstab', df, 'a', 'b'))], timeout=10)
+    assert np.array_equal(result['table'].to_numpy(), pd.crosstab(df['a'], df['b']).to_numpy())
+    normalized = get_crosstab('test-crosstab', df, 'a', 'b', normalize='all')
+    assert normalized.to_numpy().sum() == pytest.approx(1.0)
+
+
+def test_waiter_retrying_after_cancellation_becomes_leader():
+    flight, calls, results = SingleFlight(), [], []
+    started, joined = threading.Event(), threading.Event()
+
+    def compute():
+        calls.append(1)
+        if len(calls) == 1:
+            started.set()
+            joined.wait(5)
+            raise cancellation.ComputationCancelled() # 第一個呼叫者被取消
+        return 'value'
+
+    def leader():
+        try:
+            flight.do('key', compute)
+        except cancellation.ComputationCancelled:
+            results.append('cancelled')
+
+    def follower():
+        started.wait(5)
+        threading.Timer(0.1, joined.set).start()
+        results.append(flight.do('key', compute))
+
+    _run_threads([leader, follower])
+    assert sorted(results) == ['cancelled', 'value']
+    assert calls == [1, 1]
+    assert len(flight) == 0
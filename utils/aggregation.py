@@ -0,0 +1,54 @@
+import pandas as pd
+
+from utils.cache import LRUCache
+from utils.categorical import bucket_top_n, count_levels
+
+# --- 分組彙總快取 ---
+# 同一組 (資料版本, 類別, 分組, 數值) 的所有彙總值 (平均/總和/中位數/計數/最小/最大/標準差)
+# 在一次 groupby 中一起計算並快取；切換 barmode 或彙總方式時直接讀取快取。
+
+AGG_LABELS = {
+    'mean': '平均',
+    'sum': '總和',
+    'median': '中位數',
+    'count': '計數',
+    'min': '最小值',
+    'max': '最大值',
+    'std': '標準差',
+}
+AGG_OPTIONS = [{'label': label, 'value': agg} for agg, label in AGG_LABELS.items()]
+COUNT_COLUMN = '計數' # 未選擇數值變數時的計數欄位名稱
+
+_aggregation_cache = LRUCache(maxsize=128)
+
+
+def compute_grouped_aggregates(df, grouping_cols, value_col=None):
+    """All supported aggregates of value_col per group in one grouped pass (row counts if value_col is None)."""
+    grouped = df.groupby(grouping_cols, observed=True)
+    if value_col is None:
+        return grouped.size().rename(COUNT_COLUMN).reset_index()
+    return grouped[value_col].agg(list(AGG_LABELS)).reset_index()
+
+
+def aggregation_frame(data_version, df, category_col, group_col=None, value_col=None, top_n=None):
+    """Frame used for grouping; with top_n, category/group columns above top_n levels are bucketed into '其他'."""
+    if not top_n:
+        return df
+    columns = {}
+    for col in dict.fromkeys(c for c in (category_col, group_col) if c):
+        if count_levels(data_version, df, col) > top_n:
+            columns[col] = bucket_top_n(data_version, df, col, top_n)
+        else:
+            columns[col] = df[col]
+    if value_col and value_col not in columns:
+        columns[value_col] = df[value_col]
+    return pd.DataFrame(columns, index=df.index)
+
+
+def get_grouped_aggregates(data_version, df, category_col, group_col=None, value_col=None, top_n=None):
+    """Cached compute_grouped_aggregates keyed by (dataset version, category, group, value, Top-N)."""
+    grouping_cols = [category_col] + ([group_col] if group_col else [])
+    key = (data_version, category_col, group_col, value_col, top_n)
+    return _aggregation_cache.get_or_compute(
+        key, lambda: compute_grouped_aggregates(
+            aggregation_frame(data_version, df, category_col, group_col, value_col, top_n), grouping_cols, value_col))
@@ -0,0 +1,146 @@
+import hashlib
+import io
+import threading
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.cancellation import check_cancelled
+from utils.dataset_store import dataset_store
+from utils.memory import memory_manager
+from utils.metrics import decode_timer
+from utils.singleflight import SingleFlight
+
+
+# --- 資料版本 ---
+def dataset_version(data_json):
+    """Returns a short fingerprint of a stored DataFrame JSON string (None if no data)."""
+    if data_json is None:
+        return None
+    with decode_timer(): # 雜湊整份 JSON 也算在解碼成本內
+        return hashlib.blake2b(data_json.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# --- 簡易 LRU 快取 (執行緒安全) ---
+_all_caches = weakref.WeakSet() # 供 clear_all_caches 使用 (效能基準測試的冷啟動量測)
+
+
+class LRUCache:
+    """A small thread-safe LRU cache used to keep per-dataset-version results.
+
+    Keys are a dataset version or a tuple starting with one; with track_memory the entries count towards the
+    memory budgets of utils/memory.py and are released with their version when a budget is exceeded.
+    Concurrent misses on the same key are computed once (utils/singleflight.py).
+    """
+
+    def __init__(self, maxsize=32, track_memory=True):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._memory = memory_manager if track_memory else None
+        self._flights = SingleFlight()
+        _all_caches.add(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            value = self._data[key]
+        if self._memory is not None:
+            self._memory.touch(key)
+        return value
+
+    def set(self, key, value):
+        removed = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                removed.append(self._data.popitem(last=False)[0]) # 移除最久未使用的項目
+        if self._memory is not None: # 在快取鎖之外更新統計 (可能觸發淘汰並回頭呼叫 discard)
+            for old_key in removed:
+                self._memory.forget(self, old_key)
+            self._memory.track(self, key, value)
+
+    def discard(self, key):
+        sentinel = object()
+        with self._lock:
+            removed = self._data.pop(key, sentinel) is not sentinel
+        if removed and self._memory is not None:
+            self._memory.forget(self, key)
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for key, computing and storing it on a miss (once for concurrent callers)."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        def compute_and_store():
+            value = self.get(key, sentinel) # 前一次計算可能在上面的查詢之後才完成
+            if value is sentinel:
+                check_cancelled()
+                value = compute()
+                self.set(key, value)
+            return value
+        return self._flights.do(key, compute_and_store)
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._data)
+            self._data.clear()
+        if self._memory is not None:
+            for key in keys:
+                self._memory.forget(self, key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def clear_all_caches():
+    """Empties every in-process LRUCache (the shared on-disk dataset store is left untouched)."""
+    for cache in list(_all_caches):
+        cache.clear()
+
+
+# --- 已解析 DataFrame 快取 ---
+# 行程內 LRU 之外，解析結果也寫入跨工作行程共享的磁碟儲存 (utils/dataset_store.py)，
+# 其他工作行程遇到同一資料版本時直接 memory-map 載入，不需重新解析 JSON。
+# 實際上限由 utils/memory.py 的位元組預算決定；被淘汰的版本下次存取時從磁碟儲存重新載入。
+_dataframe_cache = LRUCache(maxsize=16)
+
+
+def read_stored_dataframe(data_json, data_version=None):
+    """Parses a stored DataFrame JSON once per dataset version. The returned frame is shared: treat it as read-only."""
+    if data_json is None:
+        return None
+    data_version = data_version or dataset_version(data_json)
+
+    def load():
+        with decode_timer():
+            return _load_shared(data_json, data_version)
+    return _dataframe_cache.get_or_compute(data_version, load)
+
+
+def _load_shared(data_json, data_version):
+    df = dataset_store.get(data_version)
+    if df is None:
+        df = pd.read_json(io.StringIO(data_json), orient='split')
+        try:
+            dataset_store.put(data_version, df)
+        except Exception as e: # 磁碟空間不足等狀況不影響本次請求
+            print(f"read_stored_dataframe: 無法寫入共享資料集儲存: {e}")
+    return df
+
+
+def parse_stored_dataframe(data_json):
+    """Parses a stored DataFrame JSON into a new, private (writable) frame, counted as callback decode time."""
+    with decode_timer():
+        return pd.read_json(io.StringIO(data_json), orient='split')
@@ -0,0 +1,153 @@
+import contextlib
+import functools
+import hashlib
+import mmap
+import multiprocessing
+import threading
+
+import flask
+import numpy as np
+from dash import ctx
+from dash.exceptions import PreventUpdate
+
+# --- 取消過時的圖表計算 ---
+# 使用者連續切換選單 (例如 dist-numerical-dropdown、rel-var1-dropdown) 時，每個中間選擇都會觸發一次完整的圖表計算，
+# 但瀏覽器只會採用最後一次的結果。頁面計算回調以 cancellable 包裝成可取消的工作：同一瀏覽器分頁對同一回調的
+# 較新請求開始時，舊請求即視為過時，在下一個取消檢查點 (check_cancelled) 結束並回傳 PreventUpdate。
+# 檢查點位於快取未命中的計算之前、相關矩陣 / bootstrap / 抽樣等分塊迴圈之間，以及等待繪圖行程時。
+#
+# assets/request_tab.js 為每個請求加上 TAB_HEADER：分頁 id 與該分頁內遞增的請求序號 (同一瀏覽器的多個分頁互不取消，
+# 請求亂序到達時也以瀏覽器送出的順序為準)；沒有此標頭的請求 (例如基準測試客戶端) 不會被取消。
+# 各 (分頁, 回調) 最新的序號記錄在 fork 前建立的匿名共享記憶體表中，gunicorn 的所有工作行程共用，
+# 較新請求由其他工作行程處理時也能取消舊請求。表以雜湊分槽，不同鍵碰撞同一槽時只會漏掉取消，不會誤取消其他分頁的請求。
+# ComputationCancelled 繼承 BaseException (與 asyncio.CancelledError 相同)，各圖表函式的 except Exception 不會攔下它。
+
+TAB_HEADER = 'X-Dash-Tab' # '<分頁 id>.<請求序號>'
+SLOTS = 4096
+
+_table = np.ndarray((SLOTS, 2), dtype=np.uint64, buffer=mmap.mmap(-1, SLOTS * 16)) # 每槽 [鍵雜湊, 最新序號]
+_table_lock = multiprocessing.Lock()
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {'cancelled': 0}
+
+
+class ComputationCancelled(BaseException):
+    """Raised at a checkpoint when a newer request has superseded the running computation."""
+
+
+class CancelToken:
+    """One callback request; cancelled once a later request (higher sequence) for the same tab and callback starts."""
+
+    def __init__(self, key_hash, sequence):
+        self.key_hash = key_hash
+        self.sequence = sequence
+        self.slot = key_hash % SLOTS
+
+    @property
+    def cancelled(self):
+        key_hash, sequence = _table[self.slot]
+        return int(key_hash) == self.key_hash and int(sequence) > self.sequence
+
+
+class SharedCancelToken:
+    """Token of a computation shared by several callers (utils/singleflight.py): cancelled only when all of them are."""
+
+    def __init__(self, token):
+        self._tokens = [token]
+        self._lock = threading.Lock()
+
+    def add(self, token):
+        with self._lock:
+            self._tokens.append(token)
+
+    @property
+    def cancelled(self):
+        with self._lock:
+            tokens = list(self._tokens)
+        return all(token is not None and token.cancelled for token in tokens)
+
+
+def _request_tab():
+    """(tab id, request sequence) from TAB_HEADER, or None."""
+    if not flask.has_request_context():
+        return None
+    tab, _, sequence = flask.request.headers.get(TAB_HEADER, '').partition('.')
+    if not (0 < len(tab) <= 64 and tab.isalnum() and sequence.isdigit() and len(sequence) <= 15):
+        return None
+    return tab, int(sequence)
+
+
+def _begin(name):
+    request_tab = _request_tab()
+    if request_tab is None:
+        return None
+    tab, sequence = request_tab
+    key_hash = int.from_bytes(hashlib.blake2b(f"{tab}\0{name}".encode('utf-8'), digest_size=8).digest(), 'little')
+    token = CancelToken(key_hash, sequence)
+    with _table_lock:
+        stored_hash, stored_sequence = (int(value) for value in _table[token.slot])
+        if stored_hash != key_hash or stored_sequence < sequence:
+            _table[token.slot] = (key_hash, sequence)
+    return token
+
+
+# --- 目前執行緒的取消權杖 ---
+def current_token():
+    return getattr(_local, 'token', None)
+
+
+@contextlib.contextmanager
+def use_token(token):
+    outer, _local.token = current_token(), token
+    try:
+        yield token
+    finally:
+        _local.token = outer
+
+
+def cancel_requested():
+    """True when the computation running in this thread has been superseded."""
+    token = current_token()
+    return token is not None and token.cancelled
+
+
+def check_cancelled():
+    """Cancellation checkpoint: raises ComputationCancelled if a newer request superseded this computation."""
+    if cancel_requested():
+        raise ComputationCancelled()
+
+
+def cancellable(unless_triggered_by=()):
+    """Decorator running a page callback as a cancellable job keyed by (browser tab, callback); superseded runs
+    return no update. Initial calls and runs triggered by any of unless_triggered_by ('id.property') always finish,
+    since they also reset outputs that a later run triggered by another input would not recompute.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            triggered = ctx.triggered_prop_ids
+            token = _begin(name)
+            if token is None or not triggered or any(prop_id in triggered for prop_id in unless_triggered_by):
+                return func(*args, **kwargs)
+            try:
+                with use_token(token):
+                    check_cancelled() # 較新的請求可能已先到達 (請求亂序)
+                    result = func(*args, **kwargs)
+                    check_cancelled() # 結果已過時：不必再序列化與傳送
+                    return result
+            except ComputationCancelled:
+                with _stats_lock:
+                    _stats['cancelled'] += 1
+                print(f"{name}: 已有較新的請求，取消過時的計算")
+                raise PreventUpdate from None
+        return wrapper
+    return decorator
+
+
+def cancellation_stats():
+    """{'cancelled': superseded callback runs stopped in this process}"""
+    with _stats_lock:
+        return dict(_stats)
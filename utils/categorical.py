@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from utils.cache import LRUCache
+
+# --- 類別編碼與 Top-N 分桶 ---
+# 每個 (資料版本, 欄位) 只做一次 factorize，之後的頻率表與 Top-N 分桶都以整數編碼 + np.bincount 計算，
+# 成本與類別數量無關。
+
+OTHER_LABEL = '其他' # Top-N 以外類別合併後的名稱
+MAX_TOP_N = 50
+
+_codes_cache = LRUCache(maxsize=64)
+_bucket_cache = LRUCache(maxsize=64)
+
+
+def get_category_codes(data_version, df, col):
+    """Cached (codes, levels) for a column; missing values get code -1."""
+    def compute():
+        try:
+            return pd.factorize(df[col], sort=True)
+        except TypeError: # 混合型別無法排序時保留出現順序
+            return pd.factorize(df[col], sort=False)
+    return _codes_cache.get_or_compute((data_version, col), compute)
+
+
+def get_frequency_table(data_version, df, col):
+    """Cached pandas Series of counts per level (descending), built from codes with np.bincount."""
+    def compute():
+        codes, levels = get_category_codes(data_version, df, col)
+        counts = np.bincount(codes[codes >= 0], minlength=len(levels))
+        return pd.Series(counts, index=levels, name=col).sort_values(ascending=False, kind='stable')
+    return _codes_cache.get_or_compute((data_version, col, 'freq'), compute)
+
+
+def count_levels(data_version, df, col):
+    """Number of distinct non-missing values in col (same as nunique) from the cached codes."""
+    return len(get_category_codes(data_version, df, col)[1])
+
+
+def _unique_labels(labels):
+    # 以字串顯示後相同的類別 (例如 1 與 '1'，或真實類別「其他」與合併類別) 依序加上 (2)、(3)… 區分
+    seen, unique = set(), []
+    for label in labels:
+        candidate, n = label, 1
+        while candidate in seen:
+            n += 1
+            candidate = f"{label} ({n})"
+        seen.add(candidate)
+        unique.append(candidate)
+    return unique
+
+
+def bucket_top_n(data_version, df, col, top_n):
+    """Categorical Series keeping the top_n most frequent levels and collapsing the rest into OTHER_LABEL.
+
+    Labels that collide once converted to strings get a numeric suffix, so a real '其他' level stays distinct.
+    """
+    def compute():
+        codes, levels = get_category_codes(data_version, df, col)
+        freq = np.bincount(codes[codes >= 0], minlength=len(levels))
+        if len(levels) <= top_n:
+            return pd.Series(pd.Categorical.from_codes(codes, categories=levels), index=df.index, name=col)
+        top_idx = np.argsort(-freq, kind='stable')[:top_n]
+        remap = np.full(len(levels) + 1, top_n, dtype=np.intp) # 最後一格對應缺失值 (-1)
+        remap[top_idx] = np.arange(top_n)
+        remap[-1] = -1
+        categories = _unique_labels([str(level) for level in levels[top_idx]] + [OTHER_LABEL])
+        bucketed = pd.Categorical.from_codes(remap[codes], categories=categories)
+        return pd.Series(bucketed, index=df.index, name=col)
+    return _bucket_cache.get_or_compute((data_version, col, top_n), compute)
+
+
+def normalize_top_n(value):
+    """Returns a valid Top-N integer or None when Top-N mode is off."""
+    try:
+        top_n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return min(top_n, MAX_TOP_N) if top_n > 0 else None
+
+
+# --- 交叉表引擎 ---
+# 以快取的整數編碼計算 np.bincount(codes1 * k2 + codes2)，不再對字串重新雜湊；
+# 結果依 (資料版本, 類別 1, 類別 2, Top-N, 加權欄位, 正規化方式) 快取，動態與靜態熱力圖共用。
+# 篩選後的資料本身就是不同的資料版本，因此篩選條件已包含在資料版本中。
+
+CROSSTAB_NORMALIZE_OPTIONS = [
+    {'label': '計數', 'value': 'none'},
+    {'label': '列百分比', 'value': 'index'},
+    {'label': '欄百分比', 'value': 'columns'},
+    {'label': '總百分比', 'value': 'all'},
+]
+
+_crosstab_cache = LRUCache(maxsize=64)
+
+
+def _axis_codes(data_version, df, col, top_n):
+    if top_n and count_levels(data_version, df, col) > top_n:
+        bucketed = bucket_top_n(data_version, df, col, top_n)
+        return bucketed.cat.codes.to_numpy(), np.asarray(bucketed.cat.categories)
+    codes, levels = get_category_codes(data_version, df, col)
+    return codes, np.asarray(levels)
+
+
+def compute_crosstab(data_version, df, cat1, cat2, top_n=None, value_col=None):
+    """Counts (or sums of value_col) per (cat1, cat2) cell from cached codes; same layout as pd.crosstab."""
+    codes1, levels1 = _axis_codes(data_version, df, cat1, top_n)
+    codes2, levels2 = _axis_codes(data_version, df, cat2, top_n)
+    k1, k2 = len(levels1), len(levels2)
+    valid = (codes1 >= 0) & (codes2 >= 0)
+    weights = None
+    if value_col:
+        values = df[value_col].to_numpy(dtype=float, na_value=np.nan)
+        valid &= np.isfinite(values)
+        weights = values[valid]
+    cells = codes1[valid].astype(np.int64) * k2 + codes2[valid]
+    counts = np.bincount(cells, minlength=k1 * k2).reshape(k1, k2)
+    table = counts if weights is None else np.bincount(cells, weights=weights, minlength=k1 * k2).reshape(k1, k2)
+    if weights is not None:
+        table = np.where(counts > 0, table, np.nan) # 與 pd.crosstab(values=..., aggfunc='sum') 相同，空格為 NaN
+    # 只保留實際出現的列與欄
+    rows, cols = counts.sum(axis=1) > 0, counts.sum(axis=0) > 0
+    return pd.DataFrame(table[rows][:, cols],
+                        index=pd.Index(levels1[rows], name=cat1),
+                        columns=pd.Index(levels2[cols], name=cat2))
+
+
+def get_crosstab(data_version, df, cat1, cat2, top_n=None, value_col=None, normalize='none'):
+    """Cached crosstab, optionally weighted by value_col and normalized by row ('index'), column or total ('all')."""
+    def raw_table():
+        return _crosstab_cache.get_or_compute(
+            (data_version, cat1, cat2, top_n, value_col, 'none'),
+            lambda: compute_crosstab(data_version, df, cat1, cat2, top_n, value_col))
+    if normalize not in ('index', 'columns', 'all'):
+        return raw_table() # 未正規化的表本身就是快取項目，不在同一個鍵的計算中再查詢自己
+
+    def compute():
+        table = raw_table()
+        if normalize == 'index':
+            return table.div(table.sum(axis=1), axis=0)
+        if normalize == 'columns':
+            return table / table.sum(axis=0)
+        return table / np.nansum(table.to_numpy())
+    return _crosstab_cache.get_or_compute((data_version, cat1, cat2, top_n, value_col, normalize), compute)
@@ -0,0 +1,393 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import LRUCache
+from utils.cancellation import check_cancelled
+from utils.render import CANCEL_POLL_SECONDS, attach_shared_memory
+
+# --- 相關係數引擎 ---
+# 以列區塊累加 NaN 遮罩後的矩陣乘積 (BLAS)，一次算出所有數值欄位的 pairwise-complete 相關矩陣，
+# 結果依資料版本快取；選取部分變數時直接從快取矩陣切片，不重新計算。
+# Spearman = 快取秩次上的 Pearson；Kendall 以 O(n log n) 反序數計算，變數對多時送到常駐的行程池 (forkserver 建立，
+# 秩次矩陣經共享記憶體傳遞) 平行處理。列數 × 變數對數 超過 KENDALL_MAX_WORK 時改以固定種子隨機抽樣的列計算，
+# 並在圖表標題註明 (kendall_note)。
+# 每個 gunicorn 工作行程各有一個 Kendall 行程池，預設大小為 CPU 數 / 工作行程數 (與 gunicorn.conf.py 的預設一致)，
+# 所有工作行程同時計算時合計不超過 CPU 數；可用 KENDALL_WORKERS 覆寫。
+
+ANNOTATE_MAX_VARS = 20 # 變數數量不超過此值時才在熱力圖上標示數值
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 200
+_CHUNK_ELEMENTS = 4_000_000 # 每個列區塊的元素上限 (列數 × 欄數)，控制暫存記憶體
+_WEB_WORKERS = int(os.environ.get('WEB_WORKERS', min(os.cpu_count() or 1, 4)))
+KENDALL_WORKERS = int(os.environ.get('KENDALL_WORKERS', max(1, (os.cpu_count() or 1) // max(_WEB_WORKERS, 1))))
+KENDALL_MAX_WORK = int(os.environ.get('KENDALL_MAX_WORK', 20_000_000)) # 列數 × 變數對數 的上限 (單核約 30 秒)，超過時抽樣
+KENDALL_MIN_SAMPLE = 1_000 # 抽樣時至少使用的列數
+KENDALL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+_KENDALL_PARALLEL_MIN_WORK = 2_000_000 # 列數 × 變數對數 超過此值才送到行程池
+_KENDALL_SAMPLE_SEED = 0
+
+CORR_METHOD_OPTIONS = [
+    {'label': 'Pearson', 'value': 'pearson'},
+    {'label': 'Spearman (秩相關)', 'value': 'spearman'},
+    {'label': 'Kendall (τ-b)', 'value': 'kendall'},
+]
+CORR_METHOD_LABELS = {'pearson': 'Pearson', 'spearman': 'Spearman', 'kendall': 'Kendall τ-b'} # 圖表標題用的簡稱
+
+CORR_ORDER_OPTIONS = [
+    {'label': '原始順序', 'value': 'original'},
+    {'label': '階層聚類排序', 'value': 'cluster'},
+]
+CORR_DISPLAY_OPTIONS = [
+    {'label': '相關矩陣', 'value': 'matrix'},
+    {'label': '最強的 K 組變數對', 'value': 'top_pairs'},
+]
+
+_correlation_cache = LRUCache(maxsize=16)
+_rank_cache = LRUCache(maxsize=8)
+_kendall_pair_cache = LRUCache(maxsize=50_000, track_memory=False) # 單一變數對的 τ 值 (純量，不計入記憶體預算)，鍵為 (資料版本, 抽樣列數, 欄位 1, 欄位 2)
+_order_cache = LRUCache(maxsize=64)
+
+
+def numeric_matrix(df):
+    """(float64 matrix, column names) of the numeric columns in df."""
+    cols = df.select_dtypes(include=np.number).columns
+    return df[cols].to_numpy(dtype=float, na_value=np.nan), list(cols)
+
+
+def _row_chunks(n, p):
+    step = max(1, _CHUNK_ELEMENTS // max(p, 1))
+    for start in range(0, n, step):
+        check_cancelled()
+        yield slice(start, min(start + step, n))
+
+
+def pearson_matrix(X):
+    """Pairwise-complete Pearson correlation (same semantics as DataFrame.corr) via blockwise matrix products."""
+    n, p = X.shape
+    valid = np.isfinite(X)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 先以各欄平均值置中，降低平方和相減時的數值誤差 (相關係數不受平移影響)
+        center = np.where(valid, X, 0.0).sum(axis=0) / valid.sum(axis=0)
+    center = np.nan_to_num(center)
+
+    if valid.all():
+        cross = np.zeros((p, p))
+        for rows in _row_chunks(n, p):
+            block = X[rows] - center
+            cross += block.T @ block
+        scale = np.sqrt(np.diag(cross))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = cross / np.outer(scale, scale)
+        if n < 2:
+            corr[:] = np.nan
+    else:
+        # 對每一對 (i, j) 只使用兩欄皆有值的列：以遮罩矩陣乘積一次累加所有配對的充分統計量
+        count = np.zeros((p, p))
+        sums = np.zeros((p, p)) # sums[i, j] = 欄 j 有值的列中，欄 i 的總和
+        squares = np.zeros((p, p))
+        cross = np.zeros((p, p))
+        for rows in _row_chunks(n, p):
+            mask = valid[rows].astype(float)
+            block = np.where(valid[rows], X[rows] - center, 0.0)
+            count += mask.T @ mask
+            sums += block.T @ mask
+            squares += (block * block).T @ mask
+            cross += block.T @ block
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = cross - sums * sums.T / count
+            var_x = squares - sums ** 2 / count
+            var_y = var_x.T
+            corr = cov / np.sqrt(var_x * var_y)
+            corr[(count < 2) | (var_x <= 0) | (var_y <= 0)] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    finite_diag = np.isfinite(np.diag(corr))
+    corr[np.diag_indices(p)] = np.where(finite_diag, 1.0, np.nan)
+    return corr
+
+
+def get_column_ranks(data_version, df):
+    """Cached (average ranks, column names) of the numeric columns; missing values stay NaN."""
+    def compute():
+        cols = df.select_dtypes(include=np.number).columns
+        ranks = df[cols].rank(method='average').to_numpy(dtype=float, na_value=np.nan)
+        return ranks, list(cols)
+    return _rank_cache.get_or_compute(data_version, compute)
+
+
+def get_correlation_matrix(data_version, df, method='pearson'):
+    """Cached Pearson or Spearman correlation DataFrame over every numeric column of the dataset version."""
+    def compute():
+        if method == 'spearman':
+            # 每欄只排序一次；有缺失值時以各欄自身的有效列排序 (與逐對重新排序的 pandas 結果略有差異)
+            X, cols = get_column_ranks(data_version, df)
+        else:
+            X, cols = numeric_matrix(df)
+        print(f"get_correlation_matrix: 計算 {len(cols)} 個數值欄位的 {method} 相關矩陣 ({len(df)} 列)")
+        return pd.DataFrame(pearson_matrix(X), index=cols, columns=cols)
+    return _correlation_cache.get_or_compute((data_version, method), compute)
+
+
+# --- Kendall τ-b (Knight 演算法) ---
+def count_inversions(values):
+    """Number of pairs i < j with values[i] > values[j], via a vectorized top-down merge sort (O(n log n))."""
+    values = np.asarray(values)
+    n = len(values)
+    if n < 2:
+        return 0
+    # 依 (值, 位置) 排序一次，再由大區塊往下逐層穩定分割成左右兩半；每層只需 O(n) 的累加與散佈
+    order = np.argsort(values, kind='stable')
+    position = np.arange(n)
+    size = 1 << (n - 1).bit_length() # 涵蓋所有元素的 2 的冪次區塊
+    total = 0
+    while size > 1:
+        half = size // 2
+        starts = order // size * size # 每個區塊在 order 中的起點 (區塊內的元素都在 [起點, 起點 + size) 位置)
+        is_left = order - starts < half
+        cum_left = np.cumsum(is_left)
+        left_at_start = np.r_[0, cum_left][starts]
+        left_before = cum_left - left_at_start # 同區塊中排在此元素之前 (值較小或同值而位置較前) 的左半部元素
+        left_count = np.clip(n - starts, 0, half)
+        right = ~is_left
+        total += int((left_count[right] - left_before[right]).sum()) # 左半部中大於右半部元素的個數
+        right_before = position + 1 - cum_left - (starts - left_at_start)
+        new_position = starts + np.where(is_left, left_before - 1, left_count + right_before - 1)
+        order[new_position] = order.copy()
+        size = half
+    return total
+
+
+def _tied_pairs(same_as_next):
+    breaks = np.flatnonzero(~same_as_next)
+    lengths = np.diff(np.r_[-1, breaks])
+    return int((lengths * (lengths - 1) // 2).sum())
+
+
+def kendall_tau(x, y):
+    """Kendall tau-b of two integer rank arrays (pairs with a missing value must already be removed)."""
+    n = len(x)
+    if n < 2:
+        return np.nan
+    order = np.lexsort((y, x))
+    xs, ys = x[order], y[order]
+    same_x = xs[:-1] == xs[1:]
+    same_y_sorted = np.sort(y)
+    n0 = n * (n - 1) // 2
+    n1 = _tied_pairs(np.r_[same_x, False])
+    n2 = _tied_pairs(np.r_[same_y_sorted[:-1] == same_y_sorted[1:], False])
+    n3 = _tied_pairs(np.r_[same_x & (ys[:-1] == ys[1:]), False])
+    denominator = np.sqrt(float(n0 - n1) * float(n0 - n2))
+    if denominator == 0:
+        return np.nan
+    return (n0 - n1 - n2 + n3 - 2 * count_inversions(ys)) / denominator
+
+
+def _kendall_pairs(pairs, ranks):
+    results = []
+    for i, j in pairs:
+        check_cancelled() # 行程池的工作行程中沒有取消權杖，不會中斷
+        valid = (ranks[:, i] >= 0) & (ranks[:, j] >= 0)
+        results.append(kendall_tau(ranks[valid, i], ranks[valid, j]))
+    return results
+
+
+def _kendall_task(handle, pairs):
+    # 在行程池中執行：直接使用共享記憶體中的秩次矩陣 (不複製)
+    name, dtype, shape = handle
+    shm = attach_shared_memory(name)
+    ranks = None
+    try:
+        ranks = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        return _kendall_pairs(pairs, ranks)
+    finally:
+        ranks = None # 關閉前釋放指向共享記憶體的陣列
+        shm.close()
+
+
+_kendall_pool = None
+_kendall_pool_lock = threading.Lock()
+
+
+def _get_kendall_pool():
+    global _kendall_pool
+    with _kendall_pool_lock:
+        if _kendall_pool is None:
+            # 常駐行程池：只建立一次；forkserver 不會從已有多個執行緒的 web 行程直接 fork
+            _kendall_pool = ProcessPoolExecutor(max_workers=KENDALL_WORKERS,
+                                                mp_context=multiprocessing.get_context(KENDALL_START_METHOD))
+        return _kendall_pool
+
+
+def shutdown_kendall_pool():
+    global _kendall_pool
+    with _kendall_pool_lock:
+        pool, _kendall_pool = _kendall_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _parallel_kendall_pairs(int_ranks, missing, workers):
+    shm = shared_memory.SharedMemory(create=True, size=max(int_ranks.nbytes, 1))
+    try:
+        np.ndarray(int_ranks.shape, dtype=int_ranks.dtype, buffer=shm.buf)[...] = int_ranks
+        handle = (shm.name, int_ranks.dtype.str, int_ranks.shape)
+        chunks = [missing[k::workers * 4] for k in range(min(workers * 4, len(missing)))] # 較小的工作單位，取消時可撤回
+        futures = [_get_kendall_pool().submit(_kendall_task, handle, chunk) for chunk in chunks]
+        try:
+            values = {}
+            for chunk, future in zip(chunks, futures):
+                while True:
+                    try:
+                        values.update(zip(chunk, future.result(timeout=CANCEL_POLL_SECONDS)))
+                        break
+                    except FutureTimeoutError:
+                        check_cancelled()
+            return values
+        finally:
+            for future in futures:
+                future.cancel() # 請求過時或失敗時撤回尚未開始的工作
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def kendall_sample_size(n_rows, n_cols):
+    """Rows to sample for a Kendall matrix over n_cols columns, or None when all n_rows fit KENDALL_MAX_WORK."""
+    pairs = n_cols * (n_cols - 1) // 2
+    if pairs == 0 or n_rows * pairs <= KENDALL_MAX_WORK:
+        return None
+    sample = max(KENDALL_MIN_SAMPLE, KENDALL_MAX_WORK // pairs)
+    return sample if sample < n_rows else None
+
+
+def kendall_note(df, cols):
+    """Chart title suffix when the Kendall matrix for cols is computed on a row sample."""
+    sample = kendall_sample_size(len(df), len(cols))
+    return f" (隨機抽樣 {sample:,} / {len(df):,} 列計算)" if sample else ""
+
+
+def kendall_matrix(data_version, df, cols):
+    """Kendall tau-b matrix for the selected columns; each pair is cached and missing pairs run in a process pool.
+
+    Above KENDALL_MAX_WORK (rows × pairs) the pairs use a fixed-seed uniform row sample (see kendall_note).
+    """
+    ranks, rank_cols = get_column_ranks(data_version, df)
+    position = {col: k for k, col in enumerate(rank_cols)}
+    cols = [col for col in cols if col in position]
+    # 平均秩次 × 2 為整數且保留同值關係；缺失值以 -1 表示 (τ 只取決於順序，逐對去除缺失列後仍精確)
+    int_ranks = np.where(np.isfinite(ranks), ranks * 2, -1).astype(np.int64)[:, [position[col] for col in cols]]
+    sample = kendall_sample_size(len(int_ranks), len(cols))
+    if sample:
+        rows = np.sort(np.random.default_rng(_KENDALL_SAMPLE_SEED).choice(len(int_ranks), sample, replace=False))
+        int_ranks = int_ranks[rows]
+
+    result = np.eye(len(cols))
+    missing = []
+    for a in range(len(cols)):
+        for b in range(a + 1, len(cols)):
+            value = _kendall_pair_cache.get((data_version, sample, cols[a], cols[b]))
+            if value is None:
+                missing.append((a, b))
+            else:
+                result[a, b] = result[b, a] = value
+
+    if missing:
+        workers = min(KENDALL_WORKERS, len(missing))
+        note = f"，抽樣 {sample:,} 列" if sample else ""
+        print(f"kendall_matrix: 計算 {len(missing)} 組變數對 ({len(df)} 列{note}，{workers} 個行程)")
+        values = None
+        if workers > 1 and len(int_ranks) * len(missing) >= _KENDALL_PARALLEL_MIN_WORK:
+            try:
+                values = _parallel_kendall_pairs(int_ranks, missing, workers)
+            except BrokenProcessPool:
+                print("kendall_matrix: 行程池異常終止，重新建立並改在本行程計算")
+                shutdown_kendall_pool()
+        if values is None:
+            values = dict(zip(missing, _kendall_pairs(missing, int_ranks)))
+        for (a, b), value in values.items():
+            _kendall_pair_cache.set((data_version, sample, cols[a], cols[b]), value)
+            result[a, b] = result[b, a] = value
+
+    for a, col in enumerate(cols):
+        if not (int_ranks[:, a] >= 0).any() or len(np.unique(int_ranks[int_ranks[:, a] >= 0, a])) < 2:
+            result[a, a] = np.nan # 全缺失或常數欄位
+    return pd.DataFrame(result, index=cols, columns=cols)
+
+
+def select_correlation(data_version, df, cols, method='pearson'):
+    """Correlation sub-matrix for the selected columns (sliced from the cached full matrix, or pairwise Kendall)."""
+    if method == 'kendall':
+        return kendall_matrix(data_version, df, cols)
+    corr = get_correlation_matrix(data_version, df, method)
+    cols = [col for col in cols if col in corr.index]
+    return corr.loc[cols, cols]
+
+
+def cluster_order(corr):
+    """Leaf order of average-linkage clustering on 1 - |r| (strongly related variables end up adjacent)."""
+    p = len(corr)
+    if p < 3:
+        return np.arange(p)
+    values = np.abs(np.asarray(corr, dtype=float))
+    dist = 1.0 - np.nan_to_num(values, nan=0.0)
+    np.fill_diagonal(dist, np.inf)
+    sizes = np.ones(p)
+    members = [[i] for i in range(p)]
+    active = np.ones(p, dtype=bool)
+    for _ in range(p - 1):
+        flat = int(np.argmin(dist))
+        i, j = divmod(flat, p)
+        if i > j:
+            i, j = j, i
+        # 平均連結：新群集到其他群集的距離為兩群距離依大小加權平均
+        merged = (sizes[i] * dist[i] + sizes[j] * dist[j]) / (sizes[i] + sizes[j])
+        merged[~active] = np.inf
+        merged[[i, j]] = np.inf
+        dist[i, :] = merged
+        dist[:, i] = merged
+        dist[j, :] = np.inf
+        dist[:, j] = np.inf
+        sizes[i] += sizes[j]
+        members[i] = members[i] + members[j]
+        active[j] = False
+    return np.array(members[int(np.flatnonzero(active)[0])])
+
+
+def order_correlation(data_version, corr, order, method='pearson'):
+    """Reorders a correlation sub-matrix; cluster ordering is cached per (version, method, columns)."""
+    if order != 'cluster' or len(corr) < 3:
+        return corr
+    key = (data_version, method, tuple(corr.index))
+    leaves = _order_cache.get_or_compute(key, lambda: cluster_order(corr.to_numpy()))
+    return corr.iloc[leaves, leaves]
+
+
+def top_pairs(corr, k=DEFAULT_TOP_K):
+    """The k variable pairs with the largest |r| from the upper triangle, strongest first."""
+    values = corr.to_numpy()
+    rows, cols = np.triu_indices(len(values), k=1)
+    r = values[rows, cols]
+    keep = np.isfinite(r)
+    rows, cols, r = rows[keep], cols[keep], r[keep]
+    k = min(k, len(r))
+    if k == 0:
+        return pd.DataFrame(columns=['變數 1', '變數 2', '相關係數'])
+    idx = np.argpartition(-np.abs(r), k - 1)[:k]
+    idx = idx[np.argsort(-np.abs(r[idx]), kind='stable')]
+    names = np.asarray(corr.index)
+    return pd.DataFrame({'變數 1': names[rows[idx]], '變數 2': names[cols[idx]], '相關係數': r[idx]})
+
+
+def normalize_top_k(value):
+    """Valid K for the top pairs view (defaults to DEFAULT_TOP_K)."""
+    try:
+        k = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_TOP_K
+    return min(max(k, 1), MAX_TOP_K)
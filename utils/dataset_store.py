@@ -0,0 +1,261 @@
+import math
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+import numpy as np
+import orjson
+import pandas as pd
+
+# --- 跨工作行程共享的資料集儲存 ---
+# 上傳的資料以 JSON 存在瀏覽器 (dcc.Store)，每個請求都帶著完整資料，所以任何工作行程都能處理任一工作階段；
+# 但每個行程第一次遇到某個資料版本時都得重新解析 JSON。解析結果依資料版本寫入本機磁碟：
+# 數值 / 日期 / 布林欄位存成 .npy，以唯讀 memory-map 載入 (各行程共用作業系統的頁面快取，不重複佔用記憶體)；
+# 文字及其他欄位、欄名與索引存成 JSON (資料本來就來自 JSON)，不使用 pickle，讀取磁碟檔案不會執行任何程式碼。
+# 預設目錄位於目前使用者的快取目錄 (不在所有人共用的暫存目錄)，以 0700 建立；目錄不屬於目前使用者
+# 或其他使用者可存取時停用儲存 (改為各行程自行解析)，避免讀取他人放置的檔案。
+# 寫入在解析資料的回調中同步進行，因此是否能以 JSON 無損保存依 dtype 判斷 (object 欄位逐值檢查型別)，不重新解析寫出的 JSON。
+
+APP_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'dataviz')
+DATASET_STORE_DIR = os.environ.get('DATASET_STORE_DIR') or os.path.join(APP_CACHE_DIR, 'datasets')
+DATASET_STORE_MAX_BYTES = int(os.environ.get('DATASET_STORE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+MEMMAP_KINDS = 'biufcmM' # 可直接存成 .npy 並 memory-map 的 numpy dtype 種類
+META_FILE = 'meta.json'
+_JSON_SCALARS = (str, int, float, bool) # object 欄位中可原樣寫入並讀回的值型別
+
+
+def _is_memmappable(series):
+    dtype = series.dtype
+    return isinstance(dtype, np.dtype) and dtype.kind in MEMMAP_KINDS
+
+
+def _dumps(value):
+    return orjson.dumps(value, default=str) # Timestamp 等轉為字串，還原時依 dtype 解析
+
+
+def private_directory(path):
+    """Creates path with mode 0700 if needed; True when it is a directory owned by this user and closed to others."""
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path) # 不跟隨符號連結
+        if not stat.S_ISDIR(info.st_mode) or (hasattr(os, 'getuid') and info.st_uid != os.getuid()):
+            return False
+        if info.st_mode & 0o077:
+            os.chmod(path, 0o700) # 自己擁有的目錄：收回其他使用者的權限
+        return True
+    except OSError:
+        return False
+
+
+# --- 欄位編碼 (JSON + .npy) ---
+def _json_lossless(dtype, data):
+    """True when data (the JSON values of an array of this dtype) decode back to the same array."""
+    def finite(value):
+        return value is None or math.isfinite(value) # inf 寫成 JSON 後變成 null
+    if isinstance(dtype, (pd.StringDtype, pd.BooleanDtype, pd.DatetimeTZDtype)):
+        return True
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biumM':
+        return True
+    if pd.api.types.is_float_dtype(dtype):
+        return all(finite(value) for value in data)
+    if pd.api.types.is_integer_dtype(dtype): # 可為空的 Int64 等
+        return True
+    if isinstance(dtype, np.dtype) and dtype.kind == 'O':
+        # 自訂物件、numpy 純量等會被 default=str 轉成字串，讀回的值不同
+        return all(value is None or (type(value) in _JSON_SCALARS and (type(value) is not float or finite(value)))
+                   for value in data)
+    return False # Period、Interval 等其他擴充型別
+
+
+def _encode_values(values):
+    # 缺失值一律寫成 null，還原時依原 dtype 轉回 NaN / None / NaT
+    data = pd.Series(values, copy=False).to_numpy(dtype=object, na_value=None).tolist()
+    if not _json_lossless(values.dtype, data):
+        raise TypeError(f"{values.dtype} 的值無法以 JSON 無損保存")
+    return {'kind': 'values', 'dtype': str(values.dtype)}, data
+
+
+def _decode_values(info, data):
+    return pd.array(data, dtype=info['dtype'])
+
+
+def _encode_column(values):
+    """(meta entry, .npy array or None, JSON values or None) of a Series or Index."""
+    if _is_memmappable(values):
+        return {'kind': 'npy'}, np.ascontiguousarray(values.to_numpy()), None
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        categorical = values.array
+        categories_info, categories = _encode_values(categorical.categories)
+        info = {'kind': 'category', 'ordered': bool(categorical.ordered), 'categories': categories_info}
+        return info, np.asarray(categorical.codes), categories
+    info, data = _encode_values(values)
+    return info, None, data
+
+
+def _decode_column(info, array, data):
+    if info['kind'] == 'npy':
+        return array
+    if info['kind'] == 'category':
+        categories = pd.Index(_decode_values(info['categories'], data))
+        return pd.Categorical.from_codes(np.asarray(array), categories=categories, ordered=info['ordered'])
+    return _decode_values(info, data)
+
+
+def _encode_index(index):
+    if isinstance(index, pd.RangeIndex):
+        return {'kind': 'range', 'start': index.start, 'stop': index.stop, 'step': index.step, 'name': index.name}, None
+    if isinstance(index, pd.MultiIndex):
+        raise TypeError("MultiIndex 不支援")
+    info, array, data = _encode_column(index)
+    return dict(info, name=index.name), (array if array is not None else data)
+
+
+def _decode_index(info, payload):
+    if info['kind'] == 'range':
+        return pd.RangeIndex(info['start'], info['stop'], info['step'], name=info['name'])
+    if info['kind'] == 'npy':
+        return pd.Index(payload, name=info['name'], copy=False)
+    return pd.Index(_decode_values(info, payload), name=info['name'])
+
+
+class SharedDatasetStore:
+    """Parsed DataFrames on local disk, keyed by dataset version and shared by every worker process."""
+
+    def __init__(self, directory=DATASET_STORE_DIR, max_bytes=DATASET_STORE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._usable = None # 第一次使用時檢查目錄
+
+    def usable(self):
+        """True when the store directory is private to this user (checked once per process)."""
+        if self._usable is None:
+            self._usable = private_directory(self.directory)
+            if not self._usable:
+                print(f"SharedDatasetStore: {self.directory} 不屬於目前使用者或其他使用者可存取，停用共享資料集儲存")
+        return self._usable
+
+    def path(self, data_version):
+        return os.path.join(self.directory, data_version)
+
+    def get(self, data_version):
+        """Memory-mapped, read-only DataFrame for data_version, or None if no worker has stored it yet."""
+        if not self.usable():
+            return None
+        path = self.path(data_version)
+        try:
+            with open(os.path.join(path, META_FILE), 'rb') as f:
+                meta = orjson.loads(f.read())
+            columns = {}
+            for position, info in enumerate(meta['kinds']):
+                array = data = None
+                if info['kind'] in ('npy', 'category'):
+                    # 以一般 ndarray 檢視包裝 memory-map (不複製)，避免 np.memmap 子類別在運算結果中擴散
+                    array = np.asarray(np.load(os.path.join(path, f"{position}.npy"), mmap_mode='r', allow_pickle=False))
+                if info['kind'] in ('values', 'category'):
+                    with open(os.path.join(path, f"{position}.json"), 'rb') as f:
+                        data = orjson.loads(f.read())
+                columns[position] = _decode_column(info, array, data)
+            index_info = meta['index']
+            if index_info['kind'] == 'range':
+                index_payload = None
+            elif index_info['kind'] == 'npy':
+                index_payload = np.asarray(np.load(os.path.join(path, 'index.npy'), mmap_mode='r', allow_pickle=False))
+            else:
+                with open(os.path.join(path, 'index.json'), 'rb') as f:
+                    index_payload = orjson.loads(f.read())
+            index = _decode_index(index_info, index_payload)
+            os.utime(path) # 更新 LRU 時間戳記
+        except (OSError, ValueError, KeyError, TypeError): # 尚未寫入、剛被其他行程淘汰或檔案損毀
+            return None
+        df = pd.DataFrame(columns, index=index, copy=False)
+        df.columns = pd.Index(meta['columns'])
+        return df
+
+    def put(self, data_version, df):
+        """Writes df under data_version (atomically; a version already stored by another worker is kept)."""
+        if not self.usable():
+            return None
+        path = self.path(data_version)
+        if os.path.isfile(os.path.join(path, META_FILE)):
+            return path
+        shutil.rmtree(path, ignore_errors=True) # 舊格式或寫到一半的殘留
+        tmp_path = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            kinds = []
+            for position in range(df.shape[1]):
+                try:
+                    info, array, data = _encode_column(df.iloc[:, position])
+                except TypeError as e:
+                    raise TypeError(f"欄位 {df.columns[position]!r}: {e}") from None
+                if array is not None:
+                    np.save(os.path.join(tmp_path, f"{position}.npy"), array, allow_pickle=False)
+                if data is not None:
+                    with open(os.path.join(tmp_path, f"{position}.json"), 'wb') as f:
+                        f.write(_dumps(data))
+                kinds.append(info)
+            index_info, index_payload = _encode_index(df.index)
+            if index_info['kind'] == 'npy':
+                np.save(os.path.join(tmp_path, 'index.npy'), index_payload, allow_pickle=False)
+            elif index_info['kind'] != 'range':
+                with open(os.path.join(tmp_path, 'index.json'), 'wb') as f:
+                    f.write(_dumps(index_payload))
+            meta = {'columns': list(df.columns), 'index': index_info, 'kinds': kinds}
+            if list(pd.Index(orjson.loads(_dumps(meta['columns'])))) != list(df.columns):
+                raise TypeError("欄名無法以 JSON 無損保存")
+            with open(os.path.join(tmp_path, META_FILE), 'wb') as f:
+                f.write(_dumps(meta))
+            os.rename(tmp_path, path) # 原子性發布；其他行程已寫入同一版本時 rename 失敗，保留既有檔案
+        except (OSError, TypeError, ValueError) as e:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not isinstance(e, OSError):
+                print(f"SharedDatasetStore: 不儲存資料版本 {data_version}: {e}")
+            return None
+        self._evict()
+        return path
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        entries = []
+        for name in names:
+            if name.startswith('.'):
+                continue
+            full = os.path.join(self.directory, name)
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(full))
+                entries.append((full, size, os.stat(full).st_mtime))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self):
+        # 總大小超過上限時刪除最久未使用的資料集，直到降到上限的 80%；已 memory-map 的檔案在刪除後仍可讀取
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            target = self.max_bytes * 0.8
+            removed = 0
+            for full, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                if total <= target:
+                    break
+                shutil.rmtree(full, ignore_errors=True)
+                total -= size
+                removed += 1
+            print(f"SharedDatasetStore: 淘汰 {removed} 個資料集，目前 {total / 1024 / 1024:.1f} MB")
+
+    def clear(self):
+        if not self.usable():
+            return
+        with self._lock:
+            for full, _, _ in self._entries():
+                shutil.rmtree(full, ignore_errors=True)
+
+
+dataset_store = SharedDatasetStore()
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from utils.cancellation import check_cancelled
+
+# --- 保留形狀的降採樣 ---
+# 資料量超過圖表能有效呈現的點數時，在 px.scatter / px.box 之前先抽樣：
+# 分層抽樣 (各組依比例配額，並保證保留極值與離群值) 或 LTTB (適用於有序的 x)。
+# 分層抽樣刻意偏向極端值，只用於繪製的點；分位數、核密度等統計量使用全部資料或均勻抽樣 (random_indices)。
+
+MAX_PLOT_POINTS = 5000 # 單張圖表最多傳送的點數
+SAMPLING_SEED = 42 # 固定亂數種子，確保結果可重現
+OUTLIER_SHARE = 0.2 # 配額中最多保留給離群值的比例
+
+SAMPLING_OPTIONS = [
+    {'label': '分層抽樣 (保留極端值)', 'value': 'stratified'},
+    {'label': 'LTTB (依 x 排序)', 'value': 'lttb'},
+    {'label': '不抽樣', 'value': 'none'},
+]
+
+
+def _group_codes(df, group_col):
+    if group_col:
+        codes, uniques = pd.factorize(df[group_col], sort=False, use_na_sentinel=False)
+        return codes, len(uniques)
+    return np.zeros(len(df), dtype=np.intp), 1
+
+
+def _extreme_mask(values, codes, k, max_outliers):
+    """Marks per-group min/max rows plus the most extreme IQR outliers (at most max_outliers)."""
+    n = len(values)
+    mask = np.zeros(n, dtype=bool)
+    series = pd.Series(values)
+    finite = np.isfinite(values)
+    if not finite.any():
+        return mask
+    grouped = series[finite].groupby(codes[finite])
+    mask[grouped.idxmin().to_numpy()] = True
+    mask[grouped.idxmax().to_numpy()] = True
+
+    # 每組 1.5 IQR 圍欄之外的點依超出距離排序，只保留最極端的部分
+    q1 = grouped.quantile(0.25).reindex(range(k)).to_numpy()
+    q3 = grouped.quantile(0.75).reindex(range(k)).to_numpy()
+    iqr = q3 - q1
+    lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+    safe_codes = np.clip(codes, 0, k - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        excess = np.maximum(lower[safe_codes] - values, values - upper[safe_codes])
+        score = np.where(finite & (excess > 0), excess / np.where(iqr[safe_codes] > 0, iqr[safe_codes], 1.0), 0.0)
+    outliers = np.flatnonzero(score > 0)
+    if len(outliers) > max_outliers:
+        outliers = outliers[np.argpartition(score[outliers], -max_outliers)[-max_outliers:]]
+    mask[outliers] = True
+    return mask
+
+
+def stratified_indices(df, value_cols, group_col=None, max_points=MAX_PLOT_POINTS, seed=SAMPLING_SEED):
+    """Row positions of a per-group proportional sample that always keeps extremes and outliers."""
+    n = len(df)
+    if n <= max_points:
+        return np.arange(n)
+    codes, k = _group_codes(df, group_col)
+    keep = np.zeros(n, dtype=bool)
+    max_outliers = max(int(max_points * OUTLIER_SHARE) // max(len(value_cols), 1), 1)
+    for col in value_cols:
+        if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]):
+            values = df[col].to_numpy(dtype=float, na_value=np.nan)
+            keep |= _extreme_mask(values, codes, k, max_outliers)
+
+    # 剩餘配額依各組剩餘列數等比例分配，每組至少一列
+    budget = max(max_points - int(keep.sum()), 0)
+    remaining = np.bincount(codes[~keep], minlength=k)
+    quota = np.floor(budget * remaining / max(remaining.sum(), 1)).astype(np.intp)
+    quota = np.minimum(np.maximum(quota, (remaining > 0).astype(np.intp)), remaining)
+
+    # 以隨機優先序在組內排名，一次向量化選出各組前 quota 名
+    rng = np.random.default_rng(seed)
+    candidates = np.flatnonzero(~keep)
+    priority = rng.random(len(candidates))
+    cand_codes = codes[candidates]
+    order = np.lexsort((priority, cand_codes))
+    sorted_codes = cand_codes[order]
+    group_start = np.searchsorted(sorted_codes, np.arange(k))
+    rank = np.arange(len(order)) - group_start[sorted_codes]
+    chosen = candidates[order[rank < quota[sorted_codes]]]
+    keep[chosen] = True
+    return np.flatnonzero(keep)
+
+
+def random_indices(n, max_points=MAX_PLOT_POINTS, seed=SAMPLING_SEED):
+    """Sorted row positions of a uniform random sample (unbiased, unlike stratified_indices)."""
+    if n <= max_points:
+        return np.arange(n)
+    return np.sort(np.random.default_rng(seed).choice(n, max_points, replace=False))
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets over x-sorted arrays; returns the selected positions."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[end:next_end].mean() if next_end > end else x[n - 1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[n - 1]
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return selected
+
+
+def lttb_group_indices(df, x_col, y_col, group_col=None, max_points=MAX_PLOT_POINTS):
+    """Applies LTTB per group with point budgets proportional to group size."""
+    x_series = df[x_col]
+    if pd.api.types.is_datetime64_any_dtype(x_series):
+        x_all = x_series.astype('int64').to_numpy(dtype=float)
+    else:
+        x_all = x_series.to_numpy(dtype=float, na_value=np.nan)
+    y_all = df[y_col].to_numpy(dtype=float, na_value=np.nan)
+    valid = np.flatnonzero(np.isfinite(x_all) & np.isfinite(y_all))
+    codes, k = _group_codes(df, group_col)
+    sizes = np.bincount(codes[valid], minlength=k)
+    selected = []
+    for g in range(k):
+        check_cancelled()
+        members = valid[codes[valid] == g]
+        if len(members) == 0:
+            continue
+        members = members[np.argsort(x_all[members], kind='stable')]
+        n_out = max(int(max_points * sizes[g] / max(len(valid), 1)), 3)
+        picked = lttb_indices(x_all[members], y_all[members], n_out)
+        selected.append(members[picked])
+    if not selected:
+        return np.arange(0)
+    return np.sort(np.concatenate(selected))
+
+
+def downsample_for_plot(df, x_col, y_col, group_col=None, method='stratified',
+                        max_points=MAX_PLOT_POINTS, seed=SAMPLING_SEED):
+    """Returns (plot_df, info). info is None when no sampling was applied."""
+    total = len(df)
+    if method == 'none' or total <= max_points:
+        return df, None
+    if method == 'lttb' and x_col is not None and (
+            pd.api.types.is_numeric_dtype(df[x_col]) or pd.api.types.is_datetime64_any_dtype(df[x_col])):
+        positions = lttb_group_indices(df, x_col, y_col, group_col, max_points)
+        info = {'method': 'LTTB', 'n': len(positions), 'total': total, 'seed': None}
+    else:
+        value_cols = [col for col in (x_col, y_col) if col is not None]
+        positions = stratified_indices(df, value_cols, group_col, max_points, seed)
+        info = {'method': '分層抽樣', 'n': len(positions), 'total': total, 'seed': seed}
+    return df.iloc[positions], info
+
+
+def sampling_note(info):
+    """Chart title suffix describing the effective sample size and seed."""
+    if not info:
+        return ""
+    note = f"{info['method']} {info['n']:,} / {info['total']:,} 點"
+    if info['seed'] is not None:
+        note += f"，seed={info['seed']}"
+    return f" ({note})"
@@ -0,0 +1,283 @@
+import numpy as np
+import pandas as pd
+import plotly.colors
+import plotly.io as pio
+
+from utils.categorical import get_category_codes
+from utils.figure_encoding import typed_array
+
+# --- 快速互動圖表建構 ---
+# plotly.express 會重塑資料框、逐組 groupby 建立 trace 並驗證每個屬性，對本專案的圖表而言這些開銷往往比資料本身還大。
+# 動態圖表改由預先彙總 / 抽樣好的 NumPy 陣列直接組成 plain dict 圖表 (不建立 graph_objects，不做屬性驗證)，
+# 數值陣列直接編碼為 typed array，版面與配色沿用 px 的預設範本。「產生程式碼」片段仍使用 plotly.express。
+
+MAX_HISTOGRAM_BINS = 200
+WEBGL_MIN_POINTS = 1000 # 與 px 相同：點數超過此值時改用 scattergl
+TRANSITION_DURATION = 300
+RUG_DOMAIN_SPLIT = 0.74 # 直方圖主圖與上方地毯圖的分界
+
+_template_cache = {}
+
+
+def default_template():
+    """Plain-dict copy of the current default plotly template (converted once per template name)."""
+    name = pio.templates.default
+    if name not in _template_cache:
+        _template_cache[name] = pio.templates[name].to_plotly_json()
+    return _template_cache[name]
+
+
+def trace_colors(n):
+    """First n colors of the template colorway (cycled), matching px's discrete color sequence."""
+    colorway = default_template().get('layout', {}).get('colorway') or plotly.colors.qualitative.Plotly
+    return [colorway[i % len(colorway)] for i in range(n)]
+
+
+def split_groups(series):
+    """(codes, labels) of a grouping column (sorted levels, missing values get -1); one unnamed group if series is None."""
+    if series is None:
+        return None, [None]
+    try:
+        codes, levels = pd.factorize(series, sort=True)
+    except TypeError: # 混合型別無法排序時保留出現順序
+        codes, levels = pd.factorize(series, sort=False)
+    return codes, [str(level) for level in levels]
+
+
+def category_groups(data_version, df, col):
+    """split_groups for a full-dataset column, reusing the cached category codes."""
+    if not col:
+        return None, [None]
+    codes, levels = get_category_codes(data_version, df, col)
+    return codes, [str(level) for level in levels]
+
+
+def _group_masks(codes, labels):
+    for i, label in enumerate(labels):
+        yield i, label, (slice(None) if codes is None else codes == i)
+
+
+def _legend(group_name):
+    return {'legend': {'title': {'text': group_name}, 'tracegroupgap': 0}} if group_name else {}
+
+
+def _prefix(group_name, label):
+    return f"{group_name}={label}<br>" if group_name and label is not None else ""
+
+
+def figure(data, **layout):
+    """Plotly figure as a plain dict with the default template applied."""
+    return {'data': data, 'layout': {'template': default_template(), 'margin': {'t': 60}, **layout}}
+
+
+def with_axis_titles(fig, x_title=None, y_title=None):
+    """Sets axis titles and the standard transition on a plain-dict figure; returns fig."""
+    layout = fig['layout']
+    for axis, text in (('xaxis', x_title), ('yaxis', y_title)):
+        if text is not None:
+            layout[axis] = {**layout.get(axis, {}), 'title': {'text': text}}
+    layout['transition'] = {'duration': TRANSITION_DURATION}
+    return fig
+
+
+def message_figure(title):
+    """Empty figure with only a title (prompts and error messages)."""
+    return figure([], title={'text': title})
+
+
+def warning_figure(message):
+    """Blank figure with a centred warning message (too many categories etc.)."""
+    return figure([], title={'text': "警告"}, xaxis={'visible': False}, yaxis={'visible': False}, plot_bgcolor='white',
+                  annotations=[{'text': message, 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 0.5,
+                                'showarrow': False, 'font': {'size': 14}}])
+
+
+# --- 直方圖 (伺服器端分箱) ---
+def histogram_edges(values, max_bins=MAX_HISTOGRAM_BINS):
+    """Shared bin edges for all groups ('auto' rule of numpy, capped at max_bins)."""
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return np.array([0.0, 1.0])
+    edges = np.histogram_bin_edges(finite, bins='auto')
+    if len(edges) - 1 > max_bins:
+        edges = np.linspace(finite.min(), finite.max(), max_bins + 1)
+    return edges
+
+
+def histogram_counts(values, codes, k, edges):
+    """(k, n_bins) counts per group in one bincount pass; the last bin is closed like np.histogram."""
+    n_bins = len(edges) - 1
+    valid = np.isfinite(values) & (values >= edges[0]) & (values <= edges[-1])
+    if codes is not None:
+        valid &= codes >= 0
+    bins = np.clip(np.searchsorted(edges, values[valid], side='right') - 1, 0, n_bins - 1)
+    group = 0 if codes is None else codes[valid]
+    return np.bincount(group * n_bins + bins, minlength=k * n_bins).reshape(k, n_bins)
+
+
+def histogram_figure(values, groups, title, value_name, group_name=None, rug_values=None, rug_groups=None):
+    """Stacked histogram of pre-binned counts per group, with an optional rug (sampled points) above it.
+
+    groups / rug_groups are (codes, labels) from split_groups or get_category_codes.
+    """
+    codes, labels = groups
+    edges = histogram_edges(values)
+    counts = histogram_counts(values, codes, len(labels), edges)
+    centers, widths = (edges[:-1] + edges[1:]) / 2, np.diff(edges)
+    ranges = [f"{low:.4g} – {high:.4g}" for low, high in zip(edges[:-1], edges[1:])]
+    colors = trace_colors(len(labels))
+    data = []
+    for i, label, _ in _group_masks(codes, labels):
+        data.append({
+            'type': 'bar', 'x': typed_array(centers), 'y': typed_array(counts[i]), 'width': typed_array(widths),
+            'name': label or '', 'legendgroup': label or '', 'showlegend': label is not None,
+            'marker': {'color': colors[i]}, 'hovertext': ranges,
+            'hovertemplate': f"{_prefix(group_name, label)}{value_name}=%{{hovertext}}<br>計數=%{{y}}<extra></extra>",
+        })
+    layout = {'title': {'text': title}, 'barmode': 'relative', 'bargap': 0, **_legend(group_name),
+              'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0]}, 'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0]}}
+    if rug_values is not None:
+        rug_codes, rug_labels = rug_groups
+        for i, label, mask in _group_masks(rug_codes, rug_labels):
+            data.append({
+                'type': 'box', 'x': typed_array(rug_values[mask]), 'xaxis': 'x', 'yaxis': 'y2',
+                'name': label or '', 'legendgroup': label or '', 'showlegend': False,
+                'boxpoints': 'all', 'jitter': 0, 'hoveron': 'points',
+                'fillcolor': 'rgba(255,255,255,0)', 'line': {'color': 'rgba(255,255,255,0)'},
+                'marker': {'color': colors[labels.index(label)] if label in labels else colors[0], 'symbol': 'line-ns-open'},
+                'hovertemplate': f"{_prefix(group_name, label)}{value_name}=%{{x}}<extra></extra>",
+            })
+        layout['yaxis']['domain'] = [0.0, RUG_DOMAIN_SPLIT]
+        layout['yaxis2'] = {'anchor': 'x', 'domain': [RUG_DOMAIN_SPLIT + 0.01, 1.0], 'showticklabels': False,
+                            'showline': False, 'ticks': '', 'showgrid': False}
+    return figure(data, **layout)
+
+
+# --- 箱型圖 / 小提琴圖 ---
+def box_stats(values, groups):
+    """{label: q1 / median / q3 / lowerfence / upperfence} per group over every value.
+
+    Quartiles as np.quantile; fences are the furthest points within 1.5 IQR, where plotly ends the whiskers.
+    """
+    codes, labels = groups
+    values = np.asarray(values, dtype=float)
+    stats = {}
+    for _, label, mask in _group_masks(codes, labels):
+        group = values[mask]
+        group = group[np.isfinite(group)]
+        if len(group) == 0:
+            continue
+        q1, median, q3 = np.quantile(group, [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        stats[label] = {'q1': q1, 'median': median, 'q3': q3,
+                        'lowerfence': group[group >= q1 - 1.5 * iqr].min(), 'upperfence': group[group <= q3 + 1.5 * iqr].max()}
+    return stats
+
+
+def box_figure(values, groups, title, value_name, group_name=None, kind='box', stats=None, density=None):
+    """One box (or violin) per group showing every point in values; boxes are placed by name.
+
+    When values is a biased sample (extremes kept), pass stats (box_stats over all rows) for the boxes and
+    density ((values, groups) of an unbiased sample) for the violins; values are then only drawn as points.
+    """
+    codes, labels = groups
+    values = np.asarray(values)
+    colors = trace_colors(len(labels))
+    if density is not None:
+        density_codes, density_labels = density[1]
+        density_values = np.asarray(density[0])
+    data = []
+    for i, label, mask in _group_masks(codes, labels):
+        name = label if label is not None else value_name
+        trace = {
+            'type': kind, 'y': typed_array(values[mask]), 'name': name,
+            'legendgroup': label or '', 'showlegend': label is not None, 'marker': {'color': colors[i]},
+            'hovertemplate': f"{_prefix(group_name, label)}{value_name}=%{{y}}<extra></extra>",
+        }
+        if kind == 'violin':
+            trace.update(points='all', box={'visible': True})
+        else:
+            trace['boxpoints'] = 'all'
+        summary = None
+        if kind == 'box' and stats is not None and label in stats:
+            summary = {'type': 'box', 'x': [name], **{key: [float(value)] for key, value in stats[label].items()},
+                       'boxpoints': False}
+        elif kind == 'violin' and density is not None and label in density_labels:
+            density_mask = slice(None) if density_codes is None else density_codes == density_labels.index(label)
+            summary = {'type': 'violin', 'y': typed_array(density_values[density_mask]), 'points': False,
+                       'box': {'visible': True}}
+        if summary is not None:
+            # 形狀 (箱體 / 核密度) 另成一個軌跡，抽樣的點疊在同一位置並隱藏它自己的形狀
+            summary.update(name=name, legendgroup=label or '', showlegend=label is not None,
+                           marker={'color': colors[i]}, line={'color': colors[i]})
+            trace.update(showlegend=False, hoveron='points', fillcolor='rgba(255,255,255,0)',
+                         line={'color': 'rgba(255,255,255,0)'})
+            if kind == 'violin':
+                trace['box'] = {'visible': False}
+            data.append(summary)
+        data.append(trace)
+    return figure(data, title={'text': title}, boxmode='overlay', violinmode='overlay', **_legend(group_name))
+
+
+# --- 散佈圖 ---
+def scatter_figure(x, y, groups, title, x_name, y_name, group_name=None):
+    """Marker traces per group (scattergl above WEBGL_MIN_POINTS points, like px)."""
+    codes, labels = groups
+    x, y = np.asarray(x), np.asarray(y)
+    trace_type = 'scattergl' if len(x) > WEBGL_MIN_POINTS else 'scatter'
+    colors = trace_colors(len(labels))
+    traces = []
+    for i, label, mask in _group_masks(codes, labels):
+        traces.append({
+            'type': trace_type, 'mode': 'markers', 'x': typed_array(x[mask]), 'y': typed_array(y[mask]),
+            'name': label or '', 'legendgroup': label or '', 'showlegend': label is not None,
+            'marker': {'color': colors[i], 'symbol': 'circle'},
+            'hovertemplate': f"{_prefix(group_name, label)}{x_name}=%{{x}}<br>{y_name}=%{{y}}<extra></extra>",
+        })
+    return figure(traces, title={'text': title}, **_legend(group_name))
+
+
+# --- 長條圖 ---
+def bar_figure(categories, values, groups, title, category_name, value_name, group_name=None, barmode='group'):
+    """Bar traces per group from an aggregated table (one row per category / group)."""
+    codes, labels = groups
+    categories, values = np.asarray(categories), np.asarray(values)
+    colors = trace_colors(len(labels))
+    traces = []
+    for i, label, mask in _group_masks(codes, labels):
+        traces.append({
+            'type': 'bar', 'x': typed_array(categories[mask]), 'y': typed_array(values[mask]),
+            'name': label or '', 'legendgroup': label or '', 'showlegend': label is not None,
+            'marker': {'color': colors[i]},
+            'hovertemplate': f"{_prefix(group_name, label)}{category_name}=%{{x}}<br>{value_name}=%{{y}}<extra></extra>",
+        })
+    return figure(traces, title={'text': title}, barmode=barmode, **_legend(group_name))
+
+
+# --- 熱力圖 ---
+def heatmap_figure(matrix, title, color_label, colorscale='Blues', text_format=None):
+    """px.imshow-like heatmap of a DataFrame (rows top to bottom); text_format is a d3 format for cell labels."""
+    trace = {
+        'type': 'heatmap', 'z': typed_array(matrix.to_numpy(dtype=float)), 'coloraxis': 'coloraxis',
+        'x': [str(c) for c in matrix.columns], 'y': [str(i) for i in matrix.index],
+        'hovertemplate': f"x: %{{x}}<br>y: %{{y}}<br>{color_label}: %{{z}}<extra></extra>",
+    }
+    if text_format:
+        trace['texttemplate'] = f"%{{z:{text_format}}}"
+    return figure([trace], title={'text': title}, yaxis={'autorange': 'reversed'},
+                  coloraxis={'colorscale': plotly.colors.get_colorscale(colorscale),
+                             'colorbar': {'title': {'text': color_label}}})
+
+
+def colored_hbar_figure(values, labels, title, value_name, label_name, colorscale='RdBu', color_range=(-1, 1)):
+    """Horizontal bars colored by their own value on a continuous scale (px.bar with a numeric color)."""
+    values = np.asarray(values, dtype=float)
+    trace = {
+        'type': 'bar', 'orientation': 'h', 'x': typed_array(values), 'y': [str(label) for label in labels],
+        'marker': {'color': typed_array(values), 'coloraxis': 'coloraxis'}, 'showlegend': False,
+        'hovertemplate': f"{value_name}=%{{x}}<br>{label_name}=%{{y}}<extra></extra>",
+    }
+    return figure([trace], title={'text': title}, xaxis={'title': {'text': value_name}},
+                  yaxis={'title': {'text': label_name}},
+                  coloraxis={'colorscale': plotly.colors.get_colorscale(colorscale), 'cmin': color_range[0],
+                             'cmax': color_range[1], 'colorbar': {'title': {'text': value_name}}})
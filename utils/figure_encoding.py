@@ -0,0 +1,59 @@
+import base64
+
+import numpy as np
+
+# --- 圖表資料精簡編碼 ---
+# 互動圖表 (utils/fast_figure.py 組成的 plain dict) 的座標陣列以 typed_array 編碼為 plotly.js typed array (base64 + dtype)。
+# float64 欄位每個值佔 8 bytes：只在 float32 的量化誤差遠小於資料範圍 (畫面上看不出差異) 時才轉為 float32，
+# 例如數值很大但差異很小的欄位 (以秒為單位的時間戳記) 保持 float64。
+
+FLOAT32_MAX_RELATIVE_ERROR = 1e-5 # 量化誤差相對於資料範圍的上限 (約為十萬分之一個軸長)
+TYPED_INT_DTYPES = (np.int8, np.int16, np.int32) # plotly.js 不支援 64 位元整數
+
+
+def float32_safe(values):
+    """True when storing values as float32 changes them by less than FLOAT32_MAX_RELATIVE_ERROR of their range."""
+    finite = values[np.isfinite(values)]
+    if finite.size == 0:
+        return True
+    low, high = finite.min(), finite.max()
+    magnitude = max(abs(low), abs(high))
+    if magnitude > np.finfo(np.float32).max:
+        return False
+    span = high - low
+    if span == 0:
+        return magnitude == 0 or float(np.float32(magnitude)) == magnitude
+    return magnitude * np.finfo(np.float32).eps <= span * FLOAT32_MAX_RELATIVE_ERROR
+
+
+def compact_array(values):
+    """float32 copy of a float64 array when float32_safe, otherwise the array itself."""
+    if isinstance(values, np.ndarray) and values.dtype == np.float64 and values.size and float32_safe(values):
+        return values.astype(np.float32)
+    return values
+
+
+def typed_array(values):
+    """plotly.js typed array spec ({'dtype', 'bdata'[, 'shape']}) of a numeric array; other arrays become lists.
+
+    Floats are downcast like compact_array, 64-bit integers to the narrowest int type, datetimes become ISO strings.
+    """
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return np.datetime_as_string(values).tolist()
+    if values.dtype.kind not in 'biuf' or values.size == 0:
+        return values.tolist()
+    if values.dtype.kind == 'b':
+        values = values.astype(np.uint8)
+    elif values.dtype.kind == 'f':
+        values = compact_array(values.astype(np.float64, copy=False)) if values.dtype != np.float32 else values
+    elif values.dtype.itemsize == 8:
+        low, high = values.min(), values.max()
+        dtype = next((t for t in TYPED_INT_DTYPES if np.iinfo(t).min <= low and high <= np.iinfo(t).max), np.float64)
+        values = values.astype(dtype)
+    values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+    spec = {'dtype': f"{values.dtype.kind}{values.dtype.itemsize}",
+            'bdata': base64.b64encode(values.tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        spec['shape'] = ', '.join(str(n) for n in values.shape)
+    return spec
@@ -0,0 +1,13 @@
+from dash import Patch
+
+# --- 只改外觀時的局部更新 ---
+# 瀏覽器中的圖表與目前輸入只差版面 / 樣式 (例如長條圖的 barmode，依頁面的繪製簽章判斷，utils/page_compute.py) 時，
+# 回調以 dash.Patch 只更新 figure.layout 中對應的屬性，不重新讀取資料、建構 trace 或傳送整張圖。
+
+
+def layout_patch(**layout):
+    """Patch setting top-level figure.layout properties (e.g. barmode='stack') on the figure in the browser."""
+    patch = Patch()
+    for key, value in layout.items():
+        patch['layout'][key] = value
+    return patch
@@ -0,0 +1,80 @@
+import glob
+import os
+import threading
+import warnings
+from io import BytesIO
+
+# --- 中文字體設定與 matplotlib 暖機 ---
+# 每個行程只在啟動時設定一次：註冊專案內附 (fonts/ 或 CJK_FONT_DIR) 的字體，從已安裝字體中挑選第一個可用的中文字體，
+# 並預先繪製一張含中文的暖機圖，讓字體快取與字形查找在第一個請求前完成。
+# 找不到中文字體時只提示一次，不再每次繪圖都觸發字體 fallback 警告。
+
+CJK_FONT_CANDIDATES = [
+    'Microsoft JhengHei',
+    'Noto Sans CJK TC',
+    'Noto Sans TC',
+    'Noto Sans CJK JP', # fonts-noto-cjk 套件在部分系統只註冊為 JP/SC 名稱，但包含繁體字形
+    'Noto Sans CJK SC',
+    'Source Han Sans TC',
+    'PingFang TC',
+    'Heiti TC',
+    'WenQuanYi Zen Hei',
+    'SimHei',
+    'Arial Unicode MS',
+]
+FONT_DIR = os.environ.get('CJK_FONT_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts'))
+
+_setup_lock = threading.Lock()
+_font_state = {'configured': False, 'family': None}
+
+
+def register_bundled_fonts(font_dir=FONT_DIR):
+    """Adds every .ttf/.otf/.ttc file in font_dir to matplotlib's font manager; returns how many were added."""
+    from matplotlib import font_manager
+    added = 0
+    for pattern in ('*.ttf', '*.otf', '*.ttc'):
+        for path in glob.glob(os.path.join(font_dir, pattern)):
+            try:
+                font_manager.fontManager.addfont(path)
+                added += 1
+            except Exception as e:
+                print(f"register_bundled_fonts: 無法載入字體 {path}: {e}")
+    return added
+
+
+def setup_matplotlib_fonts():
+    """Configures the Agg backend and a CJK sans-serif font once per process; returns the font family (or None)."""
+    with _setup_lock:
+        if _font_state['configured']:
+            return _font_state['family']
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import font_manager
+        import matplotlib.pyplot as plt
+
+        register_bundled_fonts()
+        available = {font.name for font in font_manager.fontManager.ttflist}
+        family = next((name for name in CJK_FONT_CANDIDATES if name in available), None)
+        plt.rcParams['font.sans-serif'] = ([family] if family else []) + ['DejaVu Sans']
+        plt.rcParams['font.family'] = 'sans-serif'
+        plt.rcParams['axes.unicode_minus'] = False # 解決負號顯示問題
+        if family:
+            print(f"setup_matplotlib_fonts: 使用中文字體 {family}")
+        else:
+            print("setup_matplotlib_fonts: 找不到中文字體，靜態圖表中的中文將無法顯示 (可安裝 fonts-noto-cjk 或放入 fonts/ 目錄)")
+            warnings.filterwarnings('ignore', message=r'Glyph .* missing from (current )?font')
+        _font_state.update(configured=True, family=family)
+        return family
+
+
+def warm_up_matplotlib():
+    """Sets up fonts, imports seaborn and renders a small CJK figure so the first real chart is not slower."""
+    setup_matplotlib_fonts()
+    import matplotlib.pyplot as plt
+    import seaborn # noqa: F401 (預先載入)
+    fig, ax = plt.subplots(figsize=(2, 2), tight_layout=True)
+    ax.plot([0, 1], [0, -1])
+    ax.set_title("暖機 -1")
+    ax.set_xlabel("數值")
+    fig.savefig(BytesIO(), format='png')
+    plt.close(fig)
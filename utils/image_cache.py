@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from flask import abort, send_file
+
+from utils.dataset_store import APP_CACHE_DIR, private_directory
+
+# --- 靜態圖表磁碟快取 ---
+# 繪製好的 PNG 以內容定址方式存放在本機磁碟：鍵為 (圖表, 資料版本, 圖表參數, 尺寸/DPI) 的雜湊。
+# 篩選後的資料有自己的資料版本，因此篩選條件已包含在鍵中。
+# 圖片透過 Flask 路由以 URL 提供 (含 ETag 與長效快取標頭)，不再內嵌為 base64 字串；總大小超過上限時依最近使用時間淘汰。
+# 目錄與共享資料集儲存相同，位於目前使用者的快取目錄並以 0700 建立 (private_directory)：其他使用者無法預先建立目錄
+# 或放入檔案讓圖片路由提供；目錄不可用時停用快取，圖片改為內嵌。
+# 多個工作行程寫入同一目錄，是否超過上限以每次寫入後重新掃描目錄的總大小判斷 (各行程只計自己寫入的量會低估)。
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR') or os.path.join(APP_CACHE_DIR, 'images')
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+IMAGE_ROUTE = '/static-charts/'
+IMAGE_CACHE_VERSION = 2 # 繪圖程式變更時遞增，使舊圖失效
+
+
+def chart_key(chart, data_version, params):
+    """Content address of a static chart: hash of chart id, dataset version and every chart parameter."""
+    payload = json.dumps([IMAGE_CACHE_VERSION, chart, data_version, params], sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def image_url(key):
+    return f"{IMAGE_ROUTE}{key}.png"
+
+
+class DiskImageCache:
+    """Size-bounded PNG cache on local disk with least-recently-used eviction (mtime is the access time)."""
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._usable = None # 第一次使用時檢查目錄
+
+    def usable(self):
+        """True when the cache directory is private to this user (checked once per process)."""
+        if self._usable is None:
+            self._usable = private_directory(self.directory)
+            if not self._usable:
+                print(f"DiskImageCache: {self.directory} 不屬於目前使用者或其他使用者可存取，停用圖片快取")
+        return self._usable
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def get(self, key):
+        """Path of the cached image (refreshing its LRU timestamp) or None."""
+        if not self.usable():
+            return None
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, png):
+        """Stores png under key; returns its path, or None when the cache directory is not usable."""
+        if not self.usable():
+            return None
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(png)
+        os.replace(tmp_path, path) # 原子性寫入，其他行程不會讀到寫到一半的檔案
+        with self._lock:
+            entries = list(self._entries()) # 包含其他工作行程寫入的圖片
+            if sum(size for _, size, _ in entries) > self.max_bytes:
+                self._evict(entries)
+        return path
+
+    def _entries(self):
+        try:
+            shards = [entry.path for entry in os.scandir(self.directory) if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for shard in shards:
+            try:
+                files = list(os.scandir(shard))
+            except OSError:
+                continue
+            for entry in files:
+                if entry.name.endswith('.png'):
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self, entries):
+        # 刪除最久未使用的檔案，直到總大小降到上限的 80%
+        entries = sorted(entries, key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.8
+        removed = 0
+        for full, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(full)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        print(f"DiskImageCache: 淘汰 {removed} 張圖片，目前 {total / 1024 / 1024:.1f} MB")
+
+    def clear(self):
+        if not self.usable():
+            return
+        with self._lock:
+            for full, _, _ in list(self._entries()):
+                try:
+                    os.remove(full)
+                except OSError:
+                    pass
+
+
+image_cache = DiskImageCache()
+
+
+def register_image_route(server):
+    """Serves cached charts at IMAGE_ROUTE<key>.png with a strong ETag (the content address)."""
+    @server.route(f"{IMAGE_ROUTE}<key>.png")
+    def serve_static_chart(key):
+        if len(key) != 40 or any(c not in '0123456789abcdef' for c in key):
+            abort(404)
+        path = image_cache.get(key)
+        if path is None:
+            abort(404)
+        response = send_file(path, mimetype='image/png', etag=key, conditional=True, max_age=31536000)
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable' # 內容定址，同一網址內容不變
+        return response
@@ -0,0 +1,260 @@
+import collections
+import mmap
+import os
+import secrets
+import sys
+import threading
+
+import flask
+import numpy as np
+import pandas as pd
+
+# --- 記憶體預算與資料版本 LRU 淘汰 ---
+# 行程內的快取 (已解析的 DataFrame、類別編碼、彙總、相關矩陣、趨勢線等) 原本只以項目數量為上限，
+# 幾份大型上傳就可能耗盡容器記憶體。每個快取項目寫入時估算其佔用位元組 (memory-map 的欄位不計入，
+# 它們屬於作業系統頁面快取)，依資料版本彙總，並記錄每個工作階段 (瀏覽器 cookie) 用過哪些資料版本。
+# 總量超過 MEMORY_BUDGET_MB，或目前工作階段超過 SESSION_MEMORY_BUDGET_MB 時，從最久未使用的資料版本開始，
+# 把該版本在所有快取中的項目一起釋放 (目前請求使用中的版本除外)。
+# 被釋放的資料集之後再被存取時自動重新載入：先從 utils/dataset_store.py 的磁碟儲存以 memory-map 讀取，
+# 磁碟上也已淘汰時，再從請求帶來的 JSON 重新解析；衍生結果則依需要重新計算。
+# 統計值屬於各工作行程，多工作行程時每個行程各自套用預算。
+
+MEMORY_BUDGET_BYTES = int(float(os.environ.get('MEMORY_BUDGET_MB', 1024)) * 1024 * 1024)
+SESSION_MEMORY_BUDGET_BYTES = int(float(os.environ.get('SESSION_MEMORY_BUDGET_MB', 512)) * 1024 * 1024)
+SESSION_COOKIE = 'dataviz_session'
+SAMPLE_SIZE = 1000 # 估算文字欄位 / 長串列大小時抽樣的元素數
+
+
+# --- 大小估算 ---
+def _is_memory_mapped(array):
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return True
+        base = getattr(base, 'base', None)
+    return False
+
+
+def _sampled_bytes(values):
+    # 物件陣列：指標 + 抽樣估算的 Python 物件大小 (逐一 getsizeof 在百萬列時太慢)
+    n = len(values)
+    if n == 0:
+        return 0
+    step = max(n // SAMPLE_SIZE, 1)
+    sample = values[::step][:SAMPLE_SIZE]
+    return n * 8 + int(sum(sys.getsizeof(value) for value in sample) / len(sample) * n)
+
+
+def _array_bytes(values):
+    if isinstance(values, np.ndarray):
+        if _is_memory_mapped(values):
+            return 0
+        return _sampled_bytes(values) if values.dtype == object else values.nbytes
+    if isinstance(values, pd.Categorical):
+        return _array_bytes(values.codes) + _array_bytes(np.asarray(values.categories, dtype=object))
+    if isinstance(values, pd.api.extensions.ExtensionArray):
+        inner = getattr(values, '_ndarray', None) # 以 NumPy 陣列為底層的擴充型別 (str、datetime 等)
+        if inner is not None:
+            return _array_bytes(inner)
+        return int(values.nbytes)
+    return estimate_bytes(values)
+
+
+def estimate_bytes(value, depth=0):
+    """Approximate heap bytes held by a cached value (memory-mapped arrays count as zero)."""
+    if isinstance(value, pd.DataFrame):
+        return sum(_array_bytes(value.iloc[:, i].array) for i in range(value.shape[1])) + _array_bytes(value.index.array)
+    if isinstance(value, (pd.Series, pd.Index)):
+        return _array_bytes(value.array)
+    if isinstance(value, (np.ndarray, pd.api.extensions.ExtensionArray)):
+        return _array_bytes(value)
+    if depth > 3:
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_bytes(k, depth + 1) + estimate_bytes(v, depth + 1)
+                                          for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value)
+        if len(items) > SAMPLE_SIZE:
+            sample = items[::len(items) // SAMPLE_SIZE][:SAMPLE_SIZE]
+            return sys.getsizeof(value) + int(sum(estimate_bytes(v, depth + 1) for v in sample) / len(sample) * len(items))
+        return sys.getsizeof(value) + sum(estimate_bytes(v, depth + 1) for v in items)
+    return sys.getsizeof(value)
+
+
+def version_of(key):
+    """Dataset version of a cache key: the key itself or the first element of a tuple key."""
+    if isinstance(key, tuple):
+        return key[0] if key else None
+    return key
+
+
+# --- 工作階段 ---
+def current_session():
+    """Session id of the current request (from the cookie set by register_session_cookie), or None."""
+    if not flask.has_request_context():
+        return None
+    return getattr(flask.g, 'dataviz_session', None)
+
+
+def register_session_cookie(server):
+    """Gives every browser a random session cookie so that memory use can be attributed per session, and
+    releases the dataset versions a request was using when it ends."""
+    @server.before_request
+    def load_session_id():
+        session_id = flask.request.cookies.get(SESSION_COOKIE, '')
+        flask.g.dataviz_session_new = not (0 < len(session_id) <= 64 and session_id.isalnum())
+        flask.g.dataviz_session = secrets.token_hex(16) if flask.g.dataviz_session_new else session_id
+
+    @server.after_request
+    def set_session_cookie(response):
+        if getattr(flask.g, 'dataviz_session_new', False):
+            response.set_cookie(SESSION_COOKIE, flask.g.dataviz_session, httponly=True, samesite='Lax')
+        return response
+
+    @server.teardown_request
+    def release_versions(exc):
+        memory_manager.release(getattr(flask.g, 'dataviz_versions', ()))
+
+
+# --- 記憶體管理 ---
+class MemoryManager:
+    """Byte accounting of cache entries per dataset version and session, with LRU eviction of whole versions."""
+
+    def __init__(self, budget_bytes=MEMORY_BUDGET_BYTES, session_budget_bytes=SESSION_MEMORY_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        self.session_budget_bytes = session_budget_bytes
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._entries = {} # (cache, key) -> (version, bytes)
+        self._versions = collections.OrderedDict() # version -> 位元組 (依最近使用排序)
+        self._version_entries = collections.defaultdict(set)
+        self._sessions = collections.defaultdict(collections.OrderedDict) # session -> {version: None} (依最近使用排序)
+        self._in_use = collections.Counter() # version -> 正在使用它的請求數
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _touch_locked(self, version):
+        if flask.has_request_context():
+            # 記錄本請求用到的版本；請求結束 (release) 前，其他請求不會淘汰它 (仍被引用，淘汰也不會釋放記憶體)
+            versions = flask.g.setdefault('dataviz_versions', set())
+            if version not in versions:
+                versions.add(version)
+                self._in_use[version] += 1
+        if version not in self._versions:
+            return
+        self._versions.move_to_end(version)
+        session = current_session()
+        if session is not None:
+            versions = self._sessions[session]
+            versions[version] = None
+            versions.move_to_end(version)
+
+    def touch(self, key):
+        """Marks the dataset version of key as recently used by the current session."""
+        version = version_of(key)
+        if version is None:
+            return
+        with self._lock:
+            self._touch_locked(version)
+
+    def release(self, versions):
+        """Ends the current request's use of versions (called on request teardown)."""
+        with self._lock:
+            for version in versions:
+                self._in_use[version] -= 1
+                if self._in_use[version] <= 0:
+                    del self._in_use[version]
+
+    def track(self, cache, key, value):
+        """Accounts for a cache entry and evicts older versions when a budget is exceeded."""
+        version = version_of(key)
+        if version is None:
+            return
+        size = estimate_bytes(value)
+        with self._lock:
+            previous = self._entries.pop((cache, key), None)
+            if previous is not None:
+                self._remove_locked(cache, key, *previous)
+            self._entries[(cache, key)] = (version, size)
+            self._version_entries[version].add((cache, key))
+            self._versions[version] = self._versions.get(version, 0) + size
+            self._total += size
+            self._touch_locked(version)
+            victims = self._victims_locked(protect=version)
+        for victim in victims:
+            self.evict(victim)
+
+    def forget(self, cache, key):
+        """Drops the accounting of an entry removed by its cache."""
+        with self._lock:
+            entry = self._entries.pop((cache, key), None)
+            if entry is not None:
+                self._remove_locked(cache, key, *entry)
+
+    def _remove_locked(self, cache, key, version, size):
+        self._total -= size
+        entries = self._version_entries.get(version)
+        if entries is not None:
+            entries.discard((cache, key))
+        if entries:
+            self._versions[version] -= size
+        else: # 該版本已沒有任何快取項目
+            self._version_entries.pop(version, None)
+            self._versions.pop(version, None)
+            for session in list(self._sessions):
+                self._sessions[session].pop(version, None)
+                if not self._sessions[session]:
+                    del self._sessions[session]
+
+    def _session_bytes_locked(self, session):
+        return sum(self._versions.get(version, 0) for version in self._sessions.get(session, ()))
+
+    def _victims_locked(self, protect):
+        # 先套用目前工作階段的預算，再套用行程總預算；都從最久未使用的版本開始，請求使用中的版本不淘汰
+        def evictable(version):
+            return version != protect and not self._in_use.get(version)
+
+        victims = []
+        session = current_session()
+        if session is not None and session in self._sessions:
+            excess = self._session_bytes_locked(session) - self.session_budget_bytes
+            for version in list(self._sessions[session]):
+                if excess <= 0:
+                    break
+                if evictable(version) and version in self._versions:
+                    victims.append(version)
+                    excess -= self._versions[version]
+        excess = self._total - sum(self._versions.get(version, 0) for version in victims) - self.budget_bytes
+        for version in list(self._versions):
+            if excess <= 0:
+                break
+            if evictable(version) and version not in victims:
+                victims.append(version)
+                excess -= self._versions[version]
+        return victims
+
+    def evict(self, version):
+        """Releases every cached entry of a dataset version (it reloads on the next access)."""
+        with self._lock:
+            entries = list(self._version_entries.get(version, ()))
+            size = self._versions.get(version, 0)
+        for cache, key in entries:
+            cache.discard(key) # 經由 forget 更新統計
+        with self._lock:
+            self.evictions += 1
+            self.evicted_bytes += size
+        print(f"MemoryManager: 釋放資料版本 {version} 的快取 ({size / 1024 / 1024:.1f} MB)，"
+              f"目前 {self._total / 1024 / 1024:.1f} MB")
+
+    def usage(self):
+        """{'total_bytes', 'budget_bytes', 'session_budget_bytes', 'versions': {version: bytes},
+        'sessions': {session: bytes}, 'evictions', 'evicted_bytes'}"""
+        with self._lock:
+            return {'total_bytes': self._total, 'budget_bytes': self.budget_bytes,
+                    'session_budget_bytes': self.session_budget_bytes, 'versions': dict(self._versions),
+                    'sessions': {session: self._session_bytes_locked(session) for session in self._sessions},
+                    'evictions': self.evictions, 'evicted_bytes': self.evicted_bytes}
+
+
+memory_manager = MemoryManager()
@@ -0,0 +1,257 @@
+import contextlib
+import functools
+import ipaddress
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+import flask
+from dash.exceptions import PreventUpdate
+
+from utils.cancellation import cancellation_stats
+from utils.memory import memory_manager
+from utils.profiling import profile_call, profiling_requested
+from utils.singleflight import flight_stats
+
+# --- 回調效能量測 ---
+# 各頁面 register_callbacks 執行時，透過 instrumented_callbacks 為每個伺服器端回調套上量測裝飾器，記錄：
+# 牆鐘時間、CPU 時間 (本執行緒)、請求 / 回應酬載位元組、DataFrame 解碼時間 (read_stored_dataframe 等)、
+# 以及 (CALLBACK_TRACE_ALLOC=1 時) tracemalloc 的峰值配置。結果以 Prometheus 文字格式由 /metrics 提供，
+# 並逐次以一行 JSON 輸出結構化紀錄。統計值存在各工作行程的記憶體中，多工作行程時以 pid 標籤區分。
+
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TRACE_ALLOCATIONS = os.environ.get('CALLBACK_TRACE_ALLOC', '0') == '1' # tracemalloc 會明顯拖慢計算，預設關閉
+CALLBACK_LOG = os.environ.get('CALLBACK_LOG', '1') == '1'
+CALLBACK_LOG_MIN_MS = float(os.environ.get('CALLBACK_LOG_MIN_MS', 0)) # 只記錄超過此時間的回調
+METRICS_ALLOW_REMOTE = os.environ.get('METRICS_ALLOW_REMOTE', '0') == '1' # 預設只允許本機抓取 /metrics
+
+_local = threading.local()
+
+
+# --- 解碼時間 ---
+@contextlib.contextmanager
+def decode_timer():
+    """Adds the time spent inside the block to the running callback's decode time (nested blocks count once)."""
+    depth = getattr(_local, 'decode_depth', 0)
+    _local.decode_depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.decode_depth = depth
+        record = getattr(_local, 'record', None)
+        if depth == 0 and record is not None:
+            record['decode_seconds'] += time.perf_counter() - started
+
+
+# --- 統計 ---
+class CallbackStats:
+    __slots__ = ('calls', 'errors', 'wall_seconds', 'cpu_seconds', 'decode_seconds', 'input_bytes', 'output_bytes',
+                 'peak_alloc_bytes', 'buckets')
+
+    def __init__(self):
+        self.calls = self.errors = self.input_bytes = self.output_bytes = self.peak_alloc_bytes = 0
+        self.wall_seconds = self.cpu_seconds = self.decode_seconds = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+
+
+class CallbackMetrics:
+    """Per-callback totals and duration histogram (thread-safe, per process)."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, record):
+        with self._lock:
+            stats = self._stats.setdefault(record['callback'], CallbackStats())
+            stats.calls += 1
+            stats.errors += record['error']
+            stats.wall_seconds += record['wall_seconds']
+            stats.cpu_seconds += record['cpu_seconds']
+            stats.decode_seconds += record['decode_seconds']
+            stats.input_bytes += record['input_bytes']
+            stats.output_bytes += record['output_bytes']
+            stats.peak_alloc_bytes = max(stats.peak_alloc_bytes, record['peak_alloc_bytes'] or 0)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if record['wall_seconds'] <= bound:
+                    stats.buckets[i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: {slot: (list(getattr(stats, slot)) if slot == 'buckets' else getattr(stats, slot))
+                           for slot in CallbackStats.__slots__}
+                    for name, stats in self._stats.items()}
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+    def prometheus_text(self):
+        """Metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        pid = os.getpid()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        def labels(callback, **extra):
+            pairs = {'callback': callback, 'pid': pid, **extra}
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs.items()) + "}"
+
+        totals = [
+            ('dash_callback_calls_total', 'calls', "Number of callback invocations."),
+            ('dash_callback_errors_total', 'errors', "Number of callback invocations that raised an exception."),
+            ('dash_callback_cpu_seconds_total', 'cpu_seconds', "CPU time of the callback thread."),
+            ('dash_callback_decode_seconds_total', 'decode_seconds', "Time spent decoding stored DataFrames."),
+            ('dash_callback_request_bytes_total', 'input_bytes', "Callback request payload bytes."),
+            ('dash_callback_response_bytes_total', 'output_bytes', "Callback response payload bytes (before compression)."),
+        ]
+        for name, slot, help_text in totals:
+            metric(name, 'counter', help_text,
+                   [f"{name}{labels(callback)} {stats[slot]}" for callback, stats in sorted(snapshot.items())])
+
+        samples = []
+        for callback, stats in sorted(snapshot.items()):
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                samples.append(f"dash_callback_duration_seconds_bucket{labels(callback, le=bound)} {count}")
+            samples.append(f"dash_callback_duration_seconds_bucket{labels(callback, le='+Inf')} {stats['calls']}")
+            samples.append(f"dash_callback_duration_seconds_sum{labels(callback)} {stats['wall_seconds']}")
+            samples.append(f"dash_callback_duration_seconds_count{labels(callback)} {stats['calls']}")
+        metric('dash_callback_duration_seconds', 'histogram', "Callback wall time.", samples)
+
+        if TRACE_ALLOCATIONS:
+            metric('dash_callback_peak_alloc_bytes', 'gauge', "Largest peak Python/NumPy allocation seen during the callback.",
+                   [f"dash_callback_peak_alloc_bytes{labels(callback)} {stats['peak_alloc_bytes']}"
+                    for callback, stats in sorted(snapshot.items())])
+
+        # 快取記憶體預算 (utils/memory.py)
+        usage = memory_manager.usage()
+        for name, kind, help_text, value in [
+            ('dataviz_cache_bytes', 'gauge', "Estimated heap bytes held by dataset caches.", usage['total_bytes']),
+            ('dataviz_cache_budget_bytes', 'gauge', "Process-wide cache memory budget.", usage['budget_bytes']),
+            ('dataviz_cache_datasets', 'gauge', "Dataset versions with cached entries.", len(usage['versions'])),
+            ('dataviz_cache_sessions', 'gauge', "Sessions holding cached dataset versions.", len(usage['sessions'])),
+            ('dataviz_cache_evictions_total', 'counter', "Dataset versions released to stay within a budget.",
+             usage['evictions']),
+            ('dataviz_cache_evicted_bytes_total', 'counter', "Bytes released by evictions.", usage['evicted_bytes']),
+        ]:
+            metric(name, kind, help_text, [f'{name}{{pid="{pid}"}} {value}'])
+
+        # 相同計算的併發去重 (utils/singleflight.py)
+        flights = flight_stats()
+        for name, kind, help_text, value in [
+            ('dataviz_singleflight_computations_total', 'counter', "Cached computations and static renders actually run.",
+             flights['leaders']),
+            ('dataviz_singleflight_shared_total', 'counter', "Callers that waited for an identical running computation.",
+             flights['shared']),
+            ('dataviz_singleflight_in_flight', 'gauge', "Deduplicated computations running now.", flights['in_flight']),
+            ('dataviz_cancelled_total', 'counter', "Page callback runs stopped because a newer request superseded them.",
+             cancellation_stats()['cancelled']),
+        ]:
+            metric(name, kind, help_text, [f'{name}{{pid="{pid}"}} {value}'])
+        return "\n".join(lines) + "\n"
+
+
+callback_metrics = CallbackMetrics()
+
+
+# --- 量測裝飾器 ---
+def _finish(record):
+    callback_metrics.observe(record)
+    if CALLBACK_LOG and record['wall_seconds'] * 1000 >= CALLBACK_LOG_MIN_MS:
+        fields = {key: round(value, 6) if isinstance(value, float) else value for key, value in record.items()}
+        print(json.dumps({'event': 'callback', 'pid': os.getpid(), **fields}, ensure_ascii=False))
+
+
+def instrument(name):
+    """Decorator recording wall / CPU / decode time, payload bytes and peak allocation of a Dash callback."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            in_request = flask.has_request_context()
+            record = {'callback': name, 'error': False, 'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'decode_seconds': 0.0,
+                      'input_bytes': (flask.request.content_length or 0) if in_request else 0,
+                      'output_bytes': 0, 'peak_alloc_bytes': None}
+            outer, _local.record = getattr(_local, 'record', None), record
+            if TRACE_ALLOCATIONS:
+                tracemalloc.reset_peak() # 行程層級的峰值：同時執行的回調會互相影響，僅供參考
+                baseline = tracemalloc.get_traced_memory()[0]
+            wall_started, cpu_started = time.perf_counter(), time.thread_time()
+            try:
+                if profiling_requested(name): # CALLBACK_PROFILE 或管理者標頭 (utils/profiling.py)
+                    record['profiled'] = True
+                    return profile_call(name, func, *args, **kwargs)
+                return func(*args, **kwargs)
+            except PreventUpdate:
+                raise
+            except Exception:
+                record['error'] = True
+                raise
+            finally:
+                record['wall_seconds'] = time.perf_counter() - wall_started
+                record['cpu_seconds'] = time.thread_time() - cpu_started
+                if TRACE_ALLOCATIONS:
+                    record['peak_alloc_bytes'] = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+                _local.record = outer
+                if in_request:
+                    flask.g.callback_records = getattr(flask.g, 'callback_records', []) + [record] # 回應大小在 after_request 補上
+                else:
+                    _finish(record)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def instrumented_callbacks(app, page):
+    """Within the block, every app.callback registration is wrapped with instrument(f"{page}.{function name}")."""
+    register = app.callback
+
+    def callback(*args, **kwargs):
+        decorate = register(*args, **kwargs)
+        return lambda func: decorate(instrument(f"{page}.{func.__name__}")(func))
+
+    app.callback = callback
+    try:
+        yield
+    finally:
+        del app.callback # 還原為 Dash 的方法
+
+
+# --- Flask 路由 ---
+def _is_local(address):
+    try:
+        return ipaddress.ip_address(address or '').is_loopback
+    except ValueError:
+        return False
+
+
+def register_metrics_route(server):
+    """Adds /metrics and the hook completing callback records with the response size.
+
+    Call after Compress(server) so that the hook sees the uncompressed response.
+    """
+    @server.after_request
+    def record_callback_response(response):
+        records = flask.g.pop('callback_records', None)
+        if records:
+            output_bytes = 0 if response.direct_passthrough else len(response.get_data())
+            for record in records:
+                record['output_bytes'] = output_bytes
+                _finish(record)
+        return response
+
+    @server.route('/metrics')
+    def metrics():
+        if not METRICS_ALLOW_REMOTE and not _is_local(flask.request.remote_addr):
+            flask.abort(403)
+        return flask.Response(callback_metrics.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+
+if TRACE_ALLOCATIONS and not tracemalloc.is_tracing():
+    tracemalloc.start()
@@ -0,0 +1,66 @@
+import hashlib
+import json
+
+import numpy as np
+
+from utils.cache import LRUCache
+from utils.categorical import count_levels
+
+# --- 每頁單一計算回調 ---
+# 每個頁面以一個回調同時更新選單、動態圖表、靜態圖片與程式碼片段：資料在一個請求中只傳送、解析一次，
+# 欄位型別與類別欄位唯一值數等中間結果依資料版本快取，各輸出共用。選單的值同時是這個回調的輸入與輸出
+# (Dash 允許同一回調內的循環)，資料變動時先算出新的預設值，再直接用它們計算圖表，不需第二輪請求。
+# 圖表與靜態圖片只在繪製它們的輸入改變時才重新計算，其餘回傳 dash.no_update：瀏覽器中目前的輸出由哪些輸入繪製，
+# 以簽章記在頁面的 render-state dcc.Store (以 State 讀取，與輸出同一個回應更新)。不依觸發輸入判斷：
+# 較新的請求取代舊請求時 (瀏覽器丟棄舊回應或伺服器取消舊計算，utils/cancellation.py)，舊請求的觸發輸入不會合併到新請求，
+# 只看觸發輸入會漏掉重算；簽章則永遠與瀏覽器實際套用的輸出一致。
+
+DATA_INPUT = 'filtered-data-store.data'
+
+_profile_cache = LRUCache(maxsize=16)
+
+
+def column_profile(data_version, df):
+    """Cached column types of a dataset version.
+
+    Returns {'numeric', 'categorical', 'datetime', 'bool': column lists, 'levels': {categorical col: nunique}}.
+    """
+    def compute():
+        categorical = list(df.select_dtypes(include=['object', 'string', 'category']).columns) # pandas 3 的文字欄位為 str dtype
+        levels = {}
+        for col in categorical:
+            try:
+                levels[col] = count_levels(data_version, df, col) # 與 nunique 相同，並留下快取的類別編碼
+            except Exception as e:
+                print(f"column_profile: 無法計算欄位 {col} 的唯一值數量: {e}")
+        return {
+            'numeric': list(df.select_dtypes(include=np.number).columns),
+            'categorical': categorical,
+            'datetime': list(df.select_dtypes(include=['datetime', 'datetimetz']).columns),
+            'bool': list(df.select_dtypes(include=['bool']).columns),
+            'levels': levels,
+        }
+    return _profile_cache.get_or_compute(data_version, compute)
+
+
+def too_many_levels(profile, col, limit):
+    """True when col is a categorical column with more than limit distinct values."""
+    return bool(col) and profile['levels'].get(col, 0) > limit
+
+
+def render_signature(*inputs):
+    """Short fingerprint of the inputs an output is rendered from."""
+    encoded = json.dumps(inputs, default=str, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def needs_render(render_state, name, *inputs):
+    """True when output name was last rendered from other inputs (or never); records inputs in render_state.
+
+    render_state is the page's render-state dcc.Store data (a dict returned with the outputs of the same response).
+    """
+    signature = render_signature(*inputs)
+    if render_state.get(name) == signature:
+        return False
+    render_state[name] = signature
+    return True
@@ -0,0 +1,132 @@
+import collections
+import cProfile
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+
+import flask
+
+from utils.dataset_store import APP_CACHE_DIR, private_directory
+
+# --- 單一回調的隨選效能剖析 ---
+# 兩種開啟方式：環境變數 CALLBACK_PROFILE 列出要剖析的回調 (例如 "apply_filters,relationship.update_relationship_page"，
+# "*" 表示全部)；或在請求中帶 X-Profile-Token 標頭 (值須等於 PROFILE_TOKEN，未設定時停用)，只剖析該次請求的回調。
+# 每次剖析同時寫出 cProfile 的 .prof (可用 snakeviz / pstats 檢視) 與取樣器產生的 collapsed stack 檔
+# (flamegraph.pl / speedscope 可直接讀取)，目錄中只保留最新的 PROFILE_KEEP 次結果。
+# 剖析結果含有程式路徑與呼叫內容，預設寫入目前使用者的快取目錄並以 0700 建立 (private_directory)，目錄不可用時不寫出。
+
+PROFILE_CALLBACKS = [name.strip() for name in os.environ.get('CALLBACK_PROFILE', '').split(',') if name.strip()]
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_HEADER = 'X-Profile-Token'
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(APP_CACHE_DIR, 'profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 20))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_MS', 5)) / 1000
+
+_write_lock = threading.Lock()
+
+
+def profiling_requested(name):
+    """True when callback name is selected by CALLBACK_PROFILE or the current request carries the admin token."""
+    for selected in PROFILE_CALLBACKS:
+        if selected == '*' or name == selected or name.endswith('.' + selected):
+            return True
+    if PROFILE_TOKEN and flask.has_request_context():
+        token = flask.request.headers.get(PROFILE_HEADER, '')
+        return bool(token) and hmac.compare_digest(token, PROFILE_TOKEN)
+    return False
+
+
+# --- 取樣剖析器 ---
+def _frame_label(frame):
+    code = frame.f_code
+    path = code.co_filename.replace(os.sep, '/').split('/')
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval and counts collapsed stacks ("a;b;c" -> samples)."""
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+# --- 剖析並寫出結果 ---
+def _rotate(directory, keep):
+    # 每次剖析的 .prof / .collapsed 共用同一個檔名前綴；刪除最舊的幾次
+    runs = collections.defaultdict(list)
+    for entry in os.scandir(directory):
+        if entry.name.endswith(('.prof', '.collapsed')):
+            runs[entry.name.rsplit('.', 1)[0]].append(entry)
+    ordered = sorted(runs.values(), key=lambda files: max(f.stat().st_mtime for f in files))
+    for files in ordered[:max(len(ordered) - keep, 0)]:
+        for f in files:
+            try:
+                os.remove(f.path)
+            except OSError:
+                pass
+
+
+def profile_call(name, func, *args, **kwargs):
+    """Runs func under cProfile and the stack sampler, writes both results to PROFILE_DIR and returns func's result."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError: # 已有其他剖析器在執行 (Python 3.12+ 同時只能有一個)，只保留取樣結果
+        profiler = None
+    sampler = StackSampler(threading.get_ident())
+    started = time.perf_counter()
+    try:
+        with sampler:
+            return func(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _write_profile(name, profiler, sampler, time.perf_counter() - started) # 寫檔失敗不影響回調結果
+
+
+def _write_profile(name, profiler, sampler, elapsed):
+    now = time.time()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f"{now % 1:.3f}"[1:]
+    prefix = f"{stamp}-{os.getpid()}-{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}"
+    try:
+        with _write_lock:
+            if not private_directory(PROFILE_DIR):
+                print(f"profile_call: {PROFILE_DIR} 不屬於目前使用者或其他使用者可存取，不寫入剖析結果")
+                return
+            base = os.path.join(PROFILE_DIR, prefix)
+            if profiler is not None:
+                profiler.dump_stats(base + '.prof')
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                f.write(sampler.collapsed())
+            _rotate(PROFILE_DIR, PROFILE_KEEP)
+        print(f"profile_call: {name} 耗時 {elapsed * 1000:.1f} ms，剖析結果寫入 {base}.prof / .collapsed")
+    except OSError as e:
+        print(f"profile_call: 無法寫入剖析結果: {e}")
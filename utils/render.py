@@ -0,0 +1,342 @@
+import base64
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from utils.cancellation import ComputationCancelled, cancel_requested, check_cancelled
+from utils.fonts import setup_matplotlib_fonts, warm_up_matplotlib
+from utils.image_cache import chart_key, image_cache, image_url
+from utils.singleflight import SingleFlight
+
+# --- 靜態圖表繪製行程池 ---
+# pyplot 的全域狀態不是執行緒安全的，且繪圖受 GIL 限制。靜態圖表改由預先暖機的工作行程繪製：
+# 回調只準備精簡的圖表規格 (spec) 與繪圖資料，大型欄位透過共享記憶體傳遞，工作行程回傳 PNG bytes。
+# 佇列有上限並設有逾時，吞吐量隨 CPU 核心數擴充。RENDER_WORKERS=0 時改在本行程內 (加鎖) 繪製。
+# 繪圖行程由 forkserver (不支援時為 spawn) 建立，不會從已有多個執行緒的 web 行程直接 fork；
+# 行程池在啟動時建立一次，只有在繪圖逾時 (終止卡住的行程) 或行程異常終止時才換新。
+# 逾時時新工作立即改送到新池，舊池等其他正在繪製的工作完成後才終止，不會連帶中斷同時進行的其他圖表。
+
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', min(4, os.cpu_count() or 1)))
+RENDER_TIMEOUT = float(os.environ.get('RENDER_TIMEOUT', 30)) # 單張圖表的等待上限 (秒)
+RENDER_QUEUE_SIZE = int(os.environ.get('RENDER_QUEUE_SIZE', max(RENDER_WORKERS, 1) * 4)) # 同時排隊的繪圖工作上限
+CANCEL_POLL_SECONDS = 0.1 # 等待繪圖結果時檢查請求是否已過時的間隔
+SHARED_MEMORY_MIN_BYTES = 1 << 20 # 資料超過 1 MB 時改用共享記憶體，較小的直接 pickle
+STATIC_DPI = 100
+RENDER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+RENDER_PRELOAD = ['utils.render', 'matplotlib', 'seaborn'] # forkserver 預先載入，新繪圖行程不必重新 import
+
+BLANK_IMAGE = "data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+
+
+def error_image(message):
+    """SVG placeholder with an error message, used when a static chart fails."""
+    return f"data:image/svg+xml;charset=utf-8,%3Csvg xmlns='http://www.w3.org/2000/svg' width='300' height='100'%3E%3Ctext x='50%25' y='50%25' dominant-baseline='middle' text-anchor='middle' font-size='10px' fill='red'%3E{message}%3C/text%3E%3C/svg%3E"
+
+
+# --- 共享記憶體資料框 ---
+def attach_shared_memory(name):
+    """Attaches to an existing block created (and unlinked) by the parent process."""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # 工作行程 (fork / forkserver / spawn) 與父行程共用同一個 resource tracker：這裡的註冊只是重複加入同一名稱，
+    # 不可再取消註冊，否則父行程 unlink 時 tracker 會因找不到名稱而報錯
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrames:
+    """Context manager turning {name: DataFrame} into picklable handles; large columns go to shared memory."""
+
+    def __init__(self, frames):
+        self.frames = frames or {}
+        self.blocks = []
+
+    def _share_array(self, values):
+        values = np.ascontiguousarray(values)
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self.blocks.append(shm)
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[...] = values
+        return ('shm', shm.name, values.dtype.str, values.shape)
+
+    def _share_frame(self, df):
+        if df.memory_usage(index=True, deep=False).sum() < SHARED_MEMORY_MIN_BYTES:
+            return ('frame', df)
+        columns = []
+        for col in df.columns:
+            series = df[col]
+            if (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_dtype(series)) \
+                    and not isinstance(series.dtype, pd.CategoricalDtype) and not pd.api.types.is_extension_array_dtype(series):
+                columns.append((col, 'array', self._share_array(series.to_numpy()), None))
+            else:
+                # 字串與類別欄位以整數編碼放入共享記憶體，類別值隨 handle 一起 pickle
+                codes, uniques = pd.factorize(series, sort=False)
+                columns.append((col, 'codes', self._share_array(codes), uniques))
+        return ('columns', columns, df.index)
+
+    def __enter__(self):
+        return {name: self._share_frame(df) for name, df in self.frames.items()}
+
+    def __exit__(self, *exc):
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+        return False
+
+
+def _load_array(handle):
+    _, name, dtype, shape = handle
+    shm = attach_shared_memory(name)
+    try:
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+def attach_frames(handles):
+    """Rebuilds the DataFrames described by SharedFrames handles (copies out of shared memory)."""
+    frames = {}
+    for name, handle in (handles or {}).items():
+        if handle[0] == 'frame':
+            frames[name] = handle[1]
+            continue
+        _, columns, index = handle
+        data = {}
+        for col, kind, array_handle, uniques in columns:
+            values = _load_array(array_handle)
+            if kind == 'codes':
+                values = pd.Series(uniques.take(values, allow_fill=True), index=index)
+            data[col] = values
+        frames[name] = pd.DataFrame(data, index=index)
+    return frames
+
+
+# --- 繪圖工作 (在工作行程中執行) ---
+def _init_render_worker():
+    """Pre-warms a worker (fonts registered once, seaborn imported, warm-up figure drawn)."""
+    warm_up_matplotlib()
+
+
+def render_png(draw, spec, frames):
+    """Creates the figure described by spec, calls draw(ax, spec, frames) and returns PNG bytes."""
+    setup_matplotlib_fonts() # 每個行程只實際設定一次
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=spec.get('figsize', (8, 5)), tight_layout=True)
+    try:
+        draw(ax, spec, frames)
+        buf = BytesIO()
+        fig.savefig(buf, format='png', dpi=spec.get('dpi', STATIC_DPI), bbox_inches=spec.get('bbox_inches'))
+        return buf.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def _render_task(draw, spec, handles):
+    return render_png(draw, spec, attach_frames(handles))
+
+
+def draw_message(ax, spec, frames):
+    """Red centred text on an empty figure (warnings such as too many categories)."""
+    ax.text(0.5, 0.5, spec['message'], ha='center', va='center', fontsize=12, color='red')
+    ax.axis('off')
+
+
+# --- 行程池 ---
+def _render_context():
+    context = multiprocessing.get_context(RENDER_START_METHOD)
+    if RENDER_START_METHOD == 'forkserver':
+        context.set_forkserver_preload(RENDER_PRELOAD)
+    return context
+
+
+def _terminate_workers(pool):
+    """Stops pool's worker processes, including ones still drawing (future.cancel() cannot stop those)."""
+    terminate = getattr(pool, 'terminate_workers', None) # Python 3.14+
+    if terminate is not None:
+        terminate()
+        return
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        if process.is_alive():
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class RenderFarm:
+    """Bounded, timed pool of pre-warmed matplotlib worker processes."""
+
+    def __init__(self, workers=RENDER_WORKERS, timeout=RENDER_TIMEOUT, queue_size=RENDER_QUEUE_SIZE):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._in_flight = {} # 行程池 -> 已送出且尚未取得結果的 future
+        self._local_lock = threading.Lock() # 本行程繪製時序列化 pyplot 存取
+
+    def start(self, wait=True):
+        """Creates the worker pool and starts its warm-up (called once at app startup, before serving requests).
+
+        With wait=False the warm-up continues in the background and the app can accept requests immediately;
+        in-process rendering (RENDER_WORKERS=0) then warms up on the first static chart instead.
+        """
+        if self.workers <= 0:
+            if wait:
+                warm_up_matplotlib() # 在本行程繪製時也先完成字體設定與暖機
+            return
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self._new_pool()
+            pool = self._pool
+        futures = [pool.submit(_init_render_worker) for _ in range(self.workers)]
+        if not wait:
+            print(f"RenderFarm: {self.workers} 個繪圖行程在背景暖機")
+            return
+        for future in futures:
+            future.result()
+        print(f"RenderFarm: {self.workers} 個繪圖行程已就緒")
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=_render_context(), initializer=_init_render_worker)
+
+    def _get_pool(self):
+        if self.workers <= 0:
+            return None
+        with self._pool_lock:
+            if self._pool is None:
+                # 未呼叫 start() (例如單獨使用本模組) 時才在此建立；forkserver 不會複製呼叫端執行緒的狀態
+                self._pool = self._new_pool()
+            return self._pool
+
+    def _replace_pool(self, old, stuck=None):
+        # 換成新的行程池，之後的工作都送到新池
+        with self._pool_lock:
+            if self._pool is old:
+                self._pool = self._new_pool()
+            others = [future for future in self._in_flight.get(old, ()) if future is not stuck]
+        if stuck is None: # 行程池已損壞，其中的工作會收到 BrokenProcessPool 並改送到新池
+            old.shutdown(wait=False, cancel_futures=True)
+            return
+        # 只終止卡住的行程也會讓整個 ProcessPoolExecutor 損壞，因此在背景等舊池中其他工作完成後才終止所有行程
+        threading.Thread(target=self._retire_pool, args=(old, others), daemon=True).start()
+
+    def _retire_pool(self, pool, futures):
+        for future in futures:
+            future.cancel() # 尚未開始的工作撤回，由呼叫端改送到新池
+        wait(futures, timeout=self.timeout) # 超過此時間它們的請求也已逾時
+        _terminate_workers(pool)
+
+    def _track(self, pool, future, add):
+        with self._pool_lock:
+            futures = self._in_flight.setdefault(pool, set())
+            if add:
+                futures.add(future)
+            else:
+                futures.discard(future)
+                if not futures:
+                    del self._in_flight[pool]
+
+    def _render_local(self, draw, spec, frames):
+        with self._local_lock:
+            check_cancelled() # 等待鎖的期間請求可能已過時
+            return render_png(draw, spec, frames)
+
+    def _wait(self, pool, future, deadline):
+        # 排隊中的工作在請求過時後撤回；已開始繪製的讓它完成，結果仍會寫入圖片快取
+        while True:
+            try:
+                return future.result(timeout=max(min(CANCEL_POLL_SECONDS, deadline - time.monotonic()), 0))
+            except FutureTimeoutError:
+                if cancel_requested() and future.cancel():
+                    raise ComputationCancelled()
+                if time.monotonic() >= deadline:
+                    if not future.cancel():
+                        print(f"RenderFarm: 繪圖逾時 ({self.timeout:g} 秒)，改用新的行程池，舊池的其他工作完成後終止")
+                        self._replace_pool(pool, stuck=future)
+                    raise TimeoutError(f"靜態圖表繪製逾時 ({self.timeout:g} 秒)")
+
+    def render(self, draw, spec, frames=None):
+        """PNG bytes of draw(ax, spec, frames); draw must be a module-level (picklable) function.
+
+        RENDER_TIMEOUT bounds the whole call: waiting for a queue slot plus the render itself.
+        """
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeError("靜態圖表繪製佇列已滿，請稍後再試")
+        try:
+            check_cancelled()
+            pool = self._get_pool()
+            if pool is None:
+                return self._render_local(draw, spec, frames or {})
+            with SharedFrames(frames) as handles:
+                for attempt in range(2):
+                    try:
+                        future = pool.submit(_render_task, draw, spec, handles)
+                    except RuntimeError: # 其他請求剛換掉這個行程池 (已關閉或已損壞)
+                        pool = self._get_pool()
+                        future = pool.submit(_render_task, draw, spec, handles)
+                    self._track(pool, future, True)
+                    try:
+                        return self._wait(pool, future, deadline)
+                    except CancelledError: # 舊行程池退役時撤回了尚未開始的工作
+                        pass
+                    except BrokenProcessPool:
+                        self._replace_pool(pool)
+                    finally:
+                        self._track(pool, future, False)
+                    pool = self._get_pool()
+                    if attempt == 0 and time.monotonic() < deadline:
+                        print("RenderFarm: 繪圖行程池已更換，改送到新的行程池")
+                        continue
+                print("RenderFarm: 繪圖行程池再次更換，改在本行程繪製")
+                return self._render_local(draw, spec, frames or {})
+        finally:
+            self._slots.release()
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+render_farm = RenderFarm()
+_chart_flights = SingleFlight() # 同一張圖表同時被多個請求要求時只繪製一次
+
+
+def message_chart(message, figsize=(8, 2)):
+    """(draw, spec, frames) of a warning image with a centred red message."""
+    return draw_message, {'message': message, 'figsize': figsize}, None
+
+
+def cached_static_chart(chart, data_version, params, build):
+    """URL of a static chart from the disk image cache; on a miss build() returns (draw, spec, frames) to render.
+
+    params must contain every input that affects the image (selected columns, options, ...).
+    """
+    key = chart_key(chart, data_version, dict(params, dpi=STATIC_DPI))
+    if not image_cache.usable():
+        # 快取目錄不可用：直接繪製並內嵌為 data URL
+        png = _chart_flights.do(key, lambda: _render_png(build))
+        return 'data:image/png;base64,' + base64.b64encode(png).decode('ascii')
+    if image_cache.get(key) is None:
+        _chart_flights.do(key, lambda: _render_chart(key, build))
+    return image_url(key)
+
+
+def _render_png(build):
+    check_cancelled()
+    draw, spec, frames = build()
+    return render_farm.render(draw, spec, frames)
+
+
+def _render_chart(key, build):
+    if image_cache.get(key) is None: # 等待期間其他請求可能已繪製完成
+        image_cache.put(key, _render_png(build))
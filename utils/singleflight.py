@@ -0,0 +1,78 @@
+import threading
+import weakref
+from concurrent.futures import Future
+
+from utils.cancellation import ComputationCancelled, SharedCancelToken, check_cancelled, current_token, use_token
+
+# --- 相同計算的併發去重 (single-flight) ---
+# 多人同時開啟同一份共享資料集，或使用者連點兩下時，相同的昂貴計算 (熱圖 corr()、分組彙總、靜態圖表繪製等)
+# 會在多個執行緒中同時執行。SingleFlight 以計算輸入的指紋 (快取鍵) 為鍵：第一個呼叫者實際計算，
+# 其餘同鍵的呼叫者等待並共用它的結果 (或例外)，負載尖峰時 CPU 用量不會隨重複請求倍增。
+# 去重範圍為單一工作行程；跨行程已由磁碟資料集儲存與圖片快取共用結果。
+# 共用的計算只有在所有等待者的請求都已過時 (utils/cancellation.py) 時才會取消；
+# 第一個呼叫者被取消而仍有人需要結果時，由仍在等待的呼叫者重新計算。
+
+_all_flights = weakref.WeakSet()
+_stats_lock = threading.Lock()
+_stats = {'leaders': 0, 'shared': 0}
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers with the same key wait for it and share its result."""
+
+    def __init__(self):
+        self._calls = {} # key -> (Future, 計算中的執行緒, SharedCancelToken)
+        self._lock = threading.Lock()
+        _all_flights.add(self)
+
+    def do(self, key, func):
+        """Result of func() for key, computed once for all callers that arrive while it is running."""
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = (Future(), threading.get_ident(), SharedCancelToken(current_token()))
+            future, owner, token = call
+            if not leader and owner == threading.get_ident():
+                # 等待自己的計算會永遠卡住：呼叫端的快取鍵重複了，應修正鍵而不是在這裡重算
+                raise RuntimeError(f"SingleFlight: 計算 {key!r} 時又要求同一個鍵")
+            if not leader:
+                token.add(current_token())
+            with _stats_lock:
+                _stats['leaders' if leader else 'shared'] += 1
+            if leader:
+                return self._run(key, func, future, token)
+            try:
+                return future.result()
+            except ComputationCancelled:
+                check_cancelled() # 自己的請求也已過時就結束，否則重新計算
+
+    def _run(self, key, func, future, token):
+        try:
+            with use_token(token):
+                result = func()
+        except BaseException as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+
+    def _release(self, key):
+        # 先移除鍵再喚醒等待者：重新計算的等待者才會成為新的第一個呼叫者，而不是又等到這個已結束的計算
+        with self._lock:
+            del self._calls[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def flight_stats():
+    """{'leaders': computations run, 'shared': callers that reused a running computation, 'in_flight': running now}"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['in_flight'] = sum(len(flight) for flight in list(_all_flights))
+    return stats
@@ -0,0 +1,28 @@
+import sys
+import time
+
+# --- 啟動匯入時間報告 ---
+# 頁面模組只匯入 dash / pandas / numpy 等輕量依賴；matplotlib、seaborn、scipy 等重量級函式庫延遲到
+# 第一次繪製靜態圖表時 (在繪圖行程中) 才載入。啟動時回報匯入耗時與已載入的重量級函式庫，方便發現回歸。
+# 逐模組的詳細時間可用 `python -X importtime app.py` 取得。
+
+HEAVY_MODULES = ('matplotlib', 'matplotlib.pyplot', 'seaborn', 'scipy', 'plotly.express', 'statsmodels')
+
+
+def loaded_heavy_modules():
+    """Heavy libraries from HEAVY_MODULES that are already imported in this process."""
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+
+def import_report(started, stages=None):
+    """One-line report of the time since started (time.perf_counter()) and of heavy libraries already loaded.
+
+    stages is an optional {label: seconds} breakdown (e.g. page imports, callback registration).
+    """
+    elapsed = time.perf_counter() - started
+    loaded = loaded_heavy_modules()
+    report = f"啟動匯入耗時 {elapsed:.2f} 秒"
+    if stages:
+        report += " (" + "，".join(f"{label} {seconds:.2f} 秒" for label, seconds in stages.items()) + ")"
+    report += f"；已載入的重量級函式庫：{', '.join(loaded) if loaded else '無'}"
+    return report
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+
+from utils.cache import LRUCache
+
+# --- 趨勢線引擎 ---
+# 以充分統計量 (Σx, Σy, Σxy, Σx², Σy²) 一次分組計算 OLS，取代 px.scatter(trendline="ols")
+# 每次繪圖都呼叫 statsmodels 的做法。LOWESS 與移動平均則在分箱後的資料上計算。
+
+TRENDLINE_OPTIONS = [
+    {'label': 'OLS 線性回歸', 'value': 'ols'},
+    {'label': 'LOWESS 平滑', 'value': 'lowess'},
+    {'label': '移動平均', 'value': 'rolling'},
+    {'label': '不顯示', 'value': 'none'},
+]
+
+DEFAULT_TRENDLINE_BINS = 100 # LOWESS / 移動平均使用的分箱數
+LOWESS_FRAC = 0.3 # LOWESS 每個局部回歸使用的資料比例
+ROLLING_WINDOW = 5 # 移動平均的視窗大小 (以分箱為單位)
+
+_trendline_cache = LRUCache(maxsize=64)
+
+
+def numeric_pair(df, x_col, y_col):
+    """True when both columns are numeric (not bool), i.e. a regression line can be fitted."""
+    return all(pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+               for col in (x_col, y_col))
+
+
+def _prepare_xy(df, x_col, y_col, group_col):
+    """Returns float x/y arrays, group codes and group labels with invalid rows removed."""
+    if not numeric_pair(df, x_col, y_col):
+        return None
+    x = df[x_col].to_numpy(dtype=float, na_value=np.nan)
+    y = df[y_col].to_numpy(dtype=float, na_value=np.nan)
+    if group_col:
+        codes, uniques = pd.factorize(df[group_col], sort=False)
+        labels = [str(u) for u in uniques]
+    else:
+        codes = np.zeros(len(df), dtype=np.intp)
+        labels = [None]
+    valid = np.isfinite(x) & np.isfinite(y) & (codes >= 0)
+    return x[valid], y[valid], codes[valid], labels
+
+
+def _group_extent(x, codes, k):
+    x_min = np.full(k, np.inf)
+    x_max = np.full(k, -np.inf)
+    np.minimum.at(x_min, codes, x)
+    np.maximum.at(x_max, codes, x)
+    return x_min, x_max
+
+
+def ols_by_group(x, y, codes, k):
+    """Closed-form OLS per group from vectorized sufficient statistics (one bincount pass each)."""
+    # 先以整體平均置中，避免大數值時平方和相減的精度流失
+    x0 = x.mean() if len(x) else 0.0
+    y0 = y.mean() if len(y) else 0.0
+    xc = x - x0
+    yc = y - y0
+    n = np.bincount(codes, minlength=k).astype(float)
+    sx = np.bincount(codes, weights=xc, minlength=k)
+    sy = np.bincount(codes, weights=yc, minlength=k)
+    sxy = np.bincount(codes, weights=xc * yc, minlength=k)
+    sxx = np.bincount(codes, weights=xc * xc, minlength=k)
+    syy = np.bincount(codes, weights=yc * yc, minlength=k)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sxx_c = sxx - sx * sx / n
+        sxy_c = sxy - sx * sy / n
+        syy_c = syy - sy * sy / n
+        slope = sxy_c / sxx_c
+        intercept_c = (sy - slope * sx) / n
+        r2 = np.where(syy_c > 0, sxy_c * sxy_c / (sxx_c * syy_c), 1.0)
+    intercept = intercept_c + y0 - slope * x0
+    return {'n': n.astype(int), 'slope': slope, 'intercept': intercept, 'r2': r2}
+
+
+def binned_means(x, y, codes, k, n_bins=DEFAULT_TRENDLINE_BINS):
+    """Mean x / mean y / counts per (group, bin) on a shared uniform x grid, shape (k, n_bins)."""
+    lo, hi = (x.min(), x.max()) if len(x) else (0.0, 1.0)
+    span = hi - lo if hi > lo else 1.0
+    bins = np.minimum(((x - lo) / span * n_bins).astype(np.intp), n_bins - 1)
+    flat = codes * n_bins + bins
+    size = k * n_bins
+    counts = np.bincount(flat, minlength=size).reshape(k, n_bins)
+    sum_x = np.bincount(flat, weights=x, minlength=size).reshape(k, n_bins)
+    sum_y = np.bincount(flat, weights=y, minlength=size).reshape(k, n_bins)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return sum_x / counts, sum_y / counts, counts
+
+
+def _lowess(bx, by, weights, frac=LOWESS_FRAC):
+    """Weighted local-linear LOWESS (tricube kernel) evaluated at the bin centres."""
+    m = len(bx)
+    if m < 3:
+        return by
+    span = max(int(np.ceil(frac * m)), 2)
+    dist = np.abs(bx[:, None] - bx[None, :]) # (m, m)，分箱後 m 很小
+    h = np.partition(dist, span - 1, axis=1)[:, span - 1]
+    h = np.where(h > 0, h, 1.0)
+    u = np.clip(dist / h[:, None], 0.0, 1.0)
+    w = (1 - u ** 3) ** 3 * weights[None, :]
+    sw = w.sum(axis=1)
+    mx = (w * bx).sum(axis=1) / sw
+    my = (w * by).sum(axis=1) / sw
+    dx = bx[None, :] - mx[:, None]
+    sxx = (w * dx * dx).sum(axis=1)
+    sxy = (w * dx * (by[None, :] - my[:, None])).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(sxx > 0, sxy / sxx, 0.0)
+    return my + slope * (bx - mx)
+
+
+def _rolling(by, weights, window=ROLLING_WINDOW):
+    """Count-weighted centered rolling mean over consecutive non-empty bins."""
+    kernel = np.ones(window)
+    num = np.convolve(by * weights, kernel, mode='same')
+    den = np.convolve(weights, kernel, mode='same')
+    return num / den
+
+
+def fit_trendlines(df, x_col, y_col, group_col=None, method='ols', n_bins=DEFAULT_TRENDLINE_BINS):
+    """Fits one trendline per group. Returns a list of dicts with group, x, y and hover text."""
+    if method not in ('ols', 'lowess', 'rolling'):
+        return []
+    prepared = _prepare_xy(df, x_col, y_col, group_col)
+    if prepared is None:
+        print(f"fit_trendlines: '{x_col}' 或 '{y_col}' 不是數值欄位，略過趨勢線。")
+        return []
+    x, y, codes, labels = prepared
+    k = len(labels)
+    if len(x) == 0:
+        return []
+
+    fits = []
+    if method == 'ols':
+        stats = ols_by_group(x, y, codes, k)
+        x_min, x_max = _group_extent(x, codes, k)
+        for i, label in enumerate(labels):
+            if stats['n'][i] < 2 or not np.isfinite(stats['slope'][i]):
+                continue
+            slope, intercept = stats['slope'][i], stats['intercept'][i]
+            line_x = [float(x_min[i]), float(x_max[i])]
+            fits.append({
+                'group': label,
+                'x': line_x,
+                'y': [intercept + slope * v for v in line_x],
+                'text': (f"OLS: {y_col} = {slope:.4g} * {x_col} + {intercept:.4g}"
+                         f"<br>R² = {stats['r2'][i]:.4f} (n = {stats['n'][i]})"),
+            })
+        return fits
+
+    mean_x, mean_y, counts = binned_means(x, y, codes, k, n_bins)
+    for i, label in enumerate(labels):
+        filled = counts[i] > 0
+        if filled.sum() < 2:
+            continue
+        bx, by, w = mean_x[i][filled], mean_y[i][filled], counts[i][filled].astype(float)
+        if method == 'lowess':
+            line_y = _lowess(bx, by, w)
+            text = f"LOWESS (frac = {LOWESS_FRAC}, {len(bx)} 個分箱)"
+        else:
+            line_y = _rolling(by, w)
+            text = f"移動平均 (視窗 = {ROLLING_WINDOW} 個分箱)"
+        fits.append({'group': label, 'x': bx.tolist(), 'y': line_y.tolist(), 'text': text})
+    return fits
+
+
+def get_trendlines(data_version, df, x_col, y_col, group_col=None, method='ols'):
+    """Cached fit_trendlines keyed by (dataset version, x, y, group, method)."""
+    key = (data_version, x_col, y_col, group_col, method)
+    return _trendline_cache.get_or_compute(
+        key, lambda: fit_trendlines(df, x_col, y_col, group_col, method))
+
+
+def trendline_traces(fits, color_map=None):
+    """Builds lightweight line traces (plain dicts) for the fitted trendlines."""
+    color_map = color_map or {}
+    traces = []
+    for fit in fits:
+        trace = {
+            'type': 'scatter',
+            'mode': 'lines',
+            'x': fit['x'],
+            'y': fit['y'],
+            'name': f"{fit['group']} 趨勢線" if fit['group'] is not None else "趨勢線",
+            'showlegend': False,
+            'hovertemplate': fit['text'] + "<extra></extra>",
+        }
+        if fit['group'] is not None:
+            trace['legendgroup'] = fit['group']
+        color = color_map.get(fit['group'])
+        if color:
+            trace['line'] = {'color': color}
+        traces.append(trace)
+    return traces